@@ -0,0 +1,5 @@
+"""a benchmark suite for marcextraction that runs entirely on the local machine
+
+Use corpus to write synthetic MARC records, servers to stand in for the Solr select and OLE SRU
+endpoints, and run to time the searchers and finders against them.
+"""
@@ -0,0 +1,164 @@
+"""a generator for synthetic MARC corpora of any size
+"""
+
+from os import makedirs
+from os.path import join
+from random import Random
+from xml.sax.saxutils import escape
+
+FIELD_TERMINATOR = b'\x1e'
+RECORD_TERMINATOR = b'\x1d'
+SUBFIELD_DELIMITER = b'\x1f'
+
+WORDS = ["banana", "river", "history", "map", "chicago", "atlas", "survey", "letters", "science", "journal",
+         "poetry", "census", "railroad", "harbor", "prairie", "botany", "war", "music", "lake", "archive",
+         "geology", "farm", "city", "school", "church", "market", "bridge", "island", "mountain", "coast"]
+
+DEFAULT_FIELD_MIX = {"100": 1, "245": 1, "260": 1, "650": 3}
+
+def _words(rng, low, high):
+    """a private function to make a run of random words
+
+    Args:
+        rng (random.Random): the random number generator to draw from
+        low (int): the fewest words
+        high (int): the most words
+
+    Returns:
+        str. the words separated by spaces
+    """
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def generate_fields(control_number, rng, field_mix=None):
+    """a function to make the fields of one synthetic record
+
+    Args:
+        control_number (str): the value of the 001 field
+        rng (random.Random): the random number generator to draw from
+
+    KWArgs:
+        field_mix (dict): how many times to repeat each of 100, 245, 260 and 650. Default is DEFAULT_FIELD_MIX.
+
+    Returns:
+        list. (tag, indicators, subfields) tuples. Control fields have no indicators and their
+            subfields are the bare value; data fields have a list of (code, value) subfields
+    """
+    field_mix = DEFAULT_FIELD_MIX if field_mix is None else field_mix
+    fields = [("001", None, control_number)]
+    for _ in range(field_mix.get("100", 0)):
+        fields.append(("100", "1 ", [("a", "{}, {}.".format(_words(rng, 1, 1).title(), _words(rng, 1, 1).title()))]))
+    for _ in range(field_mix.get("245", 0)):
+        fields.append(("245", "10", [("a", _words(rng, 2, 6) + " :"), ("b", _words(rng, 2, 8) + " /"),
+                                     ("c", _words(rng, 1, 3) + ".")]))
+    for _ in range(field_mix.get("260", 0)):
+        fields.append(("260", "  ", [("a", _words(rng, 1, 2).title() + " :"), ("b", _words(rng, 1, 3) + ","),
+                                     ("c", str(rng.randint(1800, 2020)) + ".")]))
+    for _ in range(field_mix.get("650", 0)):
+        fields.append(("650", " 0", [("a", _words(rng, 1, 3).capitalize()), ("x", _words(rng, 1, 2))]))
+    return fields
+
+def to_marc(fields):
+    """a function to encode the fields of a record as binary MARC21
+
+    Args:
+        fields (list): the fields of a record as returned by generate_fields
+
+    Returns:
+        bytes. the complete record, ending with a record terminator
+    """
+    directory = b''
+    data = b''
+    for tag, indicators, subfields in fields:
+        if indicators is None:
+            body = subfields.encode('utf-8') + FIELD_TERMINATOR
+        else:
+            body = indicators.encode('utf-8') + b''.join(SUBFIELD_DELIMITER + code.encode('utf-8') +
+                                                          value.encode('utf-8') for code, value in subfields)
+            body += FIELD_TERMINATOR
+        directory += "{}{:04d}{:05d}".format(tag, len(body), len(data)).encode('ascii')
+        data += body
+    directory += FIELD_TERMINATOR
+    base_address = 24 + len(directory)
+    length = base_address + len(data) + 1
+    leader = "{:05d}nam a22{:05d} a 4500".format(length, base_address).encode('ascii')
+    return leader + directory + data + RECORD_TERMINATOR
+
+def to_marcxml(fields):
+    """a function to encode the fields of a record as a MARCXML record element
+
+    Args:
+        fields (list): the fields of a record as returned by generate_fields
+
+    Returns:
+        str. a record element in the MARC21 slim namespace
+    """
+    parts = ['<record xmlns="http://www.loc.gov/MARC21/slim"><leader>00000nam a2200000 a 4500</leader>']
+    for tag, indicators, subfields in fields:
+        if indicators is None:
+            parts.append('<controlfield tag="{}">{}</controlfield>'.format(tag, escape(subfields)))
+        else:
+            parts.append('<datafield tag="{}" ind1="{}" ind2="{}">'.format(tag, indicators[0], indicators[1]))
+            for code, value in subfields:
+                parts.append('<subfield code="{}">{}</subfield>'.format(code, escape(value)))
+            parts.append('</datafield>')
+    parts.append('</record>')
+    return ''.join(parts)
+
+def generate_corpus(count, seed=0, field_mix=None, start=1):
+    """a generator function to make a run of synthetic records
+
+    The same count, seed and field_mix always give the same records.
+
+    Args:
+        count (int): how many records to make
+
+    KWArgs:
+        seed (int): the seed for the random number generator. Default is 0.
+        field_mix (dict): how many times to repeat each of 100, 245, 260 and 650. Default is DEFAULT_FIELD_MIX.
+        start (int): the first control number. Default is 1.
+
+    Returns:
+        generator. an iterable containing (control number, fields) tuples
+    """
+    rng = Random(seed)
+    for number in range(start, start + count):
+        control_number = str(number)
+        yield (control_number, generate_fields(control_number, rng, field_mix=field_mix))
+
+def write_corpus(path, count, layout="files", records_per_file=100, seed=0, field_mix=None):
+    """a function to write a synthetic corpus to disk
+
+    Args:
+        path (str): a directory for the "files" layout or a file for the "single" layout
+        count (int): how many records to write
+
+    KWArgs:
+        layout (str): "files" for many small .mrc files in a directory, "single" for one large file. Default is files.
+        records_per_file (int): how many records go into each file of the "files" layout. Default is 100.
+        seed (int): the seed for the random number generator. Default is 0.
+        field_mix (dict): how many times to repeat each of 100, 245, 260 and 650. Default is DEFAULT_FIELD_MIX.
+
+    Returns:
+        list. the control numbers that were written, in order
+    """
+    control_numbers = []
+    if layout == "single":
+        with open(path, "wb") as output:
+            for control_number, fields in generate_corpus(count, seed=seed, field_mix=field_mix):
+                output.write(to_marc(fields))
+                control_numbers.append(control_number)
+    elif layout == "files":
+        makedirs(path, exist_ok=True)
+        output = None
+        for n, (control_number, fields) in enumerate(generate_corpus(count, seed=seed, field_mix=field_mix)):
+            if n % records_per_file == 0:
+                if output is not None:
+                    output.close()
+                output = open(join(path, "{:06d}.mrc".format(n // records_per_file)), "wb")
+            output.write(to_marc(fields))
+            control_numbers.append(control_number)
+        if output is not None:
+            output.close()
+    else:
+        raise ValueError("invalid layout '{}'".format(layout))
+    return control_numbers
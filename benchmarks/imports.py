@@ -0,0 +1,104 @@
+"""time how long it takes to import marcextraction in a fresh interpreter
+
+Run from the root of the repository:
+
+    python -m benchmarks.imports --repeat 10 --output imports.json
+
+Each statement is run in new Python processes, so nothing is already cached in sys.modules.
+Alongside the timings, the report lists which heavy dependencies each statement pulled in.
+The exit status is 1 if any statement imported a dependency it is not supposed to need.
+"""
+
+from argparse import ArgumentParser
+from json import dump, loads
+from statistics import median
+from subprocess import check_output
+from sys import executable, stdout
+
+HEAVY_MODULES = ("lxml", "numpy", "pymarc", "pysolr", "requests")
+
+# each statement and the heavy modules it must not import
+STATEMENTS = [
+    ("import marcextraction", HEAVY_MODULES),
+    ("import marcextraction.utils", HEAVY_MODULES),
+    ("import marcextraction.interfaces", HEAVY_MODULES),
+    ("from marcextraction import OnDiskSearcher", ("lxml", "numpy", "pysolr", "requests")),
+    ("from marcextraction import SolrIndexSearcher", ("lxml", "numpy", "pymarc")),
+    ("from marcextraction import OLEBatchRecordFinder", ("numpy", "pymarc", "pysolr")),
+    ("from marcextraction import ColumnarStore", ("lxml", "numpy", "pysolr", "requests")),
+]
+
+PROBE = """
+from json import dumps
+from sys import modules
+from time import perf_counter
+started = perf_counter()
+{statement}
+seconds = perf_counter() - started
+print(dumps({{"seconds": seconds, "loaded": sorted(name for name in {heavy!r} if name in modules)}}))
+"""
+
+def measure_import(statement, repeat=5):
+    """a function to time a statement in fresh interpreters
+
+    Args:
+        statement (str): Python source to run. Ex. 'from marcextraction import OnDiskSearcher'
+
+    KWArgs:
+        repeat (int): how many fresh interpreters to run it in. Default is 5.
+
+    Returns:
+        dict. the statement, the best and median milliseconds and the heavy modules it imported
+    """
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        result = loads(check_output([executable, "-c", PROBE.format(statement=statement, heavy=HEAVY_MODULES)]))
+        timings.append(1000 * result["seconds"])
+        loaded = result["loaded"]
+    return {"statement": statement, "best_ms": min(timings), "median_ms": median(timings), "loaded": loaded}
+
+def run_benchmarks(repeat=5):
+    """a function to time every statement in STATEMENTS
+
+    KWArgs:
+        repeat (int): how many fresh interpreters to run each statement in. Default is 5.
+
+    Returns:
+        dict. the results and a list of the statements that imported a module they should not have
+    """
+    results = []
+    regressions = []
+    for statement, forbidden in STATEMENTS:
+        result = measure_import(statement, repeat=repeat)
+        result["unexpected"] = [name for name in result["loaded"] if name in forbidden]
+        if result["unexpected"]:
+            regressions.append(statement)
+        results.append(result)
+    return {"results": results, "regressions": regressions}
+
+def main(arguments=None):
+    """a function to run the import benchmark from the command line
+
+    Args:
+        arguments (list): the command-line arguments. Default is sys.argv
+
+    Returns:
+        int. 1 if a statement imported a module it should not have, otherwise 0
+    """
+    parser = ArgumentParser(prog="python -m benchmarks.imports",
+                            description="time importing marcextraction in fresh interpreters")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per statement. Default is 5")
+    parser.add_argument("--output", default="-", help="the file to write the JSON results to. Default is stdout")
+    options = parser.parse_args(arguments)
+    report = run_benchmarks(repeat=options.repeat)
+    if options.output == "-":
+        dump(report, stdout, indent=2)
+        stdout.write("\n")
+    else:
+        with open(options.output, "w") as output:
+            dump(report, output, indent=2)
+    return 1 if report["regressions"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,329 @@
+"""time the searchers and finders against a synthetic corpus and local stand-in servers
+
+Run from the root of the repository:
+
+    python -m benchmarks.run --records 10000 --latency 0.005 --output results.json
+
+Every benchmark reports records/sec, latency percentiles in milliseconds and the peak Python
+memory allocated while it ran, as JSON. Tracing allocations slows Python down many times over,
+so the timed runs are not traced; peak memory comes from a separate, untimed run of the same work.
+"""
+
+from argparse import ArgumentParser
+from json import dump
+from os.path import join
+from platform import platform, python_implementation, python_version
+from random import Random
+from sys import stdout
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import clear_traces, get_traced_memory, is_tracing, start, stop
+from urllib.parse import urlparse
+
+from marcextraction.instrumentation import percentile
+from marcextraction.interfaces import OLERecordFinder, OnDiskSearcher, SolrIndexSearcher
+from marcextraction.utils import create_http_session
+
+from .corpus import DEFAULT_FIELD_MIX, WORDS, write_corpus
+from .servers import SRUStandIn, SolrStandIn
+
+class Measurement:
+    """a class to time a run of operations and, separately, the peak memory allocated by them
+
+    The timed run is not traced, so tracemalloc does not skew the throughput or latencies.
+    measure_memory runs the work again under tracemalloc, untimed.
+
+    Useage:
+        with Measurement("ondisk_search") as measurement:
+            for query in queries:
+                with measurement.operation():
+                    measurement.records += len(searcher.search(*query))
+        measurement.measure_memory(lambda: [searcher.search(*query) for query in queries])
+        measurement.as_dict()
+    """
+    def __init__(self, name):
+        self.name = name
+        self.records = 0
+        self.latencies = []
+        self.seconds = 0.0
+        self.peak_memory = 0
+        self._started = None
+
+    def __enter__(self):
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = perf_counter() - self._started
+
+    def measure_memory(self, work):
+        """a method to find the peak Python memory allocated by a piece of work
+
+        Args:
+            work (callable): runs the work once when called with no arguments
+        """
+        tracing = is_tracing()
+        if tracing:
+            clear_traces()
+        else:
+            start()
+        try:
+            work()
+            self.peak_memory = get_traced_memory()[1]
+        finally:
+            if not tracing:
+                stop()
+
+    def operation(self):
+        """a method to time a single operation, for the latency percentiles
+
+        Returns:
+            context manager. time is recorded when the block exits
+        """
+        return _Operation(self.latencies)
+
+    def as_dict(self):
+        """a method to summarize the measurement
+
+        Returns:
+            dict. the name, counts, throughput, latency percentiles and peak memory
+        """
+        ordered = sorted(self.latencies)
+        return {
+            "name": self.name,
+            "operations": len(self.latencies),
+            "records": self.records,
+            "seconds": self.seconds,
+            "records_per_second": self.records / self.seconds if self.seconds else 0.0,
+            "latency_ms": {
+                "mean": 1000 * sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+                "p50": 1000 * percentile(ordered, 0.50),
+                "p90": 1000 * percentile(ordered, 0.90),
+                "p99": 1000 * percentile(ordered, 0.99),
+                "max": 1000 * max(self.latencies) if self.latencies else 0.0,
+            },
+            "peak_memory_bytes": self.peak_memory,
+        }
+
+class _Operation:
+    """a private class to time one operation into a list of latencies
+    """
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self._started = None
+
+    def __enter__(self):
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.latencies.append(perf_counter() - self._started)
+
+def build_queries(count, seed=0):
+    """a function to make a reproducible list of searches over the synthetic vocabulary
+
+    Args:
+        count (int): how many queries to make
+
+    KWArgs:
+        seed (int): the seed for the random number generator. Default is 0.
+
+    Returns:
+        list. (query term, field, subfields) tuples
+    """
+    rng = Random(seed)
+    targets = [("245", ["a"]), ("245", ["a", "b"]), ("650", ["a"]), ("260", ["b"])]
+    return [(rng.choice(WORDS),) + rng.choice(targets) for _ in range(count)]
+
+def bench_ondisk_load(location, repeat=3, **kwargs):
+    """a function to time loading a corpus into an OnDiskSearcher
+
+    Args:
+        location (str): the directory or file the corpus was written to
+
+    KWArgs:
+        repeat (int): how many times to load the corpus. Default is 3.
+        kwargs: passed on to OnDiskSearcher. Ex. index=True
+
+    Returns:
+        tuple. the summary of the measurement and the last searcher that was loaded
+    """
+    name = "ondisk_load" + "".join("_{}".format(key) for key, value in sorted(kwargs.items()) if value)
+    searcher = None
+    with Measurement(name) as measurement:
+        for _ in range(repeat):
+            with measurement.operation():
+                searcher = OnDiskSearcher(location=location, **kwargs)
+            measurement.records += searcher.total
+    measurement.measure_memory(lambda: OnDiskSearcher(location=location, **kwargs))
+    return (measurement.as_dict(), searcher)
+
+def bench_ondisk_search(searcher, queries, name="ondisk_search"):
+    """a function to time searches against a loaded OnDiskSearcher
+
+    Args:
+        searcher (OnDiskSearcher): a loaded searcher
+        queries (list): (query term, field, subfields) tuples
+
+    KWArgs:
+        name (str): the name to report the measurement under. Default is ondisk_search.
+
+    Returns:
+        dict. the summary of the measurement; records counts the matches found
+    """
+    with Measurement(name) as measurement:
+        for query in queries:
+            with measurement.operation():
+                found = list(searcher.search(*query))
+            measurement.records += len(found)
+    measurement.measure_memory(lambda: [list(searcher.search(*query)) for query in queries])
+    return measurement.as_dict()
+
+def bench_solr_search(index_url, queries, rows=1000):
+    """a function to time SolrIndexSearcher.search against a Solr select endpoint
+
+    Args:
+        index_url (str): the URL of the index
+        queries (list): (query term, field, subfields) tuples
+
+    KWArgs:
+        rows (int): the rows to ask for with each search. Default is 1000.
+
+    Returns:
+        dict. the summary of the measurement; records counts the control numbers returned
+    """
+    searcher = SolrIndexSearcher(index_url, "ole", session=create_http_session())
+    with Measurement("solr_search") as measurement:
+        for query in queries:
+            with measurement.operation():
+                found = searcher.search(*query, rows=rows)
+            measurement.records += len(found)
+    measurement.measure_memory(lambda: [searcher.search(*query, rows=rows) for query in queries])
+    searcher.session.close()
+    return measurement.as_dict()
+
+def bench_ole_finder(sru_url, bibnumbers):
+    """a function to time OLERecordFinder fetching one record per request
+
+    Args:
+        sru_url (str): the URL of the SRU endpoint
+        bibnumbers (list): the bibnumbers to fetch
+
+    Returns:
+        dict. the summary of the measurement; records counts the records that were found
+    """
+    url = urlparse(sru_url)
+    session = create_http_session()
+    with Measurement("ole_record_finder") as measurement:
+        for bibnumber in bibnumbers:
+            with measurement.operation():
+                found, _ = OLERecordFinder(bibnumber, url.netloc, url.scheme, url.path,
+                                           session=session).get_record()
+            measurement.records += 1 if found else 0
+    measurement.measure_memory(lambda: [OLERecordFinder(bibnumber, url.netloc, url.scheme, url.path,
+                                                        session=session).get_record() for bibnumber in bibnumbers])
+    session.close()
+    return measurement.as_dict()
+
+def run_benchmarks(records=5000, layout="files", records_per_file=100, queries=50, fetches=200, rows=1000,
+                   latency=0.0, jitter=0.0, seed=0, only=None):
+    """a function to run the whole suite
+
+    KWArgs:
+        records (int): the size of the synthetic corpus. Default is 5000.
+        layout (str): "files" for many small files or "single" for one large file. Default is files.
+        records_per_file (int): the records in each file of the "files" layout. Default is 100.
+        queries (int): how many searches each search benchmark runs. Default is 50.
+        fetches (int): how many records the OLE benchmark fetches. Default is 200.
+        rows (int): the rows to ask Solr for with each search. Default is 1000.
+        latency (float): seconds the stand-in servers wait before each answer. Default is 0.
+        jitter (float): the most extra seconds the stand-in servers wait, at random. Default is 0.
+        seed (int): the seed for the corpus, the queries and the jitter. Default is 0.
+        only (list): the names of the groups to run out of ondisk, solr and ole. Default is all of them.
+
+    Returns:
+        dict. the environment, the parameters and a list of measurement summaries
+    """
+    groups = set(only or ["ondisk", "solr", "ole"])
+    parameters = {"records": records, "layout": layout, "records_per_file": records_per_file,
+                  "queries": queries, "fetches": fetches, "rows": rows, "latency": latency,
+                  "jitter": jitter, "seed": seed, "field_mix": DEFAULT_FIELD_MIX}
+    query_list = build_queries(queries, seed=seed)
+    results = []
+    with TemporaryDirectory() as workspace:
+        location = join(workspace, "corpus.mrc" if layout == "single" else "corpus")
+        control_numbers = write_corpus(location, records, layout=layout, records_per_file=records_per_file,
+                                       seed=seed)
+        if "ondisk" in groups:
+            summary, searcher = bench_ondisk_load(location)
+            results.append(summary)
+            results.append(bench_ondisk_search(searcher, query_list))
+            summary, searcher = bench_ondisk_load(location, index=True)
+            results.append(summary)
+            results.append(bench_ondisk_search(searcher, query_list, name="ondisk_search_index"))
+            del searcher
+        if "solr" in groups:
+            with SolrStandIn(control_numbers, latency=latency, jitter=jitter, seed=seed) as server:
+                results.append(bench_solr_search(server.url, query_list, rows=rows))
+        if "ole" in groups:
+            rng = Random(seed)
+            bibnumbers = [rng.choice(control_numbers) for _ in range(fetches)]
+            with SRUStandIn.from_corpus(records, seed=seed, latency=latency, jitter=jitter) as server:
+                results.append(bench_ole_finder(server.url, bibnumbers))
+    return {
+        "environment": {"python": python_version(), "implementation": python_implementation(),
+                        "platform": platform()},
+        "parameters": parameters,
+        "results": results,
+    }
+
+def build_parser():
+    """a function to build the argument parser for the benchmark runner
+
+    Returns:
+        argparse.ArgumentParser
+    """
+    parser = ArgumentParser(prog="python -m benchmarks.run",
+                            description="benchmark marcextraction against a synthetic corpus and local stand-ins")
+    parser.add_argument("--records", type=int, default=5000, help="the size of the corpus. Default is 5000")
+    parser.add_argument("--layout", choices=["files", "single"], default="files",
+                        help="many small files or one large file. Default is files")
+    parser.add_argument("--records-per-file", type=int, default=100,
+                        help="records in each file of the files layout. Default is 100")
+    parser.add_argument("--queries", type=int, default=50, help="searches per search benchmark. Default is 50")
+    parser.add_argument("--fetches", type=int, default=200, help="records the OLE benchmark fetches. Default is 200")
+    parser.add_argument("--rows", type=int, default=1000, help="rows asked of Solr per search. Default is 1000")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the stand-in servers wait before answering. Default is 0")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="the most extra seconds the stand-ins wait, at random. Default is 0")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for everything random. Default is 0")
+    parser.add_argument("--only", nargs="+", choices=["ondisk", "solr", "ole"],
+                        help="run only these groups of benchmarks")
+    parser.add_argument("--output", default="-", help="the file to write the JSON results to. Default is stdout")
+    return parser
+
+def main(arguments=None):
+    """a function to run the benchmark suite from the command line
+
+    Args:
+        arguments (list): the command-line arguments. Default is sys.argv
+
+    Returns:
+        int. the exit status
+    """
+    options = build_parser().parse_args(arguments)
+    report = run_benchmarks(records=options.records, layout=options.layout,
+                            records_per_file=options.records_per_file, queries=options.queries,
+                            fetches=options.fetches, rows=options.rows, latency=options.latency,
+                            jitter=options.jitter, seed=options.seed, only=options.only)
+    if options.output == "-":
+        dump(report, stdout, indent=2)
+        stdout.write("\n")
+    else:
+        with open(options.output, "w") as output:
+            dump(report, output, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+"""local HTTP stand-ins for the Solr select endpoint and the OLE SRU endpoint
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps
+from random import Random
+from socketserver import ThreadingMixIn
+from threading import Thread
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+
+from .corpus import generate_corpus, to_marcxml
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """an HTTP server that answers each request in its own thread, like http.server's from Python 3.7 on
+    """
+    daemon_threads = True
+
+class StandInServer:
+    """a base class for a threaded HTTP server that answers on a free local port
+
+    Each request waits latency seconds, plus up to jitter seconds more, before it is answered.
+
+    Useage:
+        with SolrStandIn(control_numbers, latency=0.01) as server:
+            searcher = SolrIndexSearcher(server.url, 'ole')
+    """
+    path = "/"
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        """initializes an instance of the class StandInServer
+
+        KWArgs:
+            latency (float): seconds to wait before answering each request. Default is 0.
+            jitter (float): the most extra seconds to wait, drawn at random per request. Default is 0.
+            seed (int): the seed for the jitter. Default is 0.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._rng = Random(seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._build_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """str. the base URL of the server"""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}{}".format(host, port, self.path)
+
+    def start(self):
+        """a method to start answering requests in a background thread
+
+        Returns:
+            StandInServer. the server itself
+        """
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """a method to stop the server and free its port
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _wait(self):
+        """a private method to sleep for the configured latency
+        """
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            sleep(delay)
+
+    def answer(self, path, params):
+        """a method to build the response to a GET request
+
+        Args:
+            path (str): the path of the request
+            params (dict): the query string parameters, as returned by urllib.parse.parse_qs
+
+        Returns:
+            tuple. the status code, the content type and the body as bytes
+        """
+        raise NotImplementedError
+
+    def _build_handler(self):
+        """a private method to build the request handler class bound to this server
+
+        Returns:
+            type. a BaseHTTPRequestHandler subclass
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                server.requests += 1
+                server._wait()
+                parsed = urlparse(self.path)
+                status, content_type, body = server.answer(parsed.path, parse_qs(parsed.query))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+class SolrStandIn(StandInServer):
+    """a class to emulate the select endpoint of the Solr index behind SolrIndexSearcher
+
+    Every query matches every control number the server was given. Both rows/start paging and
+    cursorMark paging are supported, and only JSON responses are written.
+
+    Useage:
+        with SolrStandIn(['1', '2', '3'], latency=0.005) as server:
+            SolrIndexSearcher(server.url, 'ole').search('banana', '245', ['a'])
+    """
+    path = "/solr/biblio"
+
+    def __init__(self, control_numbers, latency=0.0, jitter=0.0, seed=0):
+        """initializes an instance of the class SolrStandIn
+
+        Args:
+            control_numbers (list): the 001 values of the documents in the index
+
+        KWArgs:
+            latency (float): seconds to wait before answering each request. Default is 0.
+            jitter (float): the most extra seconds to wait, drawn at random per request. Default is 0.
+            seed (int): the seed for the jitter. Default is 0.
+        """
+        super().__init__(latency=latency, jitter=jitter, seed=seed)
+        self.control_numbers = list(control_numbers)
+
+    def answer(self, path, params):
+        if not path.rstrip("/").endswith("/select"):
+            return (404, "text/plain", b"not found")
+        rows = int(params.get("rows", ["10"])[0])
+        cursor = params.get("cursorMark", [None])[0]
+        start = int(params.get("start", ["0"])[0]) if cursor is None else (0 if cursor == "*" else int(cursor))
+        page = self.control_numbers[start:start + rows]
+        body = {"responseHeader": {"status": 0, "QTime": 0},
+                "response": {"numFound": len(self.control_numbers), "start": start,
+                             "docs": [{"controlfield_001": [number]} for number in page]}}
+        if cursor is not None:
+            body["nextCursorMark"] = str(start + len(page)) if page else cursor
+        return (200, "application/json", dumps(body).encode("utf-8"))
+
+class SRUStandIn(StandInServer):
+    """a class to emulate the OLE SRU searchRetrieve endpoint behind OLERecordFinder
+
+    Queries are id=... clauses joined by OR. Bibnumbers the server does not know are left out
+    of the response, just as OLE leaves them out.
+
+    Useage:
+        with SRUStandIn.from_corpus(1000, latency=0.02) as server:
+            url = urlparse(server.url)
+            OLERecordFinder('1', url.netloc, url.scheme, url.path).get_record()
+    """
+    path = "/sru"
+
+    def __init__(self, records, latency=0.0, jitter=0.0, seed=0):
+        """initializes an instance of the class SRUStandIn
+
+        Args:
+            records (dict): MARCXML record strings keyed by bibnumber
+
+        KWArgs:
+            latency (float): seconds to wait before answering each request. Default is 0.
+            jitter (float): the most extra seconds to wait, drawn at random per request. Default is 0.
+            seed (int): the seed for the jitter. Default is 0.
+        """
+        super().__init__(latency=latency, jitter=jitter, seed=seed)
+        self.records = records
+
+    @classmethod
+    def from_corpus(cls, count, seed=0, field_mix=None, **kwargs):
+        """a class method to serve a synthetic corpus made by benchmarks.corpus
+
+        Args:
+            count (int): how many records to serve
+
+        KWArgs:
+            seed (int): the seed for the corpus. Default is 0.
+            field_mix (dict): how many times to repeat each of 100, 245, 260 and 650.
+            latency, jitter: passed on to the server
+
+        Returns:
+            SRUStandIn. a server that has not been started yet
+        """
+        records = {control_number: to_marcxml(fields)
+                   for control_number, fields in generate_corpus(count, seed=seed, field_mix=field_mix)}
+        return cls(records, **kwargs)
+
+    def answer(self, path, params):
+        if params.get("operation", [""])[0] != "searchRetrieve" or "query" not in params:
+            return (400, "text/plain", b"expected a searchRetrieve query")
+        bibnumbers = [clause.strip()[3:] for clause in params["query"][0].split(" OR ")
+                      if clause.strip().startswith("id=")]
+        found = [self.records[bibnumber] for bibnumber in bibnumbers if bibnumber in self.records]
+        body = ['<?xml version="1.0" encoding="UTF-8"?>',
+                '<srw:searchRetrieveResponse xmlns:srw="http://www.loc.gov/zing/srw/">',
+                '<srw:version>1.2</srw:version>',
+                '<srw:numberOfRecords>{}</srw:numberOfRecords><srw:records>'.format(len(found))]
+        for position, record in enumerate(found, start=1):
+            body.append('<srw:record><srw:recordSchema>marcxml</srw:recordSchema>'
+                        '<srw:recordPacking>xml</srw:recordPacking><srw:recordData>{}</srw:recordData>'
+                        '<srw:recordPosition>{}</srw:recordPosition></srw:record>'.format(record, position))
+        body.append('</srw:records></srw:searchRetrieveResponse>')
+        return (200, "text/xml", ''.join(body).encode("utf-8"))
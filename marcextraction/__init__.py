@@ -0,0 +1,37 @@
+"""extract MARC records from a Solr index, the OLE SRU API or exported files on disk
+
+The public classes can be imported straight from the package. Nothing heavy is imported
+until a class is first used, so a worker process that only needs OnDiskSearcher never
+imports pysolr, requests, lxml or NumPy.
+
+    from marcextraction import OnDiskSearcher, SolrIndexSearcher
+"""
+
+from .lazy import lazy_exports
+
+_EXPORTS = {
+    "AsyncOLERecordFinder": "asynchronous",
+    "OLERecordCache": "cache",
+    "QueryCache": "cache",
+    "RecordCache": "cache",
+    "ColumnarStore": "columnar",
+    "FederatedSearcher": "federated",
+    "FieldTokenIndex": "index",
+    "Instrumentation": "instrumentation",
+    "MetricsAggregator": "instrumentation",
+    "ControlNumberIndex": "offsets",
+    "OLEBatchRecordFinder": "ole",
+    "OLERecordFinder": "ole",
+    "OnDiskSearcher": "ondisk",
+    "ExportPipeline": "pipeline",
+    "QuerySyntaxError": "query",
+    "compile_query": "query",
+    "parse_query": "query",
+    "CompactRecord": "records",
+    "SolrConnectionError": "solr",
+    "SolrIndexSearcher": "solr",
+}
+
+__all__ = sorted(_EXPORTS)
+
+lazy_exports(__name__, _EXPORTS)
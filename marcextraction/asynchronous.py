@@ -0,0 +1,153 @@
+"""an asyncio front end for fetching many records from the OLE API at once
+"""
+
+from asyncio import FIRST_COMPLETED, gather, get_event_loop, sleep, wait
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from lxml.etree import XMLSyntaxError
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.exceptions import HTTPError
+
+from .ole import OLEBatchRecordFinder, _build_sru_url, _stream_sru_records
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+class AsyncOLERecordFinder(OLEBatchRecordFinder):
+    """a class to use for fetching many MARC records from the OLE API with requests in flight at the same time
+
+    Up to concurrency SRU requests run at once over one pooled keep-alive session. Each
+    request has its own timeout, and connection errors, timeouts, 429/5xx answers and
+    responses that break off or are not well-formed XML are retried with exponential
+    backoff. A batch that still fails is noted in errors and the rest carry on. Records are
+    handed back as soon as their request finishes, so the order follows the server rather
+    than the input. The record cache is read and written in a thread, off the event loop.
+
+    Useage:
+        async def harvest():
+            finder = AsyncOLERecordFinder("example.com", "https", "/oledocstore", concurrency=8)
+            async for bibnumber, record in finder.find(["1003495521", "1003495522"]):
+                ...
+            finder.not_found
+    """
+    def __init__(self, ole_domain, ole_scheme, ole_path, batch_size=50, maximum_records=None, session=None,
+                 concurrency=8, timeout=30, retries=3, backoff=0.5, instrumentation=None, cache=None):
+        """initializes an instance of the class AsyncOLERecordFinder
+
+        Args:
+            ole_domain (str): the domain of the OLE SRU app
+            ole_scheme (str): http or https
+            ole_path (str): the path to the OLE SRU app
+
+        KWArgs:
+            batch_size (int): how many bibnumbers go into each SRU query. Default is 50.
+            maximum_records (int): the maximumRecords of each SRU query. Default is the batch size. It can not be
+                smaller than the batch size, or OLE would leave records out of a batch's response.
+            session (requests.Session): a session to send the requests over. A pooled one sized for concurrency is made by default.
+            concurrency (int): the most requests in flight at once. Default is 8.
+            timeout (float): seconds to wait on each request. Default is 30.
+            retries (int): how many times to retry a failed request. Default is 3.
+            backoff (float): seconds to wait before the first retry, doubled for each retry after that. Default is 0.5.
+            instrumentation (Instrumentation): where to report request timings, retries and parsing. Default is none.
+            cache (OLERecordCache): a cache of records to check before asking OLE. Default is none.
+
+        Raises:
+            ValueError: if maximum_records is smaller than batch_size
+        """
+        if session is None:
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        super().__init__(ole_domain, ole_scheme, ole_path, batch_size=batch_size,
+                         maximum_records=maximum_records, session=session, instrumentation=instrumentation,
+                         cache=cache)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _fetch_batch(self, executor, batch):
+        """a method to send the SRU request for one batch and read its records, retrying with backoff
+
+        Args:
+            executor (ThreadPoolExecutor): the threads the blocking requests run in
+            batch (list): a list of bibnumbers
+
+        Returns:
+            tuple. the bibnumbers that were asked for, their MARCXML records (or None if every
+                attempt failed) and the (bibnumber, MARCXML record) tuples the cache already had
+        """
+        loop = get_event_loop()
+        cached, batch = await loop.run_in_executor(None, self._split_cached, batch)
+        if not batch:
+            return (batch, [], cached)
+        url = _build_sru_url(self.ole_domain, self.ole_scheme, self.ole_path, self._build_query(batch),
+                             self.maximum_records or len(batch))
+        problem = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.instrumentation.count("ole.retry")
+                await sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with self.instrumentation.stage("ole.request") as stage:
+                    data = await loop.run_in_executor(executor, partial(self.session.get, url, timeout=self.timeout,
+                                                                        stream=True))
+                    stage.add("http_{}".format(data.status_code))
+                if data.status_code == 200:
+                    records = await loop.run_in_executor(executor, _stream_sru_records, data, self.instrumentation)
+                    return (batch, records, cached)
+            except (RequestException, HTTPError, XMLSyntaxError) as error:
+                problem = str(error) or type(error).__name__
+                continue
+            data.close()
+            problem = "HTTP {}".format(data.status_code)
+            if data.status_code not in RETRY_STATUSES:
+                break
+        self.errors.append("{} for the batch starting with {}".format(problem, batch[0]))
+        return (batch, None, cached)
+
+    async def find(self, bibnumbers):
+        """an asynchronous generator function to find the records for many bibnumbers
+
+        No more than concurrency batches are pending at any time, so a very long iterable of
+        bibnumbers is consumed a little at a time. Any bibnumber that had no record in its
+        batch's response is added to not_found. A consumer that stops early does not wait for
+        requests that are still running; their threads finish in the background.
+
+        Args:
+            bibnumbers (iterable): the bibnumbers to find
+
+        Returns:
+            async generator. an iterable containing (bibnumber, MARCXML record) tuples
+        """
+        batches = self._batches(bibnumbers)
+        pending = set()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        loop = get_event_loop()
+        try:
+            for batch in batches:
+                pending.add(loop.create_task(self._fetch_batch(executor, batch)))
+                if len(pending) == self.concurrency:
+                    break
+            while pending:
+                done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    batch, records, cached = task.result()
+                    for pair in cached:
+                        yield pair
+                    found = list(self._match_batch(batch, records))
+                    for pair in found:
+                        yield pair
+                    if self.cache is not None and found:
+                        await loop.run_in_executor(None, self.cache.put_many, found)
+                    next_batch = next(batches, None)
+                    if next_batch is not None:
+                        pending.add(loop.create_task(self._fetch_batch(executor, next_batch)))
+        finally:
+            for task in pending:
+                task.cancel()
+            await gather(*pending, return_exceptions=True)
+            executor.shutdown(wait=False)
@@ -0,0 +1,597 @@
+"""caches that let searchers skip work that has already been done
+"""
+
+from collections import OrderedDict
+from hashlib import sha1
+from io import BytesIO
+from json import dumps, loads
+from os import environ, makedirs, remove, stat
+from os.path import abspath, dirname, expanduser, join
+from sqlite3 import DatabaseError, connect
+from sys import getsizeof
+from threading import Lock
+from time import time
+
+def default_cache_path(location):
+    """a function to pick where the record cache for a corpus lives when no path is given
+
+    The cache is kept under the user's cache directory ($XDG_CACHE_HOME or ~/.cache), never
+    inside the corpus itself, and is named after a hash of the corpus's absolute path.
+
+    Args:
+        location (str): a location on disk to a directory of MARC files
+
+    Returns:
+        str. the location of the cache file
+    """
+    base = environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+    return join(base, "marcextraction", sha1(abspath(location).encode("utf-8")).hexdigest() + ".sqlite")
+
+class RecordCache:
+    """a class to keep parsed records from a directory of MARC files between runs
+
+    Each file's records are stored under its path along with the file's size and
+    modification time, as they were when get found nothing for it and the file was about
+    to be parsed. A file is only reparsed when one of those changes, so a file that changes
+    while it is parsed is parsed again next time. Files that were not seen during a run are
+    dropped when the cache is saved.
+
+    The cache is a SQLite file holding plain data only, the records as JSON or as raw MARC
+    bytes, so a cache file handed over with a corpus can not run any code when it is loaded.
+
+    Useage:
+        cache = RecordCache(default_cache_path('/path/to/marc/records'))
+        records = cache.get('/path/to/marc/records/file1.mrc')
+        if records is None:
+            records = parse('/path/to/marc/records/file1.mrc')
+            cache.put('/path/to/marc/records/file1.mrc', records)
+        cache.save()
+    """
+    version = 2
+
+    def __init__(self, path, record_format="dict"):
+        """initializes an instance of the class RecordCache
+
+        Args:
+            path (str): the location of the cache file
+
+        KWArgs:
+            record_format (str): dict for pymarc dictionaries or compact for CompactRecords. A cache
+                file written for a different format is emptied.
+        """
+        self.path = path
+        self.record_format = record_format
+        self._database = self._connect(path)
+        self.files = {file_path: (size, mtime) for file_path, size, mtime in
+                      self._database.execute("SELECT path, size, mtime FROM record_cache")}
+        self.updates = {}
+        self.signatures = {}
+        self.seen = set()
+        self.changed = False
+
+    def _connect(self, path):
+        """a private method to open the cache file, starting it over if it is missing, unreadable or out of date
+
+        Args:
+            path (str): the location of the cache file
+
+        Returns:
+            sqlite3.Connection
+        """
+        if dirname(path):
+            makedirs(dirname(path), exist_ok=True)
+        label = "{}:{}".format(self.version, self.record_format)
+        database = connect(path)
+        try:
+            database.execute("CREATE TABLE IF NOT EXISTS record_cache_format (label TEXT)")
+            database.execute("CREATE TABLE IF NOT EXISTS record_cache "
+                             "(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, records BLOB)")
+        except DatabaseError:
+            database.close()
+            remove(path)
+            return self._connect(path)
+        row = database.execute("SELECT label FROM record_cache_format").fetchone()
+        if row is None or row[0] != label:
+            with database:
+                database.execute("DELETE FROM record_cache")
+                database.execute("DELETE FROM record_cache_format")
+                database.execute("INSERT INTO record_cache_format VALUES (?)", (label,))
+        return database
+
+    def _signature(self, file_path):
+        """a private method to get the size and modification time of a file
+
+        Args:
+            file_path (str): a location on disk to a file
+
+        Returns:
+            tuple. the size in bytes and the modification time in nanoseconds
+        """
+        info = stat(file_path)
+        return (info.st_size, info.st_mtime_ns)
+
+    def _encode(self, records):
+        """a private method to turn a file's records into bytes for the cache file
+
+        Args:
+            records (list): pymarc dictionaries or CompactRecords
+
+        Returns:
+            bytes. the records as JSON, or compact records as their MARC transmission format one after another
+        """
+        if self.record_format == "compact":
+            return b''.join(record.raw for record in records)
+        return dumps(records).encode("utf-8")
+
+    def _decode(self, data):
+        """a private method to turn the bytes stored for a file back into its records
+
+        Args:
+            data (bytes): what _encode returned
+
+        Returns:
+            list. pymarc dictionaries or CompactRecords
+        """
+        if self.record_format == "compact":
+            from .records import CompactRecord, read_raw_records
+            return [CompactRecord(raw) for raw in read_raw_records(BytesIO(data))]
+        return loads(data.decode("utf-8"))
+
+    def get(self, file_path):
+        """a method to get the cached records for a file if the file has not changed
+
+        Args:
+            file_path (str): a location on disk to a file
+
+        Returns:
+            list. the cached records, or None if the file is new or has changed
+        """
+        self.seen.add(file_path)
+        if file_path in self.updates:
+            return self.updates[file_path][1]
+        signature = self._signature(file_path)
+        if self.files.get(file_path) == signature:
+            row = self._database.execute("SELECT records FROM record_cache WHERE path = ?", (file_path,)).fetchone()
+            try:
+                if row is not None:
+                    return self._decode(row[0])
+            except Exception:
+                pass
+        self.signatures[file_path] = signature
+        return None
+
+    def put(self, file_path, records):
+        """a method to store the records parsed from a file
+
+        The records are kept with the size and modification time get saw before the file was
+        parsed, or the ones the file has now if get was not asked about it first.
+
+        Args:
+            file_path (str): a location on disk to a file
+            records (list): the records parsed from the file
+        """
+        self.seen.add(file_path)
+        signature = self.signatures.pop(file_path, None) or self._signature(file_path)
+        self.updates[file_path] = (signature, records)
+        self.changed = True
+
+    def save(self):
+        """a method to drop files that were not seen and write new records to the cache file
+
+        Everything is written in one transaction, so an interrupted save leaves the cache file as
+        it was before.
+        """
+        gone = set(self.files) - self.seen
+        if not self.changed and not gone:
+            return
+        with self._database:
+            self._database.executemany("DELETE FROM record_cache WHERE path = ?", [(path,) for path in gone])
+            for file_path, ((size, mtime), records) in self.updates.items():
+                self._database.execute("INSERT OR REPLACE INTO record_cache VALUES (?, ?, ?, ?)",
+                                       (file_path, size, mtime, self._encode(records)))
+                self.files[file_path] = (size, mtime)
+        for file_path in gone:
+            del self.files[file_path]
+        self.updates = {}
+        self.changed = False
+
+    def close(self):
+        """a method to close the cache file
+        """
+        self._database.close()
+
+class QueryCache:
+    """a class to keep the results of recent searches in memory, and optionally on-disk
+
+    Entries are evicted least recently used first once there are more than max_entries of them
+    or they take up more than max_bytes, and each entry expires ttl seconds after it was stored.
+    With a path the entries are also kept in a SQLite file so they survive restarts.
+
+    Useage:
+        cache = QueryCache(max_entries=10000, max_bytes=50 * 1024 * 1024, ttl=3600, path='/tmp/queries.sqlite')
+        searcher = SolrIndexSearcher('http://your.domain/path/to/index', 'ole', cache=cache)
+        searcher.search('banana', '245', ['a'])
+        cache.stats()
+    """
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None, path=None):
+        """initializes an instance of the class QueryCache
+
+        KWArgs:
+            max_entries (int): the most entries to keep. Default is 1024.
+            max_bytes (int): the most bytes of results to keep in memory. Default is no limit.
+            ttl (float): seconds an entry stays fresh. Default is forever.
+            path (str): the location of a SQLite file to keep entries in between runs. Default is memory only.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._database = None
+        if path:
+            self._database = connect(path, check_same_thread=False)
+            self._database.execute("CREATE TABLE IF NOT EXISTS query_cache "
+                                   "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+            self._database.commit()
+
+    def _size(self, value):
+        """a private method to estimate how many bytes a cached result takes
+
+        Args:
+            value (tuple): a cached result
+
+        Returns:
+            int. the estimated size in bytes
+        """
+        return getsizeof(value) + sum(getsizeof(item) for item in value)
+
+    def get(self, key):
+        """a method to get a cached result
+
+        Args:
+            key (str): the normalized query
+
+        Returns:
+            tuple. the cached result, or None if there is no fresh entry for the key
+        """
+        now = time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._discard(key)
+            value = self._get_from_disk(key, now)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def _get_from_disk(self, key, now):
+        """a private method to look an entry up in the SQLite file and bring it back into memory
+
+        Args:
+            key (str): the normalized query
+            now (float): the current time
+
+        Returns:
+            tuple. the cached result, or None if there is no fresh entry on disk
+        """
+        if self._database is None:
+            return None
+        row = self._database.execute("SELECT value, expires FROM query_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            self._database.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+            self._database.commit()
+            return None
+        value = tuple(loads(row[0]))
+        self._database.execute("UPDATE query_cache SET accessed = ? WHERE key = ?", (now, key))
+        self._database.commit()
+        self._remember(key, value, row[1])
+        return value
+
+    def put(self, key, value):
+        """a method to store a result
+
+        Args:
+            key (str): the normalized query
+            value (iterable): the result to store
+        """
+        value = tuple(value)
+        now = time()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._database is not None:
+                self._database.execute("INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?)",
+                                       (key, dumps(value), expires, now))
+                self._database.execute("DELETE FROM query_cache WHERE key IN (SELECT key FROM query_cache "
+                                       "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                self._database.commit()
+
+    def _remember(self, key, value, expires):
+        """a private method to put an entry in memory and evict whatever no longer fits
+
+        Args:
+            key (str): the normalized query
+            value (tuple): the result
+            expires (float): when the entry stops being fresh, or None
+        """
+        if key in self.entries:
+            self._discard(key)
+        size = self._size(value)
+        self.entries[key] = (expires, size, value)
+        self.total_bytes += size
+        while self.entries and (len(self.entries) > self.max_entries or
+                                (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            self._discard(next(iter(self.entries)))
+
+    def _discard(self, key):
+        """a private method to drop an entry from memory
+
+        Args:
+            key (str): the normalized query
+        """
+        expires, size, value = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        """a method to drop every entry and reset the counters
+        """
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            if self._database is not None:
+                self._database.execute("DELETE FROM query_cache")
+                self._database.commit()
+
+    def stats(self):
+        """a method to report how well the cache is doing
+
+        Returns:
+            dict. the hits, misses, hit_rate, entries and bytes of the cache
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries), "bytes": self.total_bytes}
+
+    def close(self):
+        """a method to close the SQLite file if there is one
+        """
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+
+class OLERecordCache:
+    """a class to keep MARCXML records from OLE in a SQLite file, keyed by bibnumber
+
+    Records are evicted least recently used first once there are more than max_entries of them
+    or they take up more than max_bytes. A record is treated as missing once it is older than
+    ttl seconds, or when validate says it is no longer good. warm fills the cache in bulk from
+    an existing dump, so a job can start out with every record it already has.
+
+    Useage:
+        cache = OLERecordCache('/var/cache/marc/ole.sqlite', max_bytes=2 * 1024 ** 3, ttl=7 * 24 * 3600)
+        cache.warm('/path/to/last/export.mrc.gz')
+        finder = OLEBatchRecordFinder('domain.of.ole.sru.app', 'https', '/path/to/app', cache=cache)
+        for bibnumber, record in finder.find(['1003495521', '1003495522']):
+            ...
+        cache.stats()
+    """
+    def __init__(self, path, max_entries=None, max_bytes=None, ttl=None, validate=None):
+        """initializes an instance of the class OLERecordCache
+
+        Args:
+            path (str): the location of the SQLite file. ':memory:' keeps the cache in memory only
+
+        KWArgs:
+            max_entries (int): the most records to keep. Default is no limit.
+            max_bytes (int): the most bytes of MARCXML to keep. Default is no limit.
+            ttl (float): seconds a record stays fresh after it was stored. Default is forever.
+            validate (callable): called with the bibnumber, the MARCXML and the time it was stored,
+                returns False if the record has to be fetched again. Default is to trust every record.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.validate = validate
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._database = connect(path, check_same_thread=False)
+        self._database.execute("PRAGMA journal_mode=WAL")
+        self._database.execute("PRAGMA synchronous=NORMAL")
+        self._database.execute("CREATE TABLE IF NOT EXISTS ole_records "
+                               "(bibnumber TEXT PRIMARY KEY, record BLOB, size INTEGER, stored REAL, accessed REAL)")
+        self._database.execute("CREATE INDEX IF NOT EXISTS ole_records_accessed ON ole_records (accessed)")
+        self._database.commit()
+
+    def _is_fresh(self, bibnumber, record, stored, now):
+        """a private method to check a stored record against the ttl and the validate callable
+
+        Returns:
+            bool. True if the record can be used
+        """
+        if self.ttl is not None and stored + self.ttl <= now:
+            return False
+        if self.validate is not None and not self.validate(bibnumber, record, stored):
+            return False
+        return True
+
+    def get(self, bibnumber):
+        """a method to get the cached record for a bibnumber
+
+        Args:
+            bibnumber (str): the bibnumber to look up
+
+        Returns:
+            bytes. the MARCXML record, or None if there is no fresh record for the bibnumber
+        """
+        return self.get_many([bibnumber]).get(str(bibnumber))
+
+    def get_many(self, bibnumbers):
+        """a method to get the cached records for many bibnumbers with one query
+
+        Args:
+            bibnumbers (list): the bibnumbers to look up
+
+        Returns:
+            dict. the fresh MARCXML records by bibnumber. Bibnumbers without one are left out
+        """
+        bibnumbers = [str(bibnumber) for bibnumber in bibnumbers]
+        found = {}
+        stale = []
+        now = time()
+        with self._lock:
+            for start in range(0, len(bibnumbers), 500):
+                chunk = bibnumbers[start:start + 500]
+                rows = self._database.execute(
+                    "SELECT bibnumber, record, stored FROM ole_records WHERE bibnumber IN ({})".format(
+                        ", ".join("?" * len(chunk))), chunk).fetchall()
+                for bibnumber, record, stored in rows:
+                    if self._is_fresh(bibnumber, record, stored, now):
+                        found[bibnumber] = bytes(record)
+                    else:
+                        stale.append(bibnumber)
+            if stale:
+                self._database.executemany("DELETE FROM ole_records WHERE bibnumber = ?", [(x,) for x in stale])
+            if found:
+                self._database.executemany("UPDATE ole_records SET accessed = ? WHERE bibnumber = ?",
+                                           [(now, bibnumber) for bibnumber in found])
+            if stale or found:
+                self._database.commit()
+            self.hits += len(found)
+            self.misses += len(set(bibnumbers)) - len(found)
+        return found
+
+    def put(self, bibnumber, record):
+        """a method to store the record for a bibnumber
+
+        Args:
+            bibnumber (str): the bibnumber
+            record (bytes): the MARCXML record
+        """
+        self.put_many([(bibnumber, record)])
+
+    def put_many(self, pairs):
+        """a method to store many records in one transaction and then evict whatever no longer fits
+
+        Args:
+            pairs (iterable): (bibnumber, MARCXML record) tuples
+        """
+        now = time()
+        rows = [(str(bibnumber), record, len(record), now, now) for bibnumber, record in pairs]
+        if not rows:
+            return
+        with self._lock:
+            self._database.executemany("INSERT OR REPLACE INTO ole_records VALUES (?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self._database.commit()
+
+    def _evict(self):
+        """a private method to drop the least recently used records until the cache fits its limits
+
+        The bytes are added up here rather than with a window function, which SQLite only has from 3.25 on.
+        """
+        if self.max_entries is not None:
+            self._database.execute("DELETE FROM ole_records WHERE bibnumber IN (SELECT bibnumber FROM ole_records "
+                                   "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        if self.max_bytes is not None:
+            total_bytes = self._database.execute("SELECT COALESCE(SUM(size), 0) FROM ole_records").fetchone()[0]
+            evicted = []
+            if total_bytes > self.max_bytes:
+                for bibnumber, size in self._database.execute("SELECT bibnumber, size FROM ole_records "
+                                                              "ORDER BY accessed, bibnumber DESC"):
+                    evicted.append((bibnumber,))
+                    total_bytes -= size
+                    if total_bytes <= self.max_bytes:
+                        break
+            if evicted:
+                self._database.executemany("DELETE FROM ole_records WHERE bibnumber = ?", evicted)
+
+    def warm(self, source, batch_size=1000):
+        """a method to fill the cache in bulk
+
+        Args:
+            source (str|iterable): the location of a dump in binary MARC, MARCXML or MARC-in-JSON,
+                compressed or not, or an iterable of (bibnumber, MARCXML record) tuples, ex. from OLEBatchRecordFinder.find
+
+        KWArgs:
+            batch_size (int): how many records to store in each transaction. Default is 1000.
+
+        Returns:
+            int. the number of records stored
+        """
+        pairs = self._read_dump(source) if isinstance(source, str) else source
+        total = 0
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) == batch_size:
+                self.put_many(batch)
+                total += len(batch)
+                batch = []
+        self.put_many(batch)
+        return total + len(batch)
+
+    def _read_dump(self, dump_path):
+        """a private generator function to turn the records of a dump into MARCXML keyed by their 001
+
+        Records without a 001 field, and chunks that are not records, are skipped.
+
+        Args:
+            dump_path (str): the location of the dump
+
+        Returns:
+            generator. an iterable containing (bibnumber, MARCXML record) tuples
+        """
+        from pymarc import record_to_xml
+        from .ondisk import OnDiskSearcher
+        reader = OnDiskSearcher(location=dump_path, streaming=True)
+        for record in reader._iter_records():
+            control_field = record['001']
+            if control_field is not None and control_field.value().strip():
+                yield (control_field.value().strip(), record_to_xml(record, namespace=True))
+
+    def clear(self):
+        """a method to drop every record and reset the counters
+        """
+        with self._lock:
+            self._database.execute("DELETE FROM ole_records")
+            self._database.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """a method to report how well the cache is doing
+
+        Returns:
+            dict. the hits, misses, hit_rate, entries and bytes of the cache
+        """
+        with self._lock:
+            entries, total_bytes = self._database.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) "
+                                                          "FROM ole_records").fetchone()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries, "bytes": total_bytes}
+
+    def close(self):
+        """a method to close the SQLite file
+        """
+        if self._database is not None:
+            self._database.close()
+            self._database = None
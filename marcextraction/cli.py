@@ -0,0 +1,105 @@
+"""the command-line entry point for exporting the MARC records that match a search
+"""
+
+from argparse import ArgumentParser
+from sys import stderr, stdout
+from urllib.parse import urlparse
+
+from .cache import OLERecordCache
+from .harvest import DeltaHarvester
+from .instrumentation import MetricsAggregator
+from .ole import OLEBatchRecordFinder
+from .pipeline import OUTPUT_FORMATS, ExportPipeline
+from .solr import SolrIndexSearcher
+
+def build_parser():
+    """a function to build the argument parser for marc-export
+
+    Returns:
+        argparse.ArgumentParser
+    """
+    parser = ArgumentParser(prog="marc-export",
+                            description="search a Solr index and write the matching MARC records from OLE to a file")
+    parser.add_argument("query_term", help="the word or phrase to search for")
+    parser.add_argument("field", help="a MARC field number. Ex. 245")
+    parser.add_argument("subfields", nargs="*", default=[], help="subfield codes to search in. Ex. a b")
+    parser.add_argument("--solr", required=True, help="the URL of the Solr index to search")
+    parser.add_argument("--ole", required=True, help="the URL of the OLE SRU app to fetch records from")
+    parser.add_argument("--index-type", default="ole", help="the kind of Solr index. Default is ole")
+    parser.add_argument("--phrase", action="store_true", help="search for the full phrase")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="marc",
+                        help="binary MARC, MARCXML or line-delimited MARC-in-JSON. Default is marc")
+    parser.add_argument("--output", default="-", help="the file to write to. Default is stdout")
+    parser.add_argument("--page-size", type=int, default=1000,
+                        help="bibnumbers to fetch from Solr with each request. Default is 1000")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="bibnumbers to fetch from OLE with each request. Default is 50")
+    parser.add_argument("--queue-size", type=int, default=1000,
+                        help="the most items waiting between two stages. Default is 1000")
+    parser.add_argument("--progress-every", type=int, default=1000,
+                        help="records to write between progress reports. Default is 1000")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress on stderr")
+    parser.add_argument("--state", help="a file to checkpoint a delta harvest in. Only records changed since the "
+                        "last complete run with the same file are exported. A run that fails or has errors is not checkpointed "
+                        "and is exported again next time")
+    parser.add_argument("--timestamp-field", default="last_indexed",
+                        help="the Solr date field a delta harvest filters on. Default is last_indexed")
+    parser.add_argument("--record-cache", help="a SQLite file to keep the records fetched from OLE in. Records "
+                        "already in it are not fetched again")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each stage of the search and fetch and print a summary on stderr at the end")
+    return parser
+
+def report_progress(stats):
+    """a function to write a progress line to stderr
+
+    Args:
+        stats (dict): the statistics of an ExportPipeline run
+    """
+    stderr.write("{written} written, {fetched} fetched, {searched} found, {not_found} missing, "
+                 "{records_per_second:.1f} records/sec, {elapsed:.1f}s\n".format(**stats))
+    stderr.flush()
+
+def main(arguments=None):
+    """a function to run marc-export
+
+    Args:
+        arguments (list): the command-line arguments. Default is sys.argv
+
+    Returns:
+        int. the exit status, 1 if any record could not be fetched or converted and 0 otherwise
+    """
+    options = build_parser().parse_args(arguments)
+    ole_url = urlparse(options.ole)
+    metrics = MetricsAggregator() if options.profile else None
+    searcher = SolrIndexSearcher(options.solr, options.index_type, instrumentation=metrics)
+    cache = OLERecordCache(options.record_cache) if options.record_cache else None
+    finder = OLEBatchRecordFinder(ole_url.netloc, ole_url.scheme, ole_url.path, batch_size=options.batch_size,
+                                  session=searcher.session, instrumentation=metrics, cache=cache)
+    harvester = None
+    if options.state:
+        searcher = harvester = DeltaHarvester(searcher, options.state, timestamp_field=options.timestamp_field)
+    pipeline = ExportPipeline(searcher, finder, output_format=options.output_format,
+                              queue_size=options.queue_size, page_size=options.page_size,
+                              progress=None if options.quiet else report_progress,
+                              progress_every=options.progress_every)
+    if options.output == "-":
+        pipeline.run(options.query_term, options.field, options.subfields, stdout.buffer,
+                     phrase_search=options.phrase)
+    else:
+        with open(options.output, "wb") as output:
+            pipeline.run(options.query_term, options.field, options.subfields, output,
+                         phrase_search=options.phrase)
+    errors = pipeline.errors + finder.errors
+    for error in errors:
+        stderr.write("{}\n".format(error))
+    if harvester is not None and not errors:
+        harvester.commit()
+    if cache is not None:
+        cache.close()
+    if metrics is not None:
+        stderr.write(metrics.report() + "\n")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
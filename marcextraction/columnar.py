@@ -0,0 +1,503 @@
+"""a columnar store of chosen MARC subfields for vectorized filtering and counting
+
+Every column holds the values of one tag and subfield code, one row per occurrence. The
+distinct values are sorted and concatenated into one UTF-8 buffer with an array of offsets
+into it, and each row keeps only the position of its value in that dictionary plus the
+position of its record. Filters and counts then run as NumPy operations over the row arrays
+instead of Python loops over records. A store can be saved as .npy files and loaded back
+memory-mapped, so it opens instantly and only the pages a filter touches are read.
+
+NumPy is an optional dependency, imported the first time a store is built or loaded:
+pip install marcExtraction[columnar]
+"""
+
+from importlib import import_module
+from json import dump, load
+from os import makedirs
+from os.path import join
+from re import compile as compile_pattern
+
+from .records import CompactRecord
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+COLUMN_PARTS = ("buffer", "offsets", "numbers", "codes", "records", "first")
+NUMBER_PATTERN = compile_pattern(r'\d+(?:\.\d+)?')
+
+numpy = None
+
+def _require_numpy():
+    """a private function to import NumPy the first time a columnar store is used
+
+    Returns:
+        module. numpy
+
+    Raises:
+        ImportError: if NumPy is not installed
+    """
+    global numpy
+    if numpy is None:
+        try:
+            numpy = import_module("numpy")
+        except ImportError:
+            raise ImportError("the columnar store needs NumPy; install it with pip install marcExtraction[columnar]")
+    return numpy
+
+def _split_path(path):
+    """a private function to split a column path into its tag and subfield code
+
+    Args:
+        path (str): a tag with an optional subfield code. Ex. 260c or 001
+
+    Returns:
+        tuple. the tag and the subfield code, '' if there is none
+
+    Raises:
+        ValueError: if the path is not a three character tag with at most one subfield code
+    """
+    if len(path) not in (3, 4):
+        raise ValueError("invalid column path '{}'; expected a tag and an optional subfield code".format(path))
+    return (path[:3], path[3:])
+
+def _first_number(value):
+    """a private function to read the first number out of a value. Ex. 'c1987.' is 1987.0
+
+    Args:
+        value (str): a subfield value
+
+    Returns:
+        float. the number, or NaN if there is none
+    """
+    found = NUMBER_PATTERN.search(value)
+    return float(found.group()) if found else float('nan')
+
+class Column:
+    """a class to hold one dictionary-encoded column of subfield values
+
+    The dictionary is sorted by UTF-8 bytes, which is also code point order, so all the values
+    that start with a prefix sit next to each other.
+
+    Attributes:
+        buffer (numpy.ndarray): uint8. every distinct value, UTF-8 encoded, one after another
+        offsets (numpy.ndarray): int64. where each distinct value starts in buffer, plus the end of the last one
+        numbers (numpy.ndarray): float64. the first number in each distinct value, or NaN
+        codes (numpy.ndarray): int32. the dictionary position of each row's value
+        records (numpy.ndarray): uint32. the record position of each row
+        first (numpy.ndarray): bool. whether each row is the first time its record has its value
+    """
+    def __init__(self, buffer, offsets, numbers, codes, records, first):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.numbers = numbers
+        self.codes = codes
+        self.records = records
+        self.first = first
+
+    @classmethod
+    def from_values(cls, values, positions):
+        """a method to dictionary-encode a column
+
+        Args:
+            values (list): the value of each row
+            positions (list): the record position of each row
+
+        Returns:
+            Column
+        """
+        encoded = sorted(set(value.encode('utf-8') for value in values))
+        lookup = {value: code for code, value in enumerate(encoded)}
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        if encoded:
+            numpy.cumsum([len(value) for value in encoded], out=offsets[1:])
+        codes = numpy.array([lookup[value.encode('utf-8')] for value in values], dtype=numpy.int32)
+        records = numpy.array(positions, dtype=numpy.uint32)
+        first = numpy.zeros(len(codes), dtype=bool)
+        if len(codes):
+            pairs = codes.astype(numpy.int64) * (int(records[-1]) + 1) + records
+            first[numpy.unique(pairs, return_index=True)[1]] = True
+        return cls(numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8).copy(), offsets,
+                   numpy.array([_first_number(value.decode('utf-8')) for value in encoded], dtype=numpy.float64),
+                   codes, records, first)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def dictionary_size(self):
+        """a method to count the distinct values in the column
+
+        Returns:
+            int
+        """
+        return len(self.offsets) - 1
+
+    def _entry(self, code):
+        """a private method to get the UTF-8 bytes of one distinct value
+
+        Args:
+            code (int): a dictionary position
+
+        Returns:
+            bytes
+        """
+        return self.buffer[self.offsets[code]:self.offsets[code + 1]].tobytes()
+
+    def value(self, code):
+        """a method to decode one distinct value
+
+        Args:
+            code (int): a dictionary position
+
+        Returns:
+            str
+        """
+        return self._entry(code).decode('utf-8')
+
+    def _lower_bound(self, key):
+        """a private method to binary search the sorted dictionary
+
+        Args:
+            key (bytes): UTF-8 bytes to look for
+
+        Returns:
+            int. the first dictionary position whose value is not less than key
+        """
+        low, high = 0, self.dictionary_size()
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def equals_mask(self, value):
+        """a method to find the rows whose value is exactly value
+
+        Args:
+            value (str): the value to look for
+
+        Returns:
+            numpy.ndarray. a boolean mask over the rows
+        """
+        key = value.encode('utf-8')
+        code = self._lower_bound(key)
+        if code == self.dictionary_size() or self._entry(code) != key:
+            return numpy.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def prefix_mask(self, prefix):
+        """a method to find the rows whose value starts with prefix
+
+        Args:
+            prefix (str): the start of the values to look for
+
+        Returns:
+            numpy.ndarray. a boolean mask over the rows
+        """
+        key = prefix.encode('utf-8')
+        low = self._lower_bound(key)
+        high = self._lower_bound(key + b'\xff')
+        return (self.codes >= low) & (self.codes < high)
+
+    def contains_mask(self, text):
+        """a method to find the rows whose value contains text
+
+        Every occurrence of text in the shared buffer is found with bytes.find and mapped back to
+        the distinct value it falls in, so each distinct value is only looked at once.
+
+        Args:
+            text (str): the text to look for
+
+        Returns:
+            numpy.ndarray. a boolean mask over the rows
+        """
+        needle = text.encode('utf-8')
+        if not needle:
+            return numpy.ones(len(self.codes), dtype=bool)
+        haystack = self.buffer.tobytes()
+        starts = []
+        position = haystack.find(needle)
+        while position != -1:
+            starts.append(position)
+            position = haystack.find(needle, position + 1)
+        if not starts:
+            return numpy.zeros(len(self.codes), dtype=bool)
+        starts = numpy.array(starts, dtype=numpy.int64)
+        entries = numpy.searchsorted(self.offsets, starts, side='right') - 1
+        inside = starts + len(needle) <= self.offsets[entries + 1]
+        matched = numpy.zeros(self.dictionary_size(), dtype=bool)
+        matched[entries[inside]] = True
+        return matched[self.codes]
+
+    def between_mask(self, low=None, high=None):
+        """a method to find the rows whose first number falls in a range
+
+        Args:
+            low (float): the smallest number to keep, or None for no lower bound
+            high (float): the largest number to keep, or None for no upper bound
+
+        Returns:
+            numpy.ndarray. a boolean mask over the rows
+        """
+        numbers = self.numbers[self.codes]
+        mask = ~numpy.isnan(numbers)
+        if low is not None:
+            mask &= numbers >= low
+        if high is not None:
+            mask &= numbers <= high
+        return mask
+
+class ColumnarStore:
+    """a class to filter and count records by the values of chosen subfields with NumPy
+
+    Each filter returns the sorted positions of the matching records, as a NumPy array; combine
+    them with numpy.intersect1d and numpy.union1d. Positions are the records' positions in the
+    list the store was built from, ex. an OnDiskSearcher's records.
+
+    Useage:
+        store = searcher.project(['001', '040a', '260c'])
+        old = store.between('260c', 1900, 1950)
+        store.group_count('040a', record_ids=old)
+        store.save('/path/to/store')
+        store = ColumnarStore.load('/path/to/store')
+    """
+    def __init__(self, columns, record_count):
+        """initializes an instance of the class ColumnarStore
+
+        Args:
+            columns (dict): a mapping of column path to Column
+            record_count (int): how many records the store was built from
+
+        Raises:
+            ImportError: if NumPy is not installed
+        """
+        _require_numpy()
+        self.columns = columns
+        self.record_count = record_count
+
+    @classmethod
+    def build(cls, records, paths):
+        """a method to project the chosen subfields of many records into columns
+
+        Args:
+            records (iterable): dictionaries as returned by pymarc's Record.as_dict, or CompactRecords
+            paths (list): column paths, a tag with an optional subfield code. Ex. ['001', '260c']
+
+        Returns:
+            ColumnarStore
+
+        Raises:
+            ImportError: if NumPy is not installed
+            ValueError: if a path is not valid
+        """
+        _require_numpy()
+        wanted = {}
+        for path in paths:
+            tag, code = _split_path(path)
+            wanted.setdefault(tag, {})[code] = path
+        values = {path: [] for path in paths}
+        positions = {path: [] for path in paths}
+        total = 0
+        for position, record in enumerate(records):
+            total += 1
+            for tag, code, value in _iter_wanted_values(record, wanted):
+                codes = wanted[tag]
+                for path in (codes.get(code), codes.get('') if code else None):
+                    if path is not None and value:
+                        values[path].append(value)
+                        positions[path].append(position)
+        columns = {path: Column.from_values(values[path], positions[path]) for path in paths}
+        return cls(columns, total)
+
+    def column(self, path):
+        """a method to get one column
+
+        Args:
+            path (str): a column path. Ex. 260c
+
+        Returns:
+            Column
+
+        Raises:
+            KeyError: if the path was not projected into the store
+        """
+        try:
+            return self.columns[path]
+        except KeyError:
+            raise KeyError("the column '{}' is not in the store; it has {}".format(path, sorted(self.columns)))
+
+    def _record_ids(self, column, mask):
+        """a private method to turn a row mask into the sorted positions of the matching records
+
+        Args:
+            column (Column): the column the mask is over
+            mask (numpy.ndarray): a boolean mask over the column's rows
+
+        Returns:
+            numpy.ndarray. sorted, distinct record positions
+        """
+        return numpy.unique(column.records[mask])
+
+    def equals(self, path, value):
+        """a method to find the records with a subfield equal to value
+
+        Args:
+            path (str): a column path. Ex. 040a
+            value (str): the value to look for
+
+        Returns:
+            numpy.ndarray. sorted record positions
+        """
+        column = self.column(path)
+        return self._record_ids(column, column.equals_mask(value))
+
+    def prefix(self, path, prefix):
+        """a method to find the records with a subfield starting with prefix
+
+        Args:
+            path (str): a column path
+            prefix (str): the start of the values to look for
+
+        Returns:
+            numpy.ndarray. sorted record positions
+        """
+        column = self.column(path)
+        return self._record_ids(column, column.prefix_mask(prefix))
+
+    def contains(self, path, text):
+        """a method to find the records with a subfield containing text
+
+        Args:
+            path (str): a column path
+            text (str): the text to look for
+
+        Returns:
+            numpy.ndarray. sorted record positions
+        """
+        column = self.column(path)
+        return self._record_ids(column, column.contains_mask(text))
+
+    def between(self, path, low=None, high=None):
+        """a method to find the records with a subfield whose first number falls in a range
+
+        Args:
+            path (str): a column path. Ex. 260c
+
+        KWArgs:
+            low (float): the smallest number to keep. Default is no lower bound.
+            high (float): the largest number to keep. Default is no upper bound.
+
+        Returns:
+            numpy.ndarray. sorted record positions
+        """
+        column = self.column(path)
+        return self._record_ids(column, column.between_mask(low, high))
+
+    def group_count(self, path, record_ids=None, limit=None):
+        """a method to count the records that have each distinct value of a subfield
+
+        A record with the same value twice is counted once for it.
+
+        Args:
+            path (str): a column path. Ex. 040a
+
+        KWArgs:
+            record_ids (numpy.ndarray): only count these records, ex. the result of a filter. Default is every record.
+            limit (int): only return this many of the most common values. Default is all of them.
+
+        Returns:
+            list. (value, count) tuples, the most common first
+        """
+        column = self.column(path)
+        keep = numpy.asarray(column.first)
+        if record_ids is not None:
+            keep = keep & numpy.isin(column.records, record_ids)
+        counts = numpy.bincount(column.codes[keep], minlength=column.dictionary_size())
+        order = numpy.lexsort((numpy.arange(len(counts)), -counts))
+        order = order[counts[order] > 0]
+        if limit is not None:
+            order = order[:limit]
+        return [(column.value(code), int(counts[code])) for code in order]
+
+    def values(self, path, record_id):
+        """a method to get the values a record has in a column
+
+        Args:
+            path (str): a column path
+            record_id (int): a record position
+
+        Returns:
+            list. the record's values, in record order
+        """
+        column = self.column(path)
+        low = numpy.searchsorted(column.records, record_id, side='left')
+        high = numpy.searchsorted(column.records, record_id, side='right')
+        return [column.value(code) for code in column.codes[low:high]]
+
+    def save(self, directory):
+        """a method to write the store to a directory as .npy files and a manifest
+
+        Args:
+            directory (str): the directory to write to. It is made if it does not exist
+        """
+        makedirs(directory, exist_ok=True)
+        for path, column in self.columns.items():
+            for part in COLUMN_PARTS:
+                numpy.save(join(directory, "{}.{}.npy".format(path, part)), getattr(column, part))
+        with open(join(directory, MANIFEST_NAME), "w") as manifest:
+            dump({"version": FORMAT_VERSION, "record_count": self.record_count, "paths": sorted(self.columns)},
+                 manifest)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """a method to open a store written by save
+
+        Args:
+            directory (str): the directory the store was saved to
+
+        KWArgs:
+            mmap (bool): whether to memory-map the arrays instead of reading them in. Default is True.
+
+        Returns:
+            ColumnarStore
+
+        Raises:
+            ImportError: if NumPy is not installed
+            ValueError: if the directory holds a store in a format this version can not read
+        """
+        _require_numpy()
+        with open(join(directory, MANIFEST_NAME)) as manifest:
+            description = load(manifest)
+        if description.get("version") != FORMAT_VERSION:
+            raise ValueError("unsupported columnar store version {}".format(description.get("version")))
+        mode = 'r' if mmap else None
+        columns = {}
+        for path in description["paths"]:
+            parts = [numpy.load(join(directory, "{}.{}.npy".format(path, part)), mmap_mode=mode)
+                     for part in COLUMN_PARTS]
+            columns[path] = Column(*parts)
+        return cls(columns, description["record_count"])
+
+def _iter_wanted_values(record, wanted):
+    """a private generator function to pull the values of the wanted tags out of a record
+
+    Args:
+        record (dict|CompactRecord): a MARC record as returned by pymarc's Record.as_dict, or a CompactRecord
+        wanted (dict): a mapping of tag to the subfield codes wanted from it
+
+    Returns:
+        generator. an iterable containing (tag, subfield code, value) tuples. Control fields have a code of ''
+    """
+    if isinstance(record, CompactRecord):
+        yield from record.values_for(wanted)
+        return
+    for a_field in record.get("fields"):
+        for tag, field_data in a_field.items():
+            if tag not in wanted:
+                continue
+            if isinstance(field_data, dict):
+                for subfield in field_data.get("subfields"):
+                    for code, value in subfield.items():
+                        yield (tag, code, value)
+            else:
+                yield (tag, '', field_data)
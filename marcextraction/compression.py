@@ -0,0 +1,248 @@
+"""reading gzip, bzip2 and xz compressed MARC files without decompressing them to disk first
+"""
+
+from importlib import import_module
+from queue import Full, Queue
+from threading import Event, Thread
+
+# the magic bytes each compressed format starts with and the standard library module that reads it
+COMPRESSION_FORMATS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+)
+
+class DecompressionError(OSError):
+    """the exception raised when a compressed stream is corrupt or cut short
+    """
+
+def detect_compression(stream):
+    """a function to find out how a binary stream is compressed from its first few bytes
+
+    The stream is left where it was. A stream that can neither peek nor seek is taken to be
+    uncompressed.
+
+    Args:
+        stream (File Object): an open binary stream
+
+    Returns:
+        str. the name of the module that reads the stream (gzip, bz2 or lzma), or None if it is not compressed
+    """
+    if hasattr(stream, "peek"):
+        magic = stream.peek(6)[:6]
+    elif hasattr(stream, "seekable") and stream.seekable():
+        position = stream.tell()
+        magic = stream.read(6)
+        stream.seek(position)
+    else:
+        return None
+    for signature, module_name in COMPRESSION_FORMATS:
+        if magic.startswith(signature):
+            return module_name
+    return None
+
+def decompress_stream(stream, readahead=True):
+    """a function to wrap a binary stream so that reading it returns decompressed bytes
+
+    Args:
+        stream (File Object): an open binary stream that may be compressed
+
+    KWArgs:
+        readahead (bool): whether to decompress in a background thread while the caller parses. Default is True.
+
+    Returns:
+        File Object. the stream itself if it is not compressed, otherwise a decompressing stream
+    """
+    module_name = detect_compression(stream)
+    if module_name is None:
+        return stream
+    decompressed = import_module(module_name).open(stream, 'rb')
+    return ReadaheadReader(decompressed) if readahead else decompressed
+
+def open_marc_file(file_path):
+    """a function to open a MARC file for reading, decompressing it on the fly if it is compressed
+
+    A compressed file is decompressed in a background thread, a few chunks ahead of the caller.
+
+    Args:
+        file_path (str): a location on disk to a file
+
+    Returns:
+        File Object. a binary stream of MARC data. Closing it closes the file
+    """
+    stream = open(file_path, 'rb')
+    try:
+        module_name = detect_compression(stream)
+        if module_name is None:
+            return stream
+        decompressed = import_module(module_name).open(stream, 'rb')
+    except Exception:
+        stream.close()
+        raise
+    return ReadaheadReader(decompressed, name=file_path, also_close=stream)
+
+class ReadaheadReader:
+    """a class to read a stream in a background thread, a few chunks ahead of the caller
+
+    The gzip, bz2 and lzma decompressors let go of the GIL while they work, so decompressing
+    the next chunks in a thread overlaps with parsing the current one. Only depth chunks of
+    chunk_size bytes are ever waiting, so memory use stays bounded.
+
+    Useage:
+        with ReadaheadReader(gzip.open('/path/to/records.mrc.gz')) as stream:
+            for offset, raw in iter_raw_records(stream):
+                ...
+    """
+    def __init__(self, stream, chunk_size=1024 * 1024, depth=4, name=None, also_close=None):
+        """initializes an instance of the class ReadaheadReader
+
+        Args:
+            stream (File Object): the binary stream to read from
+
+        KWArgs:
+            chunk_size (int): how many bytes to read at a time. Default is 1 MiB.
+            depth (int): the most chunks to read ahead. Default is 4.
+            name (str): what to call the stream in error messages. Default is the stream's own name.
+            also_close (File Object): another stream to close along with this one, ex. the file under a decompressor
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.name = name if name is not None else getattr(stream, "name", None)
+        self.also_close = also_close
+        self._chunks = Queue(maxsize=depth)
+        self._buffer = b''
+        self._finished = False
+        self._error = None
+        self._closed = Event()
+        self._thread = Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        """a private method to keep the queue full of chunks until the stream runs out or the reader is closed
+
+        Each chunk is put together from read1 calls where the stream has them. A decompressor
+        hands back what it has decompressed with every read1, so when a damaged or cut short
+        stream raises, everything before the damage is still passed on ahead of the error.
+        """
+        read = getattr(self.stream, "read1", self.stream.read)
+        while not self._closed.is_set():
+            pieces = []
+            size = 0
+            try:
+                while size < self.chunk_size:
+                    piece = read(self.chunk_size - size)
+                    if not piece:
+                        break
+                    pieces.append(piece)
+                    size += len(piece)
+            except Exception as error:
+                if pieces:
+                    self._put(b''.join(pieces))
+                self._put(error)
+                return
+            if pieces:
+                self._put(b''.join(pieces))
+            if size < self.chunk_size:
+                self._put(b'')
+                return
+
+    def _put(self, item):
+        """a private method to hand a chunk to the reader, giving up if the reader is closed
+        """
+        while not self._closed.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def _next_chunk(self):
+        """a private method to take the next chunk from the background thread
+
+        Returns:
+            bytes. the chunk, empty once the stream has run out
+
+        Raises:
+            DecompressionError: if reading the stream failed in the background thread
+        """
+        item = self._chunks.get()
+        if isinstance(item, Exception):
+            self._finished = True
+            raise DecompressionError("could not decompress {}: {}".format(self.name or "the stream", item)) from item
+        if not item:
+            self._finished = True
+        return item
+
+    def read(self, size=-1):
+        """a method to read decompressed bytes
+
+        KWArgs:
+            size (int): the most bytes to return. Default is everything that is left.
+
+        Returns:
+            bytes. fewer than size bytes only at the end of the stream
+        """
+        if size is None or size < 0:
+            while not self._finished:
+                self._fill_buffer(len(self._buffer) + self.chunk_size)
+            self._fill_buffer(1)
+            data, self._buffer = self._buffer, b''
+            return data
+        self._fill_buffer(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def peek(self, size=1):
+        """a method to look at the next bytes without reading them
+
+        KWArgs:
+            size (int): how many bytes to look at. Default is 1.
+
+        Returns:
+            bytes. at least size bytes unless the stream ends sooner, and maybe more
+        """
+        self._fill_buffer(size)
+        return self._buffer
+
+    def _fill_buffer(self, size):
+        """a private method to take chunks from the background thread until size bytes are waiting or the stream ends
+
+        If reading fails while some bytes are waiting, those bytes are handed out first and the
+        error is raised once they have all been read.
+
+        Raises:
+            DecompressionError: if reading the stream failed and no bytes are left waiting
+        """
+        if self._error is not None and not self._buffer:
+            error, self._error = self._error, None
+            raise error
+        while len(self._buffer) < size and not self._finished:
+            try:
+                chunk = self._next_chunk()
+            except DecompressionError as error:
+                if not self._buffer:
+                    raise
+                self._error = error
+                return
+            self._buffer = self._buffer + chunk if self._buffer else chunk
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        """a method to stop the background thread and close the stream
+        """
+        self._closed.set()
+        self._thread.join()
+        self.stream.close()
+        if self.also_close is not None:
+            self.also_close.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
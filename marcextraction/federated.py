@@ -0,0 +1,174 @@
+"""a searcher that runs one search against several indexes and directories of records at once
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+from threading import Event
+from time import monotonic
+
+_DONE = object()
+_STARTED = object()
+
+class BackendTimeout(Exception):
+    """the exception recorded for a backend that did not finish before the timeout
+    """
+
+def control_number(record):
+    """a function to find the 001 value of a search result from any backend
+
+    Args:
+        record (str|dict|CompactRecord): a control number, a pymarc dictionary or a compact record
+
+    Returns:
+        str. the control number, or None if the record has no 001 field
+    """
+    if isinstance(record, str):
+        return record
+    if isinstance(record, dict):
+        for field in record.get("fields", []):
+            if "001" in field:
+                return field["001"]
+        return None
+    return record.control_number()
+
+class FederatedSearcher:
+    """a class to run a search against several backends concurrently and merge their control numbers
+
+    Every backend is searched in its own thread, so a search takes as long as the slowest
+    backend rather than all of them added together. Control numbers are handed out as soon
+    as any backend finds them and each one is only handed out once. A backend that raises
+    or does not finish within timeout seconds of starting is left out, and what went wrong
+    is kept in failures. A backend waiting for a free worker only starts its clock once it
+    gets one.
+
+    Backends that have iter_search, like SolrIndexSearcher, are paged through, so their
+    control numbers start arriving with the first page. Any other backend, like
+    OnDiskSearcher, just needs a search method.
+
+    Useage:
+        searcher = FederatedSearcher({'ole': SolrIndexSearcher('http://your.domain/path/to/ole', 'ole'),
+                                      'vufind': SolrIndexSearcher('http://your.domain/path/to/vufind', 'ole'),
+                                      'archive': OnDiskSearcher(location='/path/to/marc/dumps')},
+                                     timeout=10)
+        for control_number in searcher.search('banana', '245', ['a']):
+            ...
+        searcher.failures
+    """
+    def __init__(self, backends, timeout=60, max_workers=None):
+        """initializes an instance of the class FederatedSearcher
+
+        Args:
+            backends (dict|list): searchers by name, or a list of searchers to name by position
+
+        KWArgs:
+            timeout (float): the most seconds to wait for each backend once it has started. Default is 60.
+            max_workers (int): the most backends to search at the same time. Default is all of them.
+        """
+        if not isinstance(backends, dict):
+            backends = {"{}:{}".format(position, type(backend).__name__): backend
+                        for position, backend in enumerate(backends)}
+        if not backends:
+            raise ValueError("a federated search needs at least one backend")
+        self.backends = backends
+        self.timeout = timeout
+        self.max_workers = max_workers or len(backends)
+        self.failures = {}
+        self.counts = {}
+
+    def _search_backend(self, name, backend, query_term, field, subfields, phrase_search, results, stop):
+        """a private method to run the search against one backend and put what it finds on the queue
+
+        Args:
+            name (str): the name of the backend
+            backend (object): a searcher
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+            phrase_search (bool): whether to search for the full phrase
+            results (Queue): where to put (name, _STARTED), then (name, control number) tuples, then (name, _DONE)
+                or (name, exception)
+            stop (Event): set once nobody is waiting for the results anymore
+        """
+        if stop.is_set():
+            return
+        results.put((name, _STARTED))
+        try:
+            if hasattr(backend, "iter_search"):
+                found = backend.iter_search(query_term, field, subfields, phrase_search=phrase_search)
+            else:
+                found = backend.search(query_term, field, subfields)
+            for record in found:
+                if stop.is_set():
+                    return
+                results.put((name, control_number(record)))
+        except Exception as error:
+            results.put((name, error))
+        else:
+            results.put((name, _DONE))
+
+    def search(self, query_term, field, subfields, phrase_search=False):
+        """a generator function to search every backend and hand out the merged control numbers
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            phrase_search (bool): whether to search for the full phrase. Ignored by backends without iter_search. Default is False.
+
+        Returns:
+            generator. an iterable containing each control number found by any backend, once
+        """
+        self.failures = {}
+        self.counts = {name: 0 for name in self.backends}
+        results = Queue()
+        stop = Event()
+        pending = set(self.backends)
+        deadlines = {}
+        seen = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = []
+        try:
+            for name, backend in self.backends.items():
+                futures.append(executor.submit(self._search_backend, name, backend, query_term, field, subfields,
+                                               phrase_search, results, stop))
+            while pending:
+                now = monotonic()
+                for name in [name for name in pending if name in deadlines and deadlines[name] <= now]:
+                    pending.discard(name)
+                    self.failures[name] = BackendTimeout("no answer within {} seconds".format(self.timeout))
+                started = [deadlines[name] for name in pending if name in deadlines]
+                if not pending:
+                    break
+                try:
+                    name, item = results.get(timeout=max(min(started) - now, 0) if started else None)
+                except Empty:
+                    continue
+                if name not in pending:
+                    continue
+                if item is _STARTED:
+                    deadlines[name] = monotonic() + self.timeout
+                elif item is _DONE:
+                    pending.discard(name)
+                elif isinstance(item, Exception):
+                    pending.discard(name)
+                    self.failures[name] = item
+                elif item is not None:
+                    self.counts[name] += 1
+                    if item not in seen:
+                        seen.add(item)
+                        yield item
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def iter_search(self, query_term, field, subfields, page_size=1000, phrase_search=False):
+        """a method to run the federated search in place of SolrIndexSearcher.iter_search, ex. as an ExportPipeline's searcher
+
+        Returns:
+            generator. the same as search. page_size is left to each backend
+        """
+        return self.search(query_term, field, subfields, phrase_search=phrase_search)
@@ -0,0 +1,182 @@
+"""reading MARCXML collections and line-delimited MARC-in-JSON one record at a time
+
+The same records can be stored as binary MARC (ISO 2709), as MARCXML or as MARC-in-JSON with
+one record per line. detect_format tells them apart from the first bytes of a stream, and the
+readers here turn MARCXML and MARC-in-JSON into pymarc records as they go, so a collection of
+any size is read in constant memory.
+"""
+
+from json import loads
+from xml.etree.ElementTree import ParseError, iterparse
+
+from pymarc import Field, Record
+
+RECORD_FORMATS = ("marc", "marcxml", "json")
+
+_BYTE_ORDER_MARK = b'\xef\xbb\xbf'
+
+def detect_format(stream):
+    """a function to find out whether a binary stream holds binary MARC, MARCXML or MARC-in-JSON
+
+    Only the first bytes of the stream are looked at and the stream is left where it was.
+    A stream that can neither peek nor seek is taken to be binary MARC.
+
+    Args:
+        stream (File Object): an open binary stream
+
+    Returns:
+        str. marc, marcxml or json
+    """
+    if hasattr(stream, "peek"):
+        start = stream.peek(64)[:64]
+    elif hasattr(stream, "seekable") and stream.seekable():
+        position = stream.tell()
+        start = stream.read(64)
+        stream.seek(position)
+    else:
+        return "marc"
+    if start.startswith(_BYTE_ORDER_MARK):
+        start = start[len(_BYTE_ORDER_MARK):]
+    start = start.lstrip()
+    if start.startswith(b'<'):
+        return "marcxml"
+    if start.startswith(b'{'):
+        return "json"
+    return "marc"
+
+def _local_name(tag):
+    """a private function to drop the namespace from an element's tag
+
+    Args:
+        tag (str): an element tag. Ex. '{http://www.loc.gov/MARC21/slim}record'
+
+    Returns:
+        str. the tag without its namespace. Ex. 'record'
+    """
+    return tag.rpartition('}')[2]
+
+def record_from_element(element):
+    """a function to build a pymarc record from a MARCXML record element
+
+    Args:
+        element (Element): a record element
+
+    Returns:
+        pymarc.Record
+    """
+    record = Record(force_utf8=True)
+    for child in element:
+        name = _local_name(child.tag)
+        if name == 'leader':
+            record.leader = child.text or ''
+        elif name == 'controlfield':
+            record.add_field(Field(tag=child.get('tag'), data=child.text or ''))
+        elif name == 'datafield':
+            subfields = []
+            for subfield in child:
+                if _local_name(subfield.tag) == 'subfield':
+                    subfields += [subfield.get('code'), subfield.text or '']
+            record.add_field(Field(tag=child.get('tag'), indicators=[child.get('ind1', ' '), child.get('ind2', ' ')],
+                                   subfields=subfields))
+    return record
+
+def record_from_json(data):
+    """a function to build a pymarc record from a MARC-in-JSON object
+
+    Args:
+        data (dict): a record as MARC-in-JSON, the same shape as pymarc's Record.as_dict
+
+    Returns:
+        pymarc.Record
+    """
+    record = Record(force_utf8=True)
+    record.leader = data['leader']
+    for field in data['fields']:
+        (tag, value), = field.items()
+        if isinstance(value, dict):
+            subfields = []
+            for subfield in value['subfields']:
+                for code, subfield_value in subfield.items():
+                    subfields += [code, subfield_value]
+            record.add_field(Field(tag=tag, indicators=[value.get('ind1', ' '), value.get('ind2', ' ')],
+                                   subfields=subfields))
+        else:
+            record.add_field(Field(tag=tag, data=value))
+    return record
+
+def iter_marcxml_records(stream):
+    """a generator function to read the records of a MARCXML collection one at a time
+
+    Each record element is thrown away once it has been turned into a pymarc record, so the
+    whole collection never has to fit in memory. Reading stops at the first point where the
+    stream is not well-formed XML.
+
+    Args:
+        stream (File Object): an open binary stream of MARCXML
+
+    Returns:
+        generator. an iterable containing (position, record) tuples, ex. ('record 3', Record).
+            The record is None for a record that could not be read
+    """
+    root = None
+    count = 0
+    try:
+        for event, element in iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            if _local_name(element.tag) != 'record':
+                continue
+            count += 1
+            try:
+                record = record_from_element(element)
+            except (AttributeError, TypeError, ValueError):
+                record = None
+            yield ('record {}'.format(count), record)
+            element.clear()
+            if root is not element:
+                root.clear()
+    except ParseError as error:
+        yield ('line {}'.format(error.position[0]), None)
+
+def _iter_lines(stream, buffer_size=1024 * 1024):
+    """a private generator function to split a binary stream into lines, reading buffer_size bytes at a time
+
+    Args:
+        stream (File Object): an open binary stream. Only read is needed
+
+    Returns:
+        generator. an iterable containing each line without its line ending
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(buffer_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+def iter_json_records(stream):
+    """a generator function to read line-delimited MARC-in-JSON one record at a time
+
+    Blank lines are skipped.
+
+    Args:
+        stream (File Object): an open binary stream with one MARC-in-JSON record per line
+
+    Returns:
+        generator. an iterable containing (position, record) tuples, ex. ('line 3', Record).
+            The record is None for a line that could not be read
+    """
+    for number, line in enumerate(_iter_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = record_from_json(loads(line))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            record = None
+        yield ('line {}'.format(number), record)
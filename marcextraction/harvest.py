@@ -0,0 +1,193 @@
+"""incremental harvests of a Solr index that only fetch what changed since the last run
+"""
+
+from datetime import datetime, timedelta, timezone
+from json import dump, load
+from os import replace
+from os.path import exists
+
+SOLR_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+STATE_VERSION = 1
+
+class DeltaHarvester:
+    """a class to harvest the control numbers of records that changed since the last harvest
+
+    Each run filters the search on a last-modified field, from the previous run's high-water
+    mark up to the moment the run started, and pages through the results with cursorMark.
+    The first run has no lower bound and harvests everything.
+
+    Handing out a control number does not mean its record has been kept, so nothing moves
+    forward in the state file until commit is called. Call it once everything harvest has
+    handed out so far is safely stored. If the harvest ran to the end, the high-water mark
+    moves up to the start of the run. If it stopped part way, the cursor of the last page
+    handed out in full is kept, and the next harvest picks up the same run from there. A
+    run that is never committed is harvested again from its last commit.
+
+    A page that was being handed out when the harvest stopped is handed out again on resume,
+    so anything consuming the harvest should cope with seeing a control number twice.
+
+    Useage:
+        searcher = SolrIndexSearcher('http://your.domain/path/to/index', 'ole')
+        harvester = DeltaHarvester(searcher, '/var/lib/marc/banana.state.json', timestamp_field='last_indexed')
+        for control_number in harvester.harvest('banana', '245', ['a']):
+            ...
+        harvester.commit()
+    """
+    def __init__(self, searcher, state_path, timestamp_field="last_indexed", overlap=0, clock=None):
+        """initializes an instance of the class DeltaHarvester
+
+        Args:
+            searcher (SolrIndexSearcher): the searcher to run the harvest with
+            state_path (str): the JSON file to keep the high-water mark and cursor in
+
+        KWArgs:
+            timestamp_field (str): a date field that is set whenever a record is indexed. Default is VuFind's last_indexed.
+            overlap (float): seconds to reach back before the high-water mark, for records committed late. Default is 0.
+            clock (callable): returns the current time as an aware datetime. Default is datetime.now in UTC.
+        """
+        self.searcher = searcher
+        self.state_path = state_path
+        self.timestamp_field = timestamp_field
+        self.overlap = overlap
+        self.clock = clock if clock is not None else (lambda: datetime.now(timezone.utc))
+        self.state = self._load_state()
+        self._progress = None
+        self._finished = False
+
+    def _load_state(self):
+        """a private method to read the state file
+
+        Returns:
+            dict. the saved state, or a fresh one if there is no state file yet
+
+        Raises:
+            ValueError: if the state file was written by an incompatible version
+        """
+        if not exists(self.state_path):
+            return {"version": STATE_VERSION, "query": None, "high_water_mark": None, "run": None}
+        with open(self.state_path) as read_file:
+            state = load(read_file)
+        if state.get("version") != STATE_VERSION:
+            raise ValueError("unsupported harvest state version {} in {}".format(state.get("version"),
+                                                                                 self.state_path))
+        return state
+
+    def _save_state(self):
+        """a private method to write the state file
+
+        The state is written to a temporary file first and then moved into place so that a
+        crash while saving never leaves a corrupt state file behind.
+        """
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w") as write_file:
+            dump(self.state, write_file)
+        replace(temporary_path, self.state_path)
+
+    def _filter_query(self, since, until):
+        """a private method to build the filter query for a run
+
+        Args:
+            since (str): the Solr date of the previous high-water mark, or None for the first run
+            until (str): the Solr date the run started at
+
+        Returns:
+            str. a range filter that leaves since out and takes until in. Ex. 'last_indexed:{2020-01-01T00:00:00Z TO 2020-01-02T00:00:00Z]'
+        """
+        if since is None:
+            return "{}:[* TO {}]".format(self.timestamp_field, until)
+        if self.overlap:
+            since = (datetime.strptime(since, SOLR_DATE_FORMAT) -
+                     timedelta(seconds=self.overlap)).strftime(SOLR_DATE_FORMAT)
+        return "{}:{{{} TO {}]".format(self.timestamp_field, since, until)
+
+    def _start_run(self, query):
+        """a private method to pick up an unfinished run or start a new one
+
+        Args:
+            query (str): the Solr query string being harvested
+
+        Returns:
+            dict. the run: its filter query, its upper bound, its cursor and how many records it has handed out
+
+        Raises:
+            ValueError: if the state file belongs to a harvest of a different query
+        """
+        if self.state["query"] is not None and self.state["query"] != query:
+            raise ValueError("the state file {} belongs to a harvest of '{}', not '{}'".format(
+                self.state_path, self.state["query"], query))
+        if self.state["run"] is None:
+            until = self.clock().astimezone(timezone.utc).strftime(SOLR_DATE_FORMAT)
+            self.state["query"] = query
+            self.state["run"] = {"filter": self._filter_query(self.state["high_water_mark"], until),
+                                 "until": until, "cursor": "*", "harvested": 0}
+            self._save_state()
+        return self.state["run"]
+
+    def harvest(self, query_term, field, subfields, page_size=1000, phrase_search=False):
+        """a generator function to hand out the control numbers of the records changed since the last run
+
+        Nothing is saved as the control numbers are handed out; call commit once they are stored.
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            page_size (int): the number of records to fetch with each request. Default is 1000.
+            phrase_search (bool): whether to search for the full phrase. Default is False.
+
+        Returns:
+            generator. an iterable containing the controlfield_001 value of each changed record
+
+        Raises:
+            ValueError: if the state file belongs to a harvest of a different query
+        """
+        query = self.searcher.query_string(query_term, field, subfields, phrase_search=phrase_search)
+        run = self._start_run(query)
+        progress = dict(run)
+        self._progress = progress
+        self._finished = False
+        for control_numbers, next_cursor in self.searcher.iter_search_pages(query_term, field, subfields,
+                                                                            page_size=page_size,
+                                                                            phrase_search=phrase_search,
+                                                                            cursor=run["cursor"],
+                                                                            filter_query=run["filter"]):
+            for control_number in control_numbers:
+                yield control_number
+            progress["harvested"] += len(control_numbers)
+            if next_cursor:
+                progress["cursor"] = next_cursor
+        self._finished = True
+
+    def commit(self):
+        """a method to save how far the last harvest got, once everything it handed out has been stored
+
+        Do not call it if anything handed out was lost, ex. a record that could not be fetched
+        or written; the next harvest then repeats the run from its last commit instead.
+        """
+        if self._progress is None:
+            return
+        if self._finished:
+            self.state["high_water_mark"] = self._progress["until"]
+            self.state["last_harvested"] = self._progress["harvested"]
+            self.state["run"] = None
+        else:
+            self.state["run"] = self._progress
+        self._progress = None
+        self._finished = False
+        self._save_state()
+
+    def iter_search(self, query_term, field, subfields, page_size=1000, phrase_search=False):
+        """a method to run the harvest in place of SolrIndexSearcher.iter_search, ex. as an ExportPipeline's searcher
+
+        Returns:
+            generator. the same as harvest
+        """
+        return self.harvest(query_term, field, subfields, page_size=page_size, phrase_search=phrase_search)
+
+    def reset(self):
+        """a method to forget the high-water mark and any unfinished run, so the next harvest is a full one
+        """
+        self.state = {"version": STATE_VERSION, "query": None, "high_water_mark": None, "run": None}
+        self._save_state()
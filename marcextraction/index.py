@@ -0,0 +1,175 @@
+"""an inverted index from MARC field, subfield and token to record positions
+"""
+
+from array import array
+from bisect import bisect_left
+from re import compile as compile_pattern
+
+from .records import CompactRecord
+
+TOKEN_PATTERN = compile_pattern(r'\w+')
+
+def tokenize(text):
+    """a function to split a string into normalized tokens
+
+    Args:
+        text (str): a subfield value or a query term
+
+    Returns:
+        list. an iterable containing lowercased word tokens. Ex. 'Test book :' becomes ['test', 'book']
+    """
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+def iter_subfield_values(record):
+    """a generator function to return every subfield value in a MARC record
+
+    Args:
+        record (dict|CompactRecord): a MARC record as returned by pymarc's Record.as_dict, or a CompactRecord
+
+    Returns:
+        generator. an iterable containing (tag, subfield code, value) tuples
+    """
+    if isinstance(record, CompactRecord):
+        yield from record.iter_subfields()
+        return
+    for a_field in record.get("fields"):
+        for tag, field_data in a_field.items():
+            if not isinstance(field_data, dict):
+                continue
+            for subfield in field_data.get("subfields"):
+                for code, value in subfield.items():
+                    if value:
+                        yield (tag, code, value)
+
+class FieldTokenIndex:
+    """a class to map (tag, subfield code, token) to the positions of the records that contain it
+
+    The index only ever narrows a search down to candidate records. A candidate still has to
+    pass the usual substring test, so searching with the index returns exactly what a full
+    scan would.
+
+    Useage:
+        index = FieldTokenIndex()
+        for position, record in enumerate(records):
+            index.add(position, record)
+        index.candidates('Test book', '245', ['a'])
+    """
+    def __init__(self):
+        self.postings = {}
+        self._sorted_vocabularies = {}
+
+    def add(self, position, record):
+        """a method to add a record to the index
+
+        Records must be added in increasing position order.
+
+        Args:
+            position (int): the position of the record in the searcher's list of records
+            record (dict|CompactRecord): a MARC record
+        """
+        for tag, code, value in iter_subfield_values(record):
+            vocabulary = self.postings.setdefault((tag, code), {})
+            for token in tokenize(value):
+                positions = vocabulary.get(token)
+                if positions is None:
+                    vocabulary[token] = array('I', [position])
+                elif positions[-1] != position:
+                    positions.append(position)
+        self._sorted_vocabularies.clear()
+
+    def candidates(self, query_term, field, subfields):
+        """a method to find the positions of records that could contain the query term
+
+        Interior query tokens must match whole tokens, so they resolve straight from the posting
+        lists. The first and last tokens may be cut off by the substring boundary, so they also
+        match tokens ending or starting with them. A single token query falls back to a
+        substring scan of the field's vocabulary.
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string
+            subfields (list): a list of subfield codes related to the field that you want to search
+
+        Returns:
+            list. sorted record positions, or None if the query term has no tokens to look up
+        """
+        tokens = tokenize(query_term)
+        if not tokens:
+            return None
+        found = set()
+        for code in set(subfields):
+            vocabulary = self.postings.get((field, code))
+            if not vocabulary:
+                continue
+            matched = None
+            last = len(tokens) - 1
+            for n, token in enumerate(tokens):
+                positions = self._lookup((field, code), vocabulary, token, n == 0, n == last)
+                matched = positions if matched is None else matched & positions
+                if not matched:
+                    break
+            if matched:
+                found |= matched
+        return sorted(found)
+
+    def _lookup(self, key, vocabulary, token, may_start_inside, may_end_inside):
+        """a private method to collect the positions for a single query token
+
+        Args:
+            key (tuple): the (tag, subfield code) that vocabulary belongs to
+            vocabulary (dict): a mapping of token to positions for one tag and subfield code
+            token (str): a normalized query token
+            may_start_inside (bool): whether the token may be the tail end of an indexed token
+            may_end_inside (bool): whether the token may be the front of an indexed token
+
+        Returns:
+            set. the positions of every record with a matching token
+        """
+        if may_start_inside and may_end_inside:
+            words = [word for word in vocabulary if token in word]
+        elif may_end_inside:
+            words = self._with_prefix(self._sorted_vocabulary(key, vocabulary, False), token)
+        elif may_start_inside:
+            words = [word[::-1] for word in
+                     self._with_prefix(self._sorted_vocabulary(key, vocabulary, True), token[::-1])]
+        else:
+            words = [token] if token in vocabulary else []
+        positions = set()
+        for word in words:
+            positions.update(vocabulary[word])
+        return positions
+
+    def _sorted_vocabulary(self, key, vocabulary, reverse_words):
+        """a private method to get a sorted (and cached) list of the tokens in a vocabulary
+
+        Args:
+            key (tuple): the (tag, subfield code) that vocabulary belongs to
+            vocabulary (dict): a mapping of token to positions
+            reverse_words (bool): whether to sort the tokens spelled backwards for suffix lookups
+
+        Returns:
+            list. the sorted tokens
+        """
+        cache_key = (key, reverse_words)
+        words = self._sorted_vocabularies.get(cache_key)
+        if words is None:
+            words = sorted(word[::-1] if reverse_words else word for word in vocabulary)
+            self._sorted_vocabularies[cache_key] = words
+        return words
+
+    def _with_prefix(self, words, prefix):
+        """a private method to find every word in a sorted list that starts with a prefix
+
+        Args:
+            words (list): a sorted list of tokens
+            prefix (str): the prefix to look for
+
+        Returns:
+            list. the matching tokens
+        """
+        output = []
+        for word in words[bisect_left(words, prefix):]:
+            if not word.startswith(prefix):
+                break
+            output.append(word)
+        return output
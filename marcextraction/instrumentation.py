@@ -0,0 +1,239 @@
+"""the hooks the searchers and finders report their stage timings and counters to
+"""
+
+from random import Random
+from threading import Lock
+from time import perf_counter
+
+class _NullStage:
+    """a private class for the stage handed out when instrumentation is off; it does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, key, value=1):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class Instrumentation:
+    """a class to receive timings and counters from OnDiskSearcher, SolrIndexSearcher and the OLE finders
+
+    This base class is the default and throws everything away, so leaving instrumentation off
+    costs no more than an empty with block around each stage. Subclass it and override stage
+    and count to send the numbers somewhere else, or use MetricsAggregator.
+
+    Stages are named "<component>.<step>", ex. "ondisk.read" or "solr.request". Inside a stage,
+    add puts a number on it, ex. stage.add("bytes", 1024) or stage.add("http_200").
+
+    Useage:
+        class StatsdInstrumentation(Instrumentation):
+            enabled = True
+
+            def stage(self, name):
+                ...
+    """
+    enabled = False
+
+    def stage(self, name):
+        """a method to start timing one run of a stage
+
+        Args:
+            name (str): the name of the stage. Ex. ondisk.decode
+
+        Returns:
+            context manager. it times the with block and has an add(key, value=1) method
+        """
+        return _NULL_STAGE
+
+    def count(self, name, value=1):
+        """a method to bump a counter that does not belong to a timed stage
+
+        Args:
+            name (str): the name of the counter. Ex. solr.cache_hit
+
+        KWArgs:
+            value (int): how much to add. Default is 1.
+        """
+        pass
+
+NULL_INSTRUMENTATION = Instrumentation()
+
+class _TimedStage:
+    """a private class to time one run of a stage for a MetricsAggregator
+    """
+    __slots__ = ("aggregator", "name", "fields", "started")
+
+    def __init__(self, aggregator, name):
+        self.aggregator = aggregator
+        self.name = name
+        self.fields = {}
+        self.started = None
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.aggregator._record(self.name, perf_counter() - self.started, self.fields, exc_type is not None)
+        return False
+
+    def add(self, key, value=1):
+        self.fields[key] = self.fields.get(key, 0) + value
+
+class _StageStatistics:
+    """a private class to hold the running totals of one stage
+    """
+    __slots__ = ("calls", "errors", "total", "minimum", "maximum", "samples", "fields")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.samples = []
+        self.fields = {}
+
+class MetricsAggregator(Instrumentation):
+    """a class to collect per-stage timings and counters in memory and summarize them
+
+    Each stage keeps its call count, errors, total, minimum and maximum time and the sum of
+    every number added to it. Percentiles come from a random sample of at most max_samples
+    timings per stage, so memory use stays bounded on long runs. It is safe to share one
+    aggregator between threads.
+
+    Useage:
+        metrics = MetricsAggregator()
+        searcher = OnDiskSearcher(location='/path/to/marc/records', instrumentation=metrics)
+        searcher.search('banana', '245', ['a'])
+        print(metrics.report())
+    """
+    enabled = True
+
+    def __init__(self, max_samples=10000, seed=0):
+        """initializes an instance of the class MetricsAggregator
+
+        KWArgs:
+            max_samples (int): the most timings to keep per stage for the percentiles. Default is 10000.
+            seed (int): the seed for picking which timings are kept. Default is 0.
+        """
+        self.max_samples = max_samples
+        self.stages = {}
+        self.counters = {}
+        self._random = Random(seed)
+        self._lock = Lock()
+
+    def stage(self, name):
+        return _TimedStage(self, name)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _record(self, name, seconds, fields, failed):
+        """a private method to fold one run of a stage into its totals
+
+        Args:
+            name (str): the name of the stage
+            seconds (float): how long the run took
+            fields (dict): the numbers added to the run
+            failed (bool): whether the run ended with an exception
+        """
+        with self._lock:
+            statistics = self.stages.get(name)
+            if statistics is None:
+                statistics = self.stages[name] = _StageStatistics()
+            statistics.calls += 1
+            statistics.errors += 1 if failed else 0
+            statistics.total += seconds
+            if statistics.minimum is None or seconds < statistics.minimum:
+                statistics.minimum = seconds
+            if seconds > statistics.maximum:
+                statistics.maximum = seconds
+            if len(statistics.samples) < self.max_samples:
+                statistics.samples.append(seconds)
+            else:
+                slot = self._random.randrange(statistics.calls)
+                if slot < self.max_samples:
+                    statistics.samples[slot] = seconds
+            for key, value in fields.items():
+                statistics.fields[key] = statistics.fields.get(key, 0) + value
+
+    def summary(self):
+        """a method to summarize every stage and counter
+
+        Returns:
+            dict. "stages" maps each stage name to its calls, errors, total_seconds, mean_ms, min_ms,
+                p50_ms, p95_ms, p99_ms, max_ms and the totals of its added numbers; "counters" holds the counters
+        """
+        with self._lock:
+            stages = {}
+            for name, statistics in self.stages.items():
+                samples = sorted(statistics.samples)
+                entry = {
+                    "calls": statistics.calls,
+                    "errors": statistics.errors,
+                    "total_seconds": statistics.total,
+                    "mean_ms": 1000 * statistics.total / statistics.calls,
+                    "min_ms": 1000 * statistics.minimum,
+                    "p50_ms": 1000 * percentile(samples, 0.50),
+                    "p95_ms": 1000 * percentile(samples, 0.95),
+                    "p99_ms": 1000 * percentile(samples, 0.99),
+                    "max_ms": 1000 * statistics.maximum,
+                }
+                entry.update(statistics.fields)
+                stages[name] = entry
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def report(self):
+        """a method to lay the summary out as a table, the slowest stage first
+
+        Returns:
+            str. one line per stage and one per counter
+        """
+        summary = self.summary()
+        lines = ["{:<24} {:>8} {:>6} {:>10} {:>9} {:>9} {:>9}  {}".format(
+            "stage", "calls", "errors", "total_s", "mean_ms", "p95_ms", "max_ms", "totals")]
+        ordered = sorted(summary["stages"].items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+        for name, entry in ordered:
+            extras = " ".join("{}={}".format(key, value) for key, value in sorted(entry.items())
+                              if key not in _SUMMARY_KEYS)
+            lines.append("{:<24} {:>8} {:>6} {:>10.3f} {:>9.3f} {:>9.3f} {:>9.3f}  {}".format(
+                name, entry["calls"], entry["errors"], entry["total_seconds"], entry["mean_ms"],
+                entry["p95_ms"], entry["max_ms"], extras).rstrip())
+        for name, value in sorted(summary["counters"].items()):
+            lines.append("{:<24} {:>8}".format(name, value))
+        return "\n".join(lines)
+
+    def reset(self):
+        """a method to throw away everything collected so far
+        """
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+
+_SUMMARY_KEYS = frozenset(["calls", "errors", "total_seconds", "mean_ms", "min_ms", "p50_ms", "p95_ms", "p99_ms",
+                           "max_ms"])
+
+def percentile(ordered, fraction):
+    """a function to find a percentile of sorted timings by linear interpolation
+
+    Args:
+        ordered (list): the timings, sorted
+        fraction (float): the percentile as a fraction. Ex. 0.95
+
+    Returns:
+        float. the percentile, or 0.0 if there are no timings
+    """
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * fraction
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
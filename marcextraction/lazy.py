@@ -0,0 +1,48 @@
+"""importing the module behind a public name only when the name is first used
+"""
+
+from importlib import import_module
+from sys import modules
+from types import ModuleType
+
+class LazyModule(ModuleType):
+    """a class for a module whose public names are imported from other modules the first time they are looked up
+
+    Python 3.6 does not call a module level __getattr__ (PEP 562), so the module's class is
+    swapped for this one instead, which works on every Python 3 this package supports.
+
+    Useage:
+        lazy_exports(__name__, {"OnDiskSearcher": "ondisk"})
+    """
+    def __getattr__(self, name):
+        """a method to import the module behind a public name the first time it is looked up
+
+        Args:
+            name (str): the name being looked up
+
+        Returns:
+            object. the class, function or constant from its module
+
+        Raises:
+            AttributeError: if the module does not export the name
+        """
+        source = self.__dict__.get("_lazy_exports", {}).get(name)
+        if source is None:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+        value = getattr(import_module("." + source, self.__package__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self.__dict__.get("_lazy_exports", {})))
+
+def lazy_exports(module_name, exports):
+    """a function to make a module import its public names from sibling modules on first use
+
+    Args:
+        module_name (str): the __name__ of the module
+        exports (dict): the name of the sibling module each public name comes from. Ex. {"OnDiskSearcher": "ondisk"}
+    """
+    module = modules[module_name]
+    module._lazy_exports = exports
+    module.__class__ = LazyModule
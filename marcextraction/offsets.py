@@ -0,0 +1,269 @@
+"""an offset index for fetching single records out of a large MARC file by control number
+"""
+
+from array import array
+from mmap import ACCESS_READ, mmap
+from os import stat
+from struct import Struct
+from sys import byteorder
+
+from pymarc import Record, record_to_xml
+
+END_OF_FIELD = b'\x1e'
+END_OF_RECORD = b'\x1d'
+HEADER = Struct('<4sIQQq')
+MAGIC = b'MXCN'
+
+def _signature(marc_path):
+    """a function to get the size and modification time of a MARC file, to tell whether an index still fits it
+
+    Args:
+        marc_path (str): the location of a MARC file
+
+    Returns:
+        tuple. the size in bytes and the modification time in nanoseconds
+    """
+    info = stat(marc_path)
+    return (info.st_size, info.st_mtime_ns)
+
+class ControlNumberIndex:
+    """a class to look up single MARC records in a file by the value of their 001 field
+
+    The index is built by walking the 24 byte leader and the directory of each record in a
+    memory-mapped file, so no record is decoded while building it. A lookup seeks straight
+    to the record and decodes only that one record. get_record answers the same way
+    OLERecordFinder.get_record does, with the record as MARCXML.
+
+    The size and modification time of the MARC file are saved with the index. An index that
+    no longer fits its MARC file is rejected (or rebuilt) by load, and lookups fail rather than
+    hand back the wrong bytes if the file changes while the index is in use.
+
+    Useage:
+        index = ControlNumberIndex.build('/path/to/dump.mrc')
+        index.save('/path/to/dump.mrc.idx')
+
+        index = ControlNumberIndex.load('/path/to/dump.mrc.idx', '/path/to/dump.mrc')
+        is_it_there, data = index.get_record('1003495521')
+        if is_it_there:
+            return data
+    """
+    version = 2
+
+    def __init__(self, marc_path, control_numbers, offsets, lengths, signature=None):
+        """initializes an instance of the class ControlNumberIndex
+
+        Args:
+            marc_path (str): the location of the MARC file the index points into
+            control_numbers (list): the 001 value of each record, in file order
+            offsets (array): the byte offset of each record
+            lengths (array): the byte length of each record
+
+        KWArgs:
+            signature (tuple): the size and modification time of the MARC file the index was built from.
+                Default is the file as it is now.
+        """
+        self.marc_path = marc_path
+        self.signature = signature if signature is not None else _signature(marc_path)
+        self.control_numbers = control_numbers
+        self.offsets = offsets
+        self.lengths = lengths
+        self.errors = []
+        self._positions = None
+        self._marc_file = None
+        self._marc_map = None
+
+    @classmethod
+    def build(cls, marc_path):
+        """a method to build an index by walking the leaders of every record in a MARC file
+
+        A record without a 001 field is left out of the index. A chunk that does not look like a
+        MARC record is noted in errors and skipped up to the next record terminator.
+
+        Args:
+            marc_path (str): the location of a binary MARC file
+
+        Returns:
+            ControlNumberIndex
+        """
+        control_numbers = []
+        offsets = array('Q')
+        lengths = array('I')
+        errors = []
+        signature = _signature(marc_path)
+        if not signature[0]:
+            return cls(marc_path, control_numbers, offsets, lengths, signature=signature)
+        with open(marc_path, 'rb') as marc_file, mmap(marc_file.fileno(), 0, access=ACCESS_READ) as data:
+            position = 0
+            size = len(data)
+            while position < size:
+                leader = data[position:position + 24]
+                length = int(leader[:5]) if leader[:5].isdigit() else 0
+                base_address = int(leader[12:17]) if leader[12:17].isdigit() else 0
+                if length < 24 or base_address < 24 or data[position + length - 1:position + length] != END_OF_RECORD:
+                    errors.append("not a valid MARC record at byte {}".format(position))
+                    next_end = data.find(END_OF_RECORD, position)
+                    if next_end == -1:
+                        break
+                    position = next_end + 1
+                    continue
+                control_number = cls._find_control_number(data, position, base_address)
+                if control_number is not None:
+                    control_numbers.append(control_number)
+                    offsets.append(position)
+                    lengths.append(length)
+                position += length
+        index = cls(marc_path, control_numbers, offsets, lengths, signature=signature)
+        index.errors = errors
+        return index
+
+    @staticmethod
+    def _find_control_number(data, position, base_address):
+        """a private method to read the 001 value of a record through its directory
+
+        Args:
+            data (mmap): the memory-mapped MARC file
+            position (int): the byte offset of the record
+            base_address (int): the base address of the record's data, from its leader
+
+        Returns:
+            str. the 001 value, or None if the record has no 001 field
+        """
+        directory_end = position + base_address - 1
+        for entry in range(position + 24, directory_end, 12):
+            if data[entry:entry + 3] == b'001':
+                if not data[entry + 3:entry + 12].isdigit():
+                    return None
+                field_length = int(data[entry + 3:entry + 7])
+                field_start = position + base_address + int(data[entry + 7:entry + 12])
+                value = data[field_start:field_start + field_length].rstrip(END_OF_FIELD)
+                return value.decode('utf-8', 'replace').strip()
+        return None
+
+    def save(self, index_path):
+        """a method to write the index to disk in a compact binary form
+
+        The file holds a small header with the size and modification time of the MARC file, the
+        offsets as unsigned 64 bit integers, the lengths as unsigned 32 bit integers and then the
+        control numbers separated by newlines.
+
+        Args:
+            index_path (str): the location to write the index to
+        """
+        offsets = array('Q', self.offsets)
+        lengths = array('I', self.lengths)
+        if byteorder == 'big':
+            offsets.byteswap()
+            lengths.byteswap()
+        with open(index_path, 'wb') as write_file:
+            write_file.write(HEADER.pack(MAGIC, self.version, len(self.control_numbers), *self.signature))
+            offsets.tofile(write_file)
+            lengths.tofile(write_file)
+            write_file.write('\n'.join(self.control_numbers).encode('utf-8'))
+
+    @classmethod
+    def load(cls, index_path, marc_path, rebuild=False):
+        """a method to read an index written by save
+
+        Args:
+            index_path (str): the location of the saved index
+            marc_path (str): the location of the MARC file the index points into
+
+        KWArgs:
+            rebuild (bool): whether to build and save the index again if the MARC file has changed since it was
+                saved, instead of raising. Default is False.
+
+        Returns:
+            ControlNumberIndex
+
+        Raises:
+            ValueError: if the file is not a control number index, or the MARC file has changed and rebuild is False
+        """
+        with open(index_path, 'rb') as read_file:
+            header = read_file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError("{} is not a control number index".format(index_path))
+            magic, version, total, size, mtime = HEADER.unpack(header)
+            if magic != MAGIC or version != cls.version:
+                raise ValueError("{} is not a control number index".format(index_path))
+            if (size, mtime) != _signature(marc_path):
+                if not rebuild:
+                    raise ValueError("{} has changed since {} was built".format(marc_path, index_path))
+                index = cls.build(marc_path)
+                index.save(index_path)
+                return index
+            offsets = array('Q')
+            offsets.fromfile(read_file, total)
+            lengths = array('I')
+            lengths.fromfile(read_file, total)
+            control_numbers = read_file.read().decode('utf-8').split('\n') if total else []
+        if byteorder == 'big':
+            offsets.byteswap()
+            lengths.byteswap()
+        return cls(marc_path, control_numbers, offsets, lengths, signature=(size, mtime))
+
+    def count(self):
+        """a method to return the total number of records in the index
+
+        Returns:
+            int. total records indexed
+        """
+        return len(self.control_numbers)
+
+    def get_raw(self, control_number):
+        """a method to get the undecoded bytes of a record
+
+        Args:
+            control_number (str): the 001 value of the record
+
+        Returns:
+            bytes. the record in transmission format, or None if it is not in the index
+
+        Raises:
+            ValueError: if the MARC file has changed since the index was built, checked on every lookup
+        """
+        if self._positions is None:
+            self._positions = {}
+            for position, number in enumerate(self.control_numbers):
+                self._positions.setdefault(number, position)
+        position = self._positions.get(control_number)
+        if position is None:
+            return None
+        if _signature(self.marc_path) != self.signature:
+            raise ValueError("{} has changed since the index was built".format(self.marc_path))
+        if self._marc_map is None:
+            self._marc_file = open(self.marc_path, 'rb')
+            self._marc_map = mmap(self._marc_file.fileno(), 0, access=ACCESS_READ)
+        offset = self.offsets[position]
+        return self._marc_map[offset:offset + self.lengths[position]]
+
+    def get_record(self, control_number):
+        """a public method to get the matching record (if one is in the index)
+
+        The answer has the same shape as OLERecordFinder.get_record's, so an index can stand in
+        for the OLE API.
+
+        Args:
+            control_number (str): the 001 value of the record
+
+        Returns:
+            tuple. first element is boolean result, second is a list holding the record as MARCXML bytes or None
+        """
+        raw = self.get_raw(control_number)
+        if raw is None:
+            return (False, None)
+        return (True, [record_to_xml(Record(data=raw), namespace=True)])
+
+    def close(self):
+        """a method to release the memory map of the MARC file
+        """
+        if self._marc_map is not None:
+            self._marc_map.close()
+            self._marc_file.close()
+            self._marc_map = None
+            self._marc_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
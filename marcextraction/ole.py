@@ -0,0 +1,355 @@
+"""the OLE backend, for fetching MARC records from the OLE SRU API
+"""
+
+from lxml.etree import QName, XML, XMLSyntaxError, cleanup_namespaces, iterparse, tostring as XML_to_string
+from requests import Session, get
+from requests.exceptions import RequestException
+from urllib.parse import ParseResult, quote
+from urllib3.exceptions import HTTPError
+
+from .instrumentation import NULL_INSTRUMENTATION
+
+SRU_NAMESPACE = "{http://www.loc.gov/zing/srw/}"
+
+def _build_sru_url(ole_domain, ole_scheme, ole_path, query, maximum_records):
+    """a function to build the URL for an SRU searchRetrieve request
+
+    Args:
+        ole_domain (str): the domain of the OLE SRU app
+        ole_scheme (str): http or https
+        ole_path (str): the path to the OLE SRU app
+        query (str): a CQL query. Ex. 'id=1003495521'
+        maximum_records (int): the most records the response should hold
+
+    Returns:
+        str. a complete URL
+    """
+    query_string = "version=1.2&operation=searchRetrieve&query={}&startRecord=1&maximumRecords={}".format(
+        quote(query), maximum_records)
+    url_object = ParseResult(scheme=ole_scheme, netloc=ole_domain,
+                             path=ole_path, query=query_string, params="", fragment="")
+    return url_object.geturl()
+
+def _iter_sru_records(stream):
+    """a generator function to pull the MARCXML records out of an SRU response in one pass
+
+    The response is parsed incrementally as it is read, and each SRU record is cleared once its
+    MARCXML has been serialized, so only one record is held in memory at a time.
+
+    Args:
+        stream (File Object): the body of an SRU searchRetrieve response
+
+    Returns:
+        generator. an iterable containing each record as MARCXML bytes with blank text removed
+    """
+    for _, sru_record in iterparse(stream, events=("end",), tag=SRU_NAMESPACE + "record", remove_blank_text=True):
+        record_data = sru_record.find(SRU_NAMESPACE + "recordData")
+        if record_data is not None:
+            for record in record_data:
+                if isinstance(record.tag, str) and QName(record).localname == "record":
+                    record_data.remove(record)
+                    cleanup_namespaces(record)
+                    yield XML_to_string(record)
+                    break
+        sru_record.clear()
+        while sru_record.getprevious() is not None:
+            del sru_record.getparent()[0]
+
+def _iter_sru_records_and_close(response, instrumentation=NULL_INSTRUMENTATION):
+    """a generator function to stream the MARCXML records out of an SRU response and then close it
+
+    Args:
+        response (requests.Response): a response requested with stream=True
+
+    KWArgs:
+        instrumentation (Instrumentation): where to report the time spent parsing each record. Default is none.
+
+    Returns:
+        generator. an iterable containing each record as MARCXML bytes
+    """
+    try:
+        response.raw.decode_content = True
+        if not instrumentation.enabled:
+            yield from _iter_sru_records(response.raw)
+            return
+        records = _iter_sru_records(response.raw)
+        while True:
+            with instrumentation.stage("ole.parse") as stage:
+                record = next(records, None)
+                if record is not None:
+                    stage.add("records")
+                    stage.add("bytes", len(record))
+            if record is None:
+                return
+            yield record
+    finally:
+        response.close()
+
+def _stream_sru_records(response, instrumentation=NULL_INSTRUMENTATION):
+    """a function to read the MARCXML records out of a streamed SRU response and close it
+
+    Args:
+        response (requests.Response): a response requested with stream=True
+
+    KWArgs:
+        instrumentation (Instrumentation): where to report the time spent parsing each record. Default is none.
+
+    Returns:
+        list. an iterable containing each record as MARCXML bytes
+    """
+    return list(_iter_sru_records_and_close(response, instrumentation))
+
+def _find_control_number(marcxml):
+    """a function to find the 001 value of a MARCXML record
+
+    Args:
+        marcxml (bytes): a single MARCXML record
+
+    Returns:
+        str. the control number, or None if the record has no 001 field
+    """
+    for element in XML(marcxml).iter():
+        if isinstance(element.tag, str) and element.tag.rsplit('}', 1)[-1] == 'controlfield' \
+                and element.get('tag') == '001':
+            return (element.text or '').strip()
+    return None
+
+class OLERecordFinder:
+    """a class to use for finding a particular MARC record from the OLE API
+
+    Passing cache=OLERecordCache(...) answers from the cache when it has the bibnumber and
+    stores what comes back from OLE when it does not.
+
+    Useage:
+        finder = OLERecordFinder("1003495521", "https://example.com/oledocstore")
+        is_it_there, data = finder.get_record()
+        if is_it_there:
+            return data
+    """
+    def __init__(self, bibnumber, ole_domain, ole_scheme, ole_path, session=None, instrumentation=None,
+                 cache=None):
+        self.identifier = bibnumber
+        self.session = session
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self.cache = cache
+        self.records = self._find_cached_record(ole_domain, ole_scheme, ole_path, bibnumber)
+
+    def _find_cached_record(self, ole_domain, ole_scheme, ole_path, bibnumber):
+        """a private method to take the record from the cache, or fetch it and put it in the cache
+
+        Returns:
+            list. the MARCXML records found, or None if the request failed
+        """
+        if self.cache is None:
+            return self._find_record(ole_domain, ole_scheme, ole_path, bibnumber)
+        record = self.cache.get(bibnumber)
+        if record is not None:
+            self.instrumentation.count("ole.cache_hit")
+            return [record]
+        self.instrumentation.count("ole.cache_miss")
+        records = self._find_record(ole_domain, ole_scheme, ole_path, bibnumber)
+        if records:
+            self.cache.put(bibnumber, records[0])
+        return records
+
+    def _find_record(self, ole_domain, ole_scheme, ole_path, bibnumber):
+        url = _build_sru_url(ole_domain, ole_scheme, ole_path, "id={}".format(self.identifier), 1)
+        with self.instrumentation.stage("ole.request") as stage:
+            data = self.session.get(url, stream=True) if self.session is not None else get(url, stream=True)
+            stage.add("http_{}".format(data.status_code))
+        if data.status_code == 200:
+            return _stream_sru_records(data, self.instrumentation)
+        else:
+            data.close()
+            return None
+
+    def get_record(self):
+        """a public method to get the matching record (if one was found for the inputted bibnumber)
+
+        Returns:
+            tuple. first element is boolean result 
+        """
+        if self.records:
+            return (True, self.records)
+        else:
+            return (False, None)
+
+class OLEBatchRecordFinder:
+    """a class to use for finding many MARC records from the OLE API with as few requests as possible
+
+    Bibnumbers are packed batch_size at a time into OR'ed SRU queries which all go over one
+    keep-alive session. With a cache, only the bibnumbers of a batch that the cache does not
+    have are asked for, and the records that come back are stored in it.
+
+    Useage:
+        finder = OLEBatchRecordFinder("example.com", "https", "/oledocstore", batch_size=50)
+        for bibnumber, record in finder.find(["1003495521", "1003495522"]):
+            ...
+        finder.not_found
+    """
+    def __init__(self, ole_domain, ole_scheme, ole_path, batch_size=50, maximum_records=None, session=None,
+                 instrumentation=None, cache=None):
+        """initializes an instance of the class OLEBatchRecordFinder
+
+        Args:
+            ole_domain (str): the domain of the OLE SRU app
+            ole_scheme (str): http or https
+            ole_path (str): the path to the OLE SRU app
+
+        KWArgs:
+            batch_size (int): how many bibnumbers go into each SRU query. Default is 50.
+            maximum_records (int): the maximumRecords of each SRU query. Default is the batch size. It can not be
+                smaller than the batch size, or OLE would leave records out of a batch's response.
+            session (requests.Session): a session to send the requests over. A new one is made by default.
+            instrumentation (Instrumentation): where to report request and parsing timings. Default is none.
+            cache (OLERecordCache): a cache of records to check before asking OLE. Default is none.
+
+        Raises:
+            ValueError: if maximum_records is smaller than batch_size
+        """
+        if maximum_records is not None and maximum_records < batch_size:
+            raise ValueError("maximum_records {} is smaller than the batch size {}".format(maximum_records,
+                                                                                          batch_size))
+        self.ole_domain = ole_domain
+        self.ole_scheme = ole_scheme
+        self.ole_path = ole_path
+        self.batch_size = batch_size
+        self.maximum_records = maximum_records
+        self.session = session if session is not None else Session()
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self.cache = cache
+        self.not_found = []
+        self.errors = []
+
+    def _batches(self, bibnumbers):
+        """a generator function to group bibnumbers into batches
+
+        Args:
+            bibnumbers (iterable): the bibnumbers to find
+
+        Returns:
+            generator. an iterable containing lists of at most batch_size bibnumbers
+        """
+        batch = []
+        for bibnumber in bibnumbers:
+            batch.append(str(bibnumber))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _build_query(self, batch):
+        """a method to build the OR'ed CQL query for a batch
+
+        Args:
+            batch (list): a list of bibnumbers
+
+        Returns:
+            str. a CQL query. Ex. 'id=1003495521 OR id=1003495522'
+        """
+        return " OR ".join("id={}".format(bibnumber) for bibnumber in batch)
+
+    def _find_batch(self, batch):
+        """a method to send the SRU request for one batch
+
+        Args:
+            batch (list): a list of bibnumbers
+
+        Returns:
+            generator. an iterable containing MARCXML records as they are parsed, or None if the request failed
+        """
+        url = _build_sru_url(self.ole_domain, self.ole_scheme, self.ole_path, self._build_query(batch),
+                             self.maximum_records or len(batch))
+        try:
+            with self.instrumentation.stage("ole.request") as stage:
+                data = self.session.get(url, stream=True)
+                stage.add("http_{}".format(data.status_code))
+        except RequestException as error:
+            self.errors.append("{} for the batch starting with {}".format(error, batch[0]))
+            return None
+        if data.status_code == 200:
+            return _iter_sru_records_and_close(data, self.instrumentation)
+        data.close()
+        self.errors.append("HTTP {} for the batch starting with {}".format(data.status_code, batch[0]))
+        return None
+
+    def find(self, bibnumbers):
+        """a generator function to find the records for many bibnumbers
+
+        Pairs are yielded batch by batch as the responses arrive. Any bibnumber that had no
+        record in its batch's response is added to not_found. A batch whose request fails, or
+        whose response breaks off, is noted in errors instead and the next batch is tried.
+
+        Args:
+            bibnumbers (iterable): the bibnumbers to find
+
+        Returns:
+            generator. an iterable containing (bibnumber, MARCXML record) tuples
+        """
+        for batch in self._batches(bibnumbers):
+            cached, batch = self._split_cached(batch)
+            yield from cached
+            if batch:
+                yield from self._remember(self._match_batch(batch, self._find_batch(batch)))
+
+    def _split_cached(self, batch):
+        """a method to take the records the cache already has out of a batch
+
+        Args:
+            batch (list): a list of bibnumbers
+
+        Returns:
+            tuple. a list of (bibnumber, MARCXML record) tuples from the cache and a list of the bibnumbers left to fetch
+        """
+        if self.cache is None:
+            return ([], batch)
+        found = self.cache.get_many(batch)
+        self.instrumentation.count("ole.cache_hit", len(found))
+        self.instrumentation.count("ole.cache_miss", len(batch) - len(found))
+        return ([(bibnumber, found[bibnumber]) for bibnumber in batch if bibnumber in found],
+                [bibnumber for bibnumber in batch if bibnumber not in found])
+
+    def _remember(self, pairs):
+        """a generator function to pass records through and store them in the cache once they have all gone by
+
+        Args:
+            pairs (iterable): (bibnumber, MARCXML record) tuples
+
+        Returns:
+            generator. the same tuples
+        """
+        if self.cache is None:
+            yield from pairs
+            return
+        found = []
+        for pair in pairs:
+            found.append(pair)
+            yield pair
+        self.cache.put_many(found)
+
+    def _match_batch(self, batch, records):
+        """a generator function to pair the records of a response with the bibnumbers of its batch
+
+        Args:
+            batch (list): the bibnumbers that were asked for
+            records (iterable): the MARCXML records that came back, or None
+
+        Returns:
+            generator. an iterable containing (bibnumber, MARCXML record) tuples. The bibnumbers
+                without a record go to not_found, unless the request failed (records is None) or
+                the response broke off, which are noted in errors instead
+        """
+        if records is None:
+            return
+        wanted = set(batch)
+        try:
+            for record in records:
+                bibnumber = _find_control_number(record)
+                if bibnumber in wanted:
+                    wanted.discard(bibnumber)
+                    yield (bibnumber, record)
+        except (RequestException, HTTPError, XMLSyntaxError) as error:
+            self.errors.append("{} while reading the batch starting with {}".format(error, batch[0]))
+            return
+        self.not_found += [bibnumber for bibnumber in batch if bibnumber in wanted]
@@ -0,0 +1,740 @@
+"""the on-disk backend, for loading and searching exported MARC files
+
+The process pool, the record cache and the columnar store are imported the first time they
+are used, so a plain load or search does not pay for them.
+"""
+
+from io import BytesIO
+from itertools import islice, repeat
+from os import scandir
+from os.path import abspath, exists, getsize, isfile, isdir
+from pymarc import Record
+
+from .compression import DecompressionError, ReadaheadReader, decompress_stream, open_marc_file
+from .formats import detect_format, iter_json_records, iter_marcxml_records
+from .index import FieldTokenIndex
+from .instrumentation import NULL_INSTRUMENTATION
+from .query import CompiledQuery, compile_query
+from .records import CompactRecord, iter_raw_records
+
+END_OF_RECORD = b'\x1d'
+
+_END_OF_STREAM = object()
+
+class OnDiskSearcher:
+    """a class to use for building up a list of exported MARC files at a particular location on-disk
+
+    Useage:
+        searcher  = OnDiskSeacher(location='/path/to/marc/records')
+        searcher.search('Cartographic Mathematical Data', 'Spatial coordinates')
+
+    Passing index=True builds a FieldTokenIndex once at load time so that each search only has
+    to look at records that contain the query's tokens in the requested field and subfields.
+
+    Passing cache=True keeps the parsed records of a directory in a cache file under the
+    user's cache directory (or pass a path to the cache file instead). Later loads only
+    reparse files whose size or modification time changed and drop files that were deleted.
+    Files named like a cache file (cache_name and its siblings) are never read as records.
+
+    Passing workers=N parses the files of a directory corpus in a pool of N worker processes.
+
+    Passing compact=True keeps each record as a CompactRecord, its raw bytes plus an array of
+    subfield positions, instead of a nest of dictionaries. Search results are then CompactRecords
+    too; call as_dict() or as_record() on them to get the full record.
+
+    A single file or a file-like object is read through a fixed-size buffer, one record at a
+    time, so a file of many gigabytes never has to fit in memory. A chunk that is not a valid
+    MARC record is skipped and noted in errors with its byte offset, and loading carries on
+    with the next record.
+
+    Besides binary MARC, files and streams can hold a MARCXML collection or MARC-in-JSON with
+    one record per line. The format is told from the first bytes and the records are read one
+    at a time, so a MARCXML collection is never parsed into one big tree.
+
+    Files compressed with gzip, bzip2 or xz (ex. records.mrc.gz) are recognized by their first
+    bytes and decompressed on the fly, in a background thread, straight into the MARC reader.
+    No temporary files are written. With workers=N, whole files are decompressed in parallel.
+
+    Passing streaming=True keeps only the source location (or file-like object) on the instance.
+    Records are then parsed one at a time every time search is called, so memory use stays flat
+    no matter how big the corpus is. A file-like object is read again from where it started on
+    every call, so one that can not seek can only be searched or counted once.
+
+        searcher = OnDiskSearcher(location='/path/to/marc/records', streaming=True)
+        for record in searcher.search('banana', '245', ['a']):
+            ...
+
+    query takes a boolean query over several fields at once and returns each matching record once.
+
+        searcher.query('245a:banana AND 650a:fruit* AND NOT 590', ignore_case=True)
+
+    project copies chosen subfields into a ColumnarStore for fast bulk filters and counts.
+
+        store = searcher.project(['040a', '260c'])
+        store.group_count('040a', record_ids=store.between('260c', 1900, 1950))
+
+    Passing instrumentation=MetricsAggregator() (or any Instrumentation) reports how long each
+    stage takes: scandir, reading files, decoding MARC, as_dict, building the index and searching.
+    """
+    # files starting with this name are record caches (and their -journal or .tmp siblings), not records
+    cache_name = ".marcextraction.cache"
+    chunk_size = 8 * 1024 * 1024
+    buffer_size = 1024 * 1024
+    batch_size = 1000
+
+    def __init__(self, writeable_object=None, location=None, streaming=False, index=False, cache=None,
+                 workers=None, compact=False, instrumentation=None):
+        if streaming and index:
+            raise ValueError("an index cannot be built in streaming mode")
+        if streaming and cache:
+            raise ValueError("records cannot be cached in streaming mode")
+        if streaming and compact:
+            raise ValueError("compact records are only kept for loaded corpora, not in streaming mode")
+        self.errors = []
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self.streaming = streaming
+        self.compact = compact
+        self.index = None
+        self.records = []
+        self.total = 0
+        self._source_start = None
+        self._source_read = False
+        if location and not exists(location):
+            self.errors.append("no such location {}".format(location))
+        if streaming:
+            self.location = location if location and exists(location) else None
+            self.source = writeable_object if not self.location else None
+            self.records = None
+            self.total = None
+            if self.source is not None and self.source.seekable():
+                self._source_start = self.source.tell()
+        elif location and exists(location):
+            self.records = self._build_list_of_records(location, cache=cache, workers=workers)
+            self.total = len(self.records)
+        elif writeable_object:
+            stream = decompress_stream(writeable_object)
+            self.records = self._load_records(stream)
+            self.total = len(self.records)
+            if stream is not writeable_object:
+                stream.close()
+        if index:
+            self.index = self._build_index(self.records)
+
+    def _check_if_real_marc_record(self, some_bytes, source=None):
+        """a method to check of a chunk of bytes is in fact a MARC record
+
+        Returns a tuple, first element is True|False evaluating whether any MARC records were found and
+        second element is either None or a list of MARC records if first element is True. Chunks
+        that are not MARC records are skipped and noted in errors.
+
+        :param some_bytes: a chunk of binary data
+        :param source: where the bytes came from, for the error messages
+
+        :rtype tuple
+        """
+        with self.instrumentation.stage("ondisk.decode") as stage, BytesIO(some_bytes) as read_file:
+            records = list(self._read_records(read_file, source=source))
+            stage.add("records", len(records))
+        if records or not some_bytes:
+            return (True, records)
+        return (False, None)
+
+    def _check_if_real_compact_records(self, some_bytes, source=None):
+        """a method to split a chunk of bytes into compact MARC records
+
+        Works like _check_if_real_marc_record, but the records are cut straight out of the
+        bytes by their leaders instead of being decoded with pymarc.
+
+        :param some_bytes: a chunk of binary data
+        :param source: where the bytes came from, for the error messages
+
+        :rtype tuple
+        """
+        with self.instrumentation.stage("ondisk.decode") as stage, BytesIO(some_bytes) as read_file:
+            records = list(self._read_records(read_file, compact=True, source=source))
+            stage.add("records", len(records))
+        if records or not some_bytes:
+            return (True, records)
+        return (False, None)
+
+    def _read_records(self, stream, compact=False, source=None):
+        """a generator function to parse MARC records one at a time from a binary stream
+
+        The stream can hold binary MARC, MARCXML or line-delimited MARC-in-JSON. It is read
+        through a buffer, not all at once. A chunk that is not a valid MARC record, or a record
+        that can not be decoded, is skipped and noted in errors.
+        A compressed stream that turns out to be corrupt or cut short is noted in errors and
+        the records before the damage are kept.
+
+        Args:
+            stream (File Object): an open binary stream
+
+        KWArgs:
+            compact (bool): whether to return CompactRecords instead of pymarc records
+            source (str): where the stream came from, for the error messages. Default is the stream's name, if it has one
+
+        Returns:
+            generator. an iterable containing pymarc Record objects (or CompactRecords)
+        """
+        if source is None:
+            source = getattr(stream, "name", None)
+        decoded = self._decode_stream(stream, compact=compact)
+        while True:
+            try:
+                position, record = next(decoded)
+            except StopIteration:
+                return
+            except DecompressionError as error:
+                self.errors.append(str(error))
+                return
+            if record is None:
+                msg = "not a valid MARC record at {}".format(position)
+                if source is not None:
+                    msg += " of {}".format(source)
+                self.errors.append(msg)
+                continue
+            yield record
+
+    def _decode_stream(self, stream, compact=False):
+        """a private generator function to decode each record of a stream in whichever format it is in
+
+        Args:
+            stream (File Object): an open binary stream
+
+        KWArgs:
+            compact (bool): whether to return CompactRecords instead of pymarc records
+
+        Returns:
+            generator. an iterable containing (position, record) tuples, ex. ('byte 1024', Record).
+                The record is None for a record that could not be decoded
+        """
+        record_format = detect_format(stream)
+        if record_format == "marc":
+            for offset, raw in iter_raw_records(stream, self.buffer_size):
+                record = None
+                if raw is not None:
+                    try:
+                        record = CompactRecord(raw) if compact else Record(data=raw)
+                    except Exception:
+                        # pymarc raises a different exception for each part of a record it can not read
+                        record = None
+                yield ("byte {}".format(offset), record)
+            return
+        records = iter_marcxml_records(stream) if record_format == "marcxml" else iter_json_records(stream)
+        for position, record in records:
+            if record is not None and compact:
+                try:
+                    record = CompactRecord.from_record(record)
+                except Exception:
+                    record = None
+            yield (position, record)
+
+    def _load_records(self, stream, source=None):
+        """a method to parse every record in a binary stream without reading the whole stream at once
+
+        Records are decoded batch_size at a time and turned into dictionaries (unless compact
+        is set) before the next batch is read.
+
+        Args:
+            stream (File Object): an open binary stream
+
+        KWArgs:
+            source (str): where the stream came from, for the error messages
+
+        Returns:
+            list. an iterable containing dictionaries or CompactRecords
+        """
+        records = []
+        reader = self._read_records(stream, compact=self.compact, source=source)
+        while True:
+            with self.instrumentation.stage("ondisk.decode") as stage:
+                batch = list(islice(reader, self.batch_size))
+                stage.add("records", len(batch))
+            if not batch:
+                return records
+            records += batch if self.compact else self._as_dicts(batch)
+
+    def count(self):
+        """a method to return the total number of records extracted
+
+        In streaming mode the number is found by scanning record leaders
+        without building any records.
+
+        Returns:
+            int. total records found on-disk
+        """
+        if self.streaming:
+            return sum(self._count_leaders(stream) for stream in self._iter_streams())
+        return self.total
+
+    def _count_leaders(self, stream):
+        """a method to count the MARC records in a binary stream by their leaders, without decoding them
+
+        Chunks that do not look like a MARC record are skipped the same way a search skips them.
+        MARCXML and MARC-in-JSON have no leaders to hop between, so their records are decoded.
+        A compressed stream that is corrupt or cut short is noted in errors and the records
+        before the damage are counted.
+
+        Args:
+            stream (File Object): an open binary stream positioned at the start of a record
+
+        Returns:
+            int. the number of records found in the stream
+        """
+        if detect_format(stream) != "marc":
+            found = (record for _, record in self._decode_stream(stream))
+        else:
+            found = (raw for _, raw in iter_raw_records(stream, self.buffer_size))
+        total = 0
+        try:
+            for record in found:
+                if record is not None:
+                    total += 1
+        except DecompressionError as error:
+            self.errors.append(str(error))
+        return total
+
+    def _walk_files(self, path):
+        """a generator function to return every file path underneath a particular location on-disk
+
+        Args:
+            path (str): a location on disk to a directory
+
+        Returns:
+            generator. an iterable containing file paths
+        """
+        with self.instrumentation.stage("ondisk.scandir") as stage:
+            entries = list(scandir(path))
+            stage.add("entries", len(entries))
+        for n_thing in entries:
+            if n_thing.name.startswith(self.cache_name):
+                continue
+            if n_thing.is_dir():
+                yield from self._walk_files(n_thing.path)
+            elif n_thing.is_file():
+                yield n_thing.path
+
+    def _find_marc_files(self, path, record_cache=None, workers=None):
+        """a generator function to return a list of valid MARC records found from a particular location on-disk
+
+        Args:
+            path (str): a location on disk to a file or a directory
+
+        KWArgs:
+            record_cache (RecordCache): a cache to take unchanged files' records from and to store newly parsed ones in
+            workers (int): the number of worker processes to parse files with. Files are parsed in this process by default.
+
+        Returns:
+            generator. an interable containing lists of MARC records as dictionaries, one list per file
+        """
+        file_paths = self._walk_files(path)
+        if record_cache is not None:
+            cache_path = abspath(record_cache.path)
+            file_paths = (file_path for file_path in file_paths if not abspath(file_path).startswith(cache_path))
+        if workers and workers > 1:
+            yield from self._parse_marc_files_in_parallel(file_paths, record_cache, workers)
+            return
+        for file_path in file_paths:
+            if record_cache is not None:
+                data_package = record_cache.get(file_path)
+                if data_package is not None:
+                    self.instrumentation.count("ondisk.cache_hit")
+                    yield data_package
+                    continue
+                self.instrumentation.count("ondisk.cache_miss")
+            data_package = self._parse_marc_file(file_path)
+            if record_cache is not None:
+                record_cache.put(file_path, data_package)
+            yield data_package
+
+    def _parse_marc_file(self, file_path):
+        """a method to parse every record in a MARC file into dictionaries (or compact records)
+
+        Args:
+            file_path (str): a location on disk to a file
+
+        Returns:
+            list. an iterable containing dictionaries or CompactRecords, empty if the file was not valid MARC
+        """
+        bytes_file = open_marc_file(file_path)
+        if isinstance(bytes_file, ReadaheadReader):
+            # a compressed file is decompressed straight into the parser instead of being read whole
+            with bytes_file:
+                return self._load_records(bytes_file, source=file_path)
+        with self.instrumentation.stage("ondisk.read") as stage:
+            bytes_data = bytes_file.read()
+            bytes_file.close()
+            stage.add("bytes", len(bytes_data))
+        if self.compact:
+            validity, data_package = self._check_if_real_compact_records(
+                bytes_data, source=file_path)
+            return data_package if validity else []
+        validity, data_package = self._check_if_real_marc_record(
+            bytes_data, source=file_path)
+        return self._as_dicts(data_package) if validity else []
+
+    def _as_dicts(self, records):
+        """a method to turn pymarc records into dictionaries
+
+        Args:
+            records (list): pymarc Record objects
+
+        Returns:
+            list. an iterable containing dictionaries
+        """
+        with self.instrumentation.stage("ondisk.as_dict") as stage:
+            output = [record.as_dict() for record in records]
+            stage.add("records", len(output))
+        return output
+
+    def _parse_marc_files_in_parallel(self, file_paths, record_cache, workers):
+        """a generator function to parse MARC files in a pool of worker processes
+
+        Files are sent to the workers in chunks of roughly chunk_size bytes. The results are
+        put back together in the order the files were found, so the records come out in the
+        same order as a serial load no matter which worker finishes first.
+
+        Args:
+            file_paths (iterable): the files to parse, in order
+            record_cache (RecordCache): a cache of records from earlier loads, or None
+            workers (int): the number of worker processes
+
+        Returns:
+            generator. an interable containing lists of MARC records as dictionaries, one list per file
+        """
+        packages = []
+        pending = []
+        for file_path in file_paths:
+            data_package = record_cache.get(file_path) if record_cache is not None else None
+            packages.append((file_path, data_package))
+            if data_package is None:
+                pending.append(file_path)
+        if record_cache is not None:
+            self.instrumentation.count("ondisk.cache_hit", len(packages) - len(pending))
+            self.instrumentation.count("ondisk.cache_miss", len(pending))
+        from concurrent.futures import ProcessPoolExecutor
+        parsed = {}
+        with self.instrumentation.stage("ondisk.parallel_parse") as stage, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = self._chunk_files(pending)
+            compact = repeat(self.compact)
+            for chunk_results, chunk_errors in executor.map(_parse_marc_file_chunk, chunks, compact):
+                parsed.update(chunk_results)
+                self.errors += chunk_errors
+                stage.add("files", len(chunk_results))
+                stage.add("records", sum(len(records) for records in chunk_results.values()))
+        for file_path, data_package in packages:
+            if data_package is None:
+                data_package = parsed[file_path]
+                if record_cache is not None:
+                    record_cache.put(file_path, data_package)
+            yield data_package
+
+    def _chunk_files(self, file_paths):
+        """a generator function to group file paths into chunks of about chunk_size bytes
+
+        Args:
+            file_paths (list): the files to group, in order
+
+        Returns:
+            generator. an iterable containing lists of file paths
+        """
+        chunk = []
+        chunk_bytes = 0
+        for file_path in file_paths:
+            chunk.append(file_path)
+            chunk_bytes += getsize(file_path)
+            if chunk_bytes >= self.chunk_size:
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+        if chunk:
+            yield chunk
+
+    def _iter_streams(self):
+        """a generator function to return an open binary stream for each source in streaming mode
+
+        Returns:
+            generator. an iterable containing binary file-like objects
+
+        Raises:
+            ValueError: if the file-like object can not seek and has already been read
+        """
+        if self.location and isdir(self.location):
+            for file_path in self._walk_files(self.location):
+                with open_marc_file(file_path) as stream:
+                    yield stream
+        elif self.location and isfile(self.location):
+            with open_marc_file(self.location) as stream:
+                yield stream
+        elif self.source is not None:
+            if self._source_start is not None:
+                self.source.seek(self._source_start)
+            elif self._source_read:
+                raise ValueError("the stream can not seek, so it can only be read once in streaming mode")
+            self._source_read = True
+            stream = decompress_stream(self.source)
+            try:
+                yield stream
+            finally:
+                if stream is not self.source:
+                    stream.close()
+
+    def _iter_records(self):
+        """a generator function to parse MARC records one at a time from every source in streaming mode
+
+        Chunks that are not valid MARC records are skipped and noted in errors.
+
+        Returns:
+            generator. an iterable containing MARC record objects
+        """
+        for stream in self._iter_streams():
+            reader = self._read_records(stream)
+            while True:
+                with self.instrumentation.stage("ondisk.decode") as stage:
+                    record = next(reader, _END_OF_STREAM)
+                    if record is not _END_OF_STREAM:
+                        stage.add("records")
+                if record is _END_OF_STREAM:
+                    break
+                yield record
+
+    def _build_list_of_records(self, path_on_disk, cache=None, workers=None):
+        """a  method to get a list of MARC records transformed to dictionaries to allow for searching
+
+        Args:
+            path_on_disk (str): a particular location on-disk
+
+        KWArgs:
+            cache (bool|str): True to keep a record cache for a directory corpus in the user's cache directory,
+                or the path of the cache file
+            workers (int): the number of worker processes to parse the files of a directory corpus with
+
+        Returns:
+            list. an iterable containing dictionaries representing MARC records
+        """
+        records = []
+        if isdir(path_on_disk):
+            record_cache = None
+            if cache:
+                from .cache import RecordCache, default_cache_path
+                cache_path = default_cache_path(path_on_disk) if cache is True else cache
+                record_cache = RecordCache(cache_path, record_format="compact" if self.compact else "dict")
+            try:
+                for n_package in self._find_marc_files(path_on_disk, record_cache, workers):
+                    records += n_package
+                if record_cache is not None:
+                    record_cache.save()
+            finally:
+                if record_cache is not None:
+                    record_cache.close()
+        elif isfile(path_on_disk):
+            with open_marc_file(path_on_disk) as stream:
+                records = self._load_records(stream, source=path_on_disk)
+        return records
+
+    def _build_index(self, records):
+        """a method to build an inverted token index over a list of records
+
+        Args:
+            records (list): an iterable containing dictionaries representing MARC records
+
+        Returns:
+            FieldTokenIndex
+        """
+        with self.instrumentation.stage("ondisk.index") as stage:
+            index = FieldTokenIndex()
+            for position, record in enumerate(records):
+                index.add(position, record)
+            stage.add("records", len(records))
+        return index
+
+    def search(self, query_term, field, subfields):
+        """a method to search for records matching query term and field lookup
+
+        Args:
+            query_term (str): the string to be searched. This string will be stemmed in Solr searches.
+            field (str): a MARC field number as a string
+            subfields (list): a list of subfield codes related to the field that you want to search
+
+       Returns:
+            list. an iterable containing dicitonaries
+
+        :rtype list
+        """
+        if self.streaming:
+            return self._search_stream(query_term, field, subfields)
+        with self.instrumentation.stage("ondisk.search") as stage:
+            records = self.records
+            if self.index is not None:
+                positions = self.index.candidates(query_term, field, subfields)
+                if positions is not None:
+                    records = [self.records[position] for position in positions]
+            output = []
+            for record in records:
+                for _ in self._find_matches(record, query_term, field, subfields):
+                    output.append(record)
+            stage.add("scanned", len(records))
+            stage.add("matches", len(output))
+        return output
+
+    def query(self, expression, ignore_case=False):
+        """a method to find the records matching a boolean query over any number of fields
+
+        See marcextraction.query for the query language. The query is compiled once and each
+        record is tested in a single pass, so every matching record comes back exactly once.
+        If the searcher has an index, only records that could pass every top-level AND'ed
+        word, prefix and phrase predicate are tested.
+
+        Args:
+            expression (str|CompiledQuery): a query string, ex. '245a:banana AND NOT 590', or a compiled query
+
+        KWArgs:
+            ignore_case (bool): whether to fold case before comparing values. Ignored for a compiled query. Default is False.
+
+        Returns:
+            list. an iterable containing dictionaries (or CompactRecords). In streaming mode a generator instead
+
+        Raises:
+            QuerySyntaxError: if the query is not valid
+        """
+        matcher = expression if isinstance(expression, CompiledQuery) else compile_query(expression,
+                                                                                        ignore_case=ignore_case)
+        if self.streaming:
+            return self._query_stream(matcher)
+        with self.instrumentation.stage("ondisk.query") as stage:
+            records = self.records
+            if self.index is not None:
+                positions = None
+                for text, tag, codes in matcher.required_terms():
+                    candidates = self.index.candidates(text, tag, codes)
+                    if candidates is not None:
+                        positions = set(candidates) if positions is None else positions & set(candidates)
+                if positions is not None:
+                    records = [self.records[position] for position in sorted(positions)]
+            output = [record for record in records if matcher.matches(record)]
+            stage.add("scanned", len(records))
+            stage.add("matches", len(output))
+        return output
+
+    def project(self, paths):
+        """a method to copy chosen subfields of every record into a columnar store
+
+        Needs NumPy. The store's record positions are positions in records; in streaming mode
+        they count the records in the order they are parsed.
+
+        Args:
+            paths (list): column paths, a tag with an optional subfield code. Ex. ['001', '040a', '260c']
+
+        Returns:
+            ColumnarStore
+
+        Raises:
+            ImportError: if NumPy is not installed
+        """
+        from .columnar import ColumnarStore
+        with self.instrumentation.stage("ondisk.project") as stage:
+            if self.streaming:
+                records = (record.as_dict() for record in self._iter_records())
+            else:
+                records = self.records
+            store = ColumnarStore.build(records, paths)
+            stage.add("records", store.record_count)
+        return store
+
+    def _query_stream(self, matcher):
+        """a generator function to test records against a compiled query as they are parsed in streaming mode
+
+        Args:
+            matcher (CompiledQuery): the compiled query
+
+        Returns:
+            generator. an iterable containing dictionaries
+        """
+        for record in self._iter_records():
+            with self.instrumentation.stage("ondisk.as_dict") as stage:
+                record = record.as_dict()
+                stage.add("records")
+            if matcher.matches(record):
+                yield record
+
+    def _search_stream(self, query_term, field, subfields):
+        """a generator function to search records as they are parsed in streaming mode
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string
+            subfields (list): a list of subfield codes related to the field that you want to search
+
+        Returns:
+            generator. an iterable containing dictionaries
+        """
+        for record in self._iter_records():
+            with self.instrumentation.stage("ondisk.as_dict") as stage:
+                record = record.as_dict()
+                stage.add("records")
+            for _ in self._find_matches(record, query_term, field, subfields):
+                yield record
+
+    def _find_matches(self, record, query_term, field, subfields):
+        """a generator function to find every subfield in a record that matches a search
+
+        A record is yielded once per matching subfield.
+
+        Args:
+            record (dict|CompactRecord): a MARC record as a dictionary or a CompactRecord
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string
+            subfields (list): a list of subfield codes related to the field that you want to search
+
+        Returns:
+            generator. an iterable containing the matching record
+        """
+        if isinstance(record, CompactRecord):
+            for code, value in record.subfield_values(field):
+                for pot_subf in subfields:
+                    if code == pot_subf and value and query_term in value:
+                        yield record
+            return
+        for a_field in record.get("fields"):
+            field_data = a_field.get(field)
+            if not isinstance(field_data, dict):
+                continue
+            field_subfields = field_data.get("subfields")
+            first_pass = [list(x.keys()) for x in field_subfields]
+            second_pass = [item for sublist in first_pass for item in sublist]
+            intersection = list(set(second_pass) & set(subfields))
+            if intersection:
+                for subf in field_subfields:
+                    for pot_subf in subfields:
+                        if subf.get(pot_subf):
+                            if query_term in subf.get(pot_subf):
+                                yield record
+
+    @classmethod
+    def from_flo(cls, flo):
+        """a method to instantiate an instance of OnDiskExtractor from a file-like object
+
+        Args:
+            flo (File Object): a file-like object with read, write methods 
+
+        Returns:
+            OnDiskSearcher
+        """
+        return cls(writeable_object=flo)
+
+def _parse_marc_file_chunk(file_paths, compact=False):
+    """a function to parse a chunk of MARC files in a worker process
+
+    Args:
+        file_paths (list): the files to parse
+
+    KWArgs:
+        compact (bool): whether to keep the records as CompactRecords instead of dictionaries
+
+    Returns:
+        tuple. a mapping of file path to a list of MARC records as dictionaries, and a list of errors
+    """
+    searcher = OnDiskSearcher(compact=compact)
+    results = {file_path: searcher._parse_marc_file(file_path) for file_path in file_paths}
+    return (results, searcher.errors)
@@ -0,0 +1,219 @@
+"""a streaming pipeline to turn a search into a file of MARC records
+"""
+
+from io import BytesIO
+from queue import Queue
+from threading import Event, Thread
+from time import monotonic
+
+from pymarc import parse_xml_to_array, record_to_xml
+
+OUTPUT_FORMATS = ("marc", "marcxml", "json")
+MARCXML_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="http://www.loc.gov/MARC21/slim">\n'
+MARCXML_FOOTER = b'</collection>\n'
+
+_DONE = object()
+
+def convert_record(marcxml, output_format):
+    """a function to convert a MARCXML record from OLE into an output format
+
+    Args:
+        marcxml (bytes): a single MARCXML record
+        output_format (str): marc for binary MARC, marcxml for MARCXML or json for MARC-in-JSON
+
+    Returns:
+        bytes. the converted record, ready to be written. MARC-in-JSON records end in a newline
+    """
+    record = parse_xml_to_array(BytesIO(marcxml))[0]
+    if output_format == "marc":
+        return record.as_marc()
+    elif output_format == "marcxml":
+        return record_to_xml(record, namespace=False) + b'\n'
+    elif output_format == "json":
+        return record.as_json().encode('utf-8') + b'\n'
+    else:
+        raise ValueError("invalid output format '{}'".format(output_format))
+
+class ExportPipeline:
+    """a class to stream the records matching a search from OLE into a file
+
+    The search, the fetching and the conversion and writing run at the same time, joined by
+    bounded queues, so only about queue_size bibnumbers and records are ever held in memory.
+
+    Useage:
+        searcher = SolrIndexSearcher('http://your.domain/path/to/index', 'ole')
+        finder = OLEBatchRecordFinder('domain.of.ole.sru.app', 'http', '/path/to/app')
+        pipeline = ExportPipeline(searcher, finder, output_format='marc')
+        with open('banana.mrc', 'wb') as output:
+            stats = pipeline.run('banana', '245', ['a'], output)
+    """
+    def __init__(self, searcher, finder, output_format="marc", queue_size=1000, page_size=1000,
+                 progress=None, progress_every=1000):
+        """initializes an instance of the class ExportPipeline
+
+        Args:
+            searcher (SolrIndexSearcher): the searcher to find bibnumbers with
+            finder (OLEBatchRecordFinder): the finder to fetch records with
+
+        KWArgs:
+            output_format (str): marc, marcxml or json. Default is marc.
+            queue_size (int): the most items waiting between two stages. Default is 1000.
+            page_size (int): the number of bibnumbers to fetch from the index with each request. Default is 1000.
+            progress (callable): called with a dictionary of statistics every progress_every records and at the end
+            progress_every (int): how many records to write between progress reports. Default is 1000.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("invalid output format '{}'".format(output_format))
+        self.searcher = searcher
+        self.finder = finder
+        self.output_format = output_format
+        self.queue_size = queue_size
+        self.page_size = page_size
+        self.progress = progress
+        self.progress_every = progress_every
+        self.stats = {}
+        self.errors = []
+        self._failures = []
+        self._stop = Event()
+
+    def _search_stage(self, query_term, field, subfields, phrase_search, bibnumbers):
+        """a private method to run the search and feed the bibnumbers to the fetch stage
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+            phrase_search (bool): whether to search for the full phrase
+            bibnumbers (Queue): the queue to put bibnumbers on
+        """
+        try:
+            for bibnumber in self.searcher.iter_search(query_term, field, subfields, page_size=self.page_size,
+                                                       phrase_search=phrase_search):
+                if self._stop.is_set():
+                    break
+                self.stats["searched"] += 1
+                bibnumbers.put(bibnumber)
+        except Exception as error:
+            self._failures.append(error)
+        finally:
+            bibnumbers.put(_DONE)
+
+    def _fetch_stage(self, bibnumbers, records):
+        """a private method to fetch the record for each bibnumber and feed it to the write stage
+
+        Args:
+            bibnumbers (Queue): the queue to take bibnumbers from
+            records (Queue): the queue to put (bibnumber, MARCXML record) tuples on
+        """
+        try:
+            for pair in self.finder.find(self._drain(bibnumbers)):
+                if self._stop.is_set():
+                    break
+                self.stats["fetched"] += 1
+                records.put(pair)
+        except Exception as error:
+            self._failures.append(error)
+            self._stop.set()
+        finally:
+            for _ in self._drain(bibnumbers):
+                pass
+            records.put(_DONE)
+
+    def _drain(self, queue):
+        """a private generator function to take items off a queue until the stage before it is done
+
+        Args:
+            queue (Queue): the queue between two stages
+
+        Returns:
+            generator. an iterable containing the items on the queue
+        """
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                queue.put(_DONE)
+                return
+            yield item
+
+    def _report(self, started):
+        """a private method to update the throughput statistics and pass them to the progress callback
+
+        Args:
+            started (float): when the run started, from time.monotonic
+        """
+        elapsed = monotonic() - started
+        self.stats["elapsed"] = elapsed
+        self.stats["records_per_second"] = self.stats["written"] / elapsed if elapsed else 0.0
+        self.stats["not_found"] = len(getattr(self.finder, "not_found", []))
+        if self.progress is not None:
+            self.progress(dict(self.stats))
+
+    def run(self, query_term, field, subfields, output, phrase_search=False):
+        """a method to export every record matching a search
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+            output (File Object): a binary file-like object to write the records to
+
+        KWArgs:
+            phrase_search (bool): whether to search for the full phrase. Default is False.
+
+        Returns:
+            dict. statistics about the run: searched, fetched, written, not_found, elapsed and records_per_second
+
+        Raises:
+            Exception: the first error raised by the search or fetch stage, once the pipeline has drained
+        """
+        self.stats = {"searched": 0, "fetched": 0, "written": 0, "not_found": 0,
+                      "elapsed": 0.0, "records_per_second": 0.0}
+        self.errors = []
+        self._failures = []
+        self._stop.clear()
+        started = monotonic()
+        bibnumbers = Queue(maxsize=self.queue_size)
+        records = Queue(maxsize=self.queue_size)
+        stages = [Thread(target=self._search_stage, args=(query_term, field, subfields, phrase_search, bibnumbers),
+                         daemon=True),
+                  Thread(target=self._fetch_stage, args=(bibnumbers, records), daemon=True)]
+        for stage in stages:
+            stage.start()
+        try:
+            self._write_stage(records, output, started)
+        finally:
+            self._stop.set()
+            for _ in self._drain(records):
+                pass
+            for stage in stages:
+                stage.join()
+        self._report(started)
+        if self._failures:
+            raise self._failures[0]
+        return dict(self.stats)
+
+    def _write_stage(self, records, output, started):
+        """a private method to convert each fetched record and write it out
+
+        A record that can not be converted is noted in errors and skipped.
+
+        Args:
+            records (Queue): the queue to take (bibnumber, MARCXML record) tuples from
+            output (File Object): a binary file-like object to write the records to
+            started (float): when the run started, from time.monotonic
+        """
+        if self.output_format == "marcxml":
+            output.write(MARCXML_HEADER)
+        for bibnumber, marcxml in self._drain(records):
+            try:
+                converted = convert_record(marcxml, self.output_format)
+            except Exception as error:
+                self.errors.append("could not convert the record for {}: {}".format(bibnumber, error))
+                continue
+            output.write(converted)
+            self.stats["written"] += 1
+            if self.stats["written"] % self.progress_every == 0:
+                self._report(started)
+        if self.output_format == "marcxml":
+            output.write(MARCXML_FOOTER)
+        output.flush()
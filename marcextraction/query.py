@@ -0,0 +1,402 @@
+"""a small boolean query language over MARC fields, compiled once into a record matcher
+
+A query is made of predicates joined by AND, OR and NOT, grouped with parentheses. Two
+predicates next to each other with no operator between them are AND'ed. A predicate names a
+tag, then optionally the subfield codes to look in, then optionally a colon and a value.
+
+    245a:banana             a whole word in 245 $a
+    245ab:banan*            a word starting with banan in 245 $a or $b
+    650:"united states"     the exact phrase anywhere in a 650 subfield
+    100a:/^Smith, J/        a regular expression searched for in 100 $a
+    001:10034               a control field's value
+    590                     the record has a 590 field
+    245a:banana AND (650a:fruit OR 650a:plants) AND NOT 590
+"""
+
+from collections import namedtuple
+from re import IGNORECASE, VERBOSE, compile as compile_pattern, error as PatternError, escape
+
+from .records import CompactRecord
+
+And = namedtuple("And", ["children"])
+Or = namedtuple("Or", ["children"])
+Not = namedtuple("Not", ["child"])
+Predicate = namedtuple("Predicate", ["tag", "codes", "kind", "value"])
+Predicate.__doc__ = """a test on the values of one tag
+
+kind is "word", "prefix", "phrase", "regex" or "exists" (value is None for "exists").
+codes is a string of subfield codes, or '' to look in every subfield and the control field data.
+"""
+
+TOKEN_PATTERN = compile_pattern(r'''
+    (?P<space>\s+)
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<operator>(?:AND|OR|NOT)(?=[\s()]|$))
+  | (?P<tag>\d{3})(?P<codes>[a-z0-9]*)
+        (?::(?P<value>"(?:[^"\\]|\\.)*"|/(?:[^/\\]|\\.)*/|[^\s()]+))?
+''', VERBOSE)
+
+class QuerySyntaxError(ValueError):
+    """raised when a query string can not be parsed
+    """
+    pass
+
+def _tokenize_query(text):
+    """a private generator function to split a query string into tokens
+
+    Args:
+        text (str): a query string
+
+    Returns:
+        generator. an iterable containing (kind, value) tuples
+
+    Raises:
+        QuerySyntaxError: if part of the string is not a parenthesis, an operator or a predicate
+    """
+    position = 0
+    while position < len(text):
+        found = TOKEN_PATTERN.match(text, position)
+        if found is None or found.end() == position:
+            raise QuerySyntaxError("could not read the query at position {}: '{}'".format(position, text[position:]))
+        position = found.end()
+        if found.group("space"):
+            continue
+        if found.group("open"):
+            yield ("open", "(")
+        elif found.group("close"):
+            yield ("close", ")")
+        elif found.group("operator"):
+            yield ("operator", found.group("operator"))
+        else:
+            yield ("predicate", _build_predicate(found.group("tag"), found.group("codes"), found.group("value")))
+
+def _build_predicate(tag, codes, value):
+    """a private function to turn the parts of a predicate token into a Predicate
+
+    Args:
+        tag (str): a MARC field number
+        codes (str): subfield codes, possibly empty
+        value (str): the raw value after the colon, or None
+
+    Returns:
+        Predicate
+    """
+    if value is None:
+        return Predicate(tag, codes, "exists", None)
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return Predicate(tag, codes, "phrase", _unescape(value[1:-1]))
+    if len(value) >= 2 and value[0] == value[-1] == '/':
+        return Predicate(tag, codes, "regex", value[1:-1].replace('\\/', '/'))
+    if value.endswith('*') and len(value) > 1:
+        return Predicate(tag, codes, "prefix", value[:-1])
+    return Predicate(tag, codes, "word", value)
+
+def _unescape(text):
+    """a private function to undo backslash escapes in a quoted phrase
+
+    Args:
+        text (str): the text between the quotes
+
+    Returns:
+        str. the phrase
+    """
+    output = []
+    escaped = False
+    for character in text:
+        if escaped or character != '\\':
+            output.append(character)
+            escaped = False
+        else:
+            escaped = True
+    return ''.join(output)
+
+class _Parser:
+    """a private class for a recursive descent parser over query tokens
+    """
+    def __init__(self, text):
+        self.tokens = list(_tokenize_query(text))
+        self.position = 0
+
+    def _peek(self):
+        """a private method to look at the next token without taking it"""
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self):
+        """a private method to take the next token"""
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        """a method to parse every token into a query tree"""
+        if not self.tokens:
+            raise QuerySyntaxError("the query is empty")
+        node = self._disjunction()
+        if self.position < len(self.tokens):
+            raise QuerySyntaxError("unexpected '{}'".format(self._peek()[1]))
+        return node
+
+    def _disjunction(self):
+        """a private method to parse conjunctions joined by OR"""
+        children = [self._conjunction()]
+        while self._peek() == ("operator", "OR"):
+            self._take()
+            children.append(self._conjunction())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def _conjunction(self):
+        """a private method to parse negations joined by AND or by nothing at all"""
+        children = [self._negation()]
+        while True:
+            kind, value = self._peek()
+            if (kind, value) == ("operator", "AND"):
+                self._take()
+            elif kind not in ("predicate", "open") and (kind, value) != ("operator", "NOT"):
+                break
+            children.append(self._negation())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def _negation(self):
+        """a private method to parse an atom with any number of NOTs in front of it"""
+        if self._peek() == ("operator", "NOT"):
+            self._take()
+            return Not(self._negation())
+        return self._atom()
+
+    def _atom(self):
+        """a private method to parse a predicate or a parenthesized query"""
+        kind, value = self._take()
+        if kind == "predicate":
+            return value
+        if kind == "open":
+            node = self._disjunction()
+            if self._take()[0] != "close":
+                raise QuerySyntaxError("a parenthesis was not closed")
+            return node
+        if kind is None:
+            raise QuerySyntaxError("the query ended too soon")
+        raise QuerySyntaxError("unexpected '{}'".format(value))
+
+def parse_query(text):
+    """a function to parse a query string into a tree of And, Or, Not and Predicate tuples
+
+    Args:
+        text (str): a query string. Ex. '245a:banana AND NOT 590'
+
+    Returns:
+        And|Or|Not|Predicate. the root of the query tree
+
+    Raises:
+        QuerySyntaxError: if the string is not a valid query
+    """
+    return _Parser(text).parse()
+
+class CompiledQuery:
+    """a class to hold a query compiled into nested matcher functions
+
+    Compiling works out, once, which tags the query looks at and builds one test function per
+    predicate. Matching a record then gathers the values of just those tags in a single pass
+    over the record and evaluates the tree with short-circuiting.
+
+    Useage:
+        query = compile_query('245a:banana AND NOT 590', ignore_case=True)
+        matching = [record for record in records if query.matches(record)]
+    """
+    def __init__(self, tree, ignore_case=False):
+        """initializes an instance of the class CompiledQuery
+
+        Args:
+            tree (And|Or|Not|Predicate): a parsed query
+
+        KWArgs:
+            ignore_case (bool): whether to fold case before comparing values. Default is False.
+
+        Raises:
+            QuerySyntaxError: if a predicate has an unknown kind or an invalid regular expression
+        """
+        self.tree = tree
+        self.ignore_case = ignore_case
+        self.tags = frozenset(self._collect_tags(tree))
+        self._matcher = self._compile(tree)
+
+    def _collect_tags(self, node):
+        """a private generator function to find every tag a query looks at
+
+        Args:
+            node (And|Or|Not|Predicate): a node of the query tree
+
+        Returns:
+            generator. an iterable containing tags
+        """
+        if isinstance(node, Predicate):
+            yield node.tag
+        elif isinstance(node, Not):
+            yield from self._collect_tags(node.child)
+        else:
+            for child in node.children:
+                yield from self._collect_tags(child)
+
+    def _compile(self, node):
+        """a private method to turn a node of the query tree into a function of the gathered values
+
+        Args:
+            node (And|Or|Not|Predicate): a node of the query tree
+
+        Returns:
+            function. takes a mapping of tag to (subfield code, value) tuples and returns a bool
+        """
+        if isinstance(node, Predicate):
+            return self._compile_predicate(node)
+        if isinstance(node, Not):
+            child = self._compile(node.child)
+            return lambda values: not child(values)
+        children = tuple(self._compile(child) for child in node.children)
+        if isinstance(node, And):
+            def conjunction(values):
+                for child in children:
+                    if not child(values):
+                        return False
+                return True
+            return conjunction
+        def disjunction(values):
+            for child in children:
+                if child(values):
+                    return True
+            return False
+        return disjunction
+
+    def _compile_predicate(self, predicate):
+        """a private method to build the test function for a single predicate
+
+        Args:
+            predicate (Predicate): a predicate of the query tree
+
+        Returns:
+            function. takes a mapping of tag to (subfield code, value) tuples and returns a bool
+        """
+        tag, codes = predicate.tag, frozenset(predicate.codes)
+        test = self._value_test(predicate)
+        if test is None:
+            if not codes:
+                return lambda values: tag in values
+            return lambda values: any(code in codes for code, _ in values.get(tag, ()))
+
+        def matches_predicate(values):
+            for code, value in values.get(tag, ()):
+                if (not codes or code in codes) and value and test(value):
+                    return True
+            return False
+        return matches_predicate
+
+    def _value_test(self, predicate):
+        """a private method to build the test a single value has to pass for a predicate
+
+        Args:
+            predicate (Predicate): a predicate of the query tree
+
+        Returns:
+            function. takes a value and returns a bool, or None for an "exists" predicate
+
+        Raises:
+            QuerySyntaxError: if the predicate has an unknown kind or an invalid regular expression
+        """
+        flags = IGNORECASE if self.ignore_case else 0
+        if predicate.kind == "exists":
+            return None
+        if predicate.kind == "phrase":
+            if self.ignore_case:
+                phrase = predicate.value.casefold()
+                return lambda value: phrase in value.casefold()
+            phrase = predicate.value
+            return lambda value: phrase in value
+        if predicate.kind == "word":
+            pattern = r'(?<!\w){}(?!\w)'.format(escape(predicate.value))
+        elif predicate.kind == "prefix":
+            pattern = r'(?<!\w){}'.format(escape(predicate.value))
+        elif predicate.kind == "regex":
+            pattern = predicate.value
+        else:
+            raise QuerySyntaxError("unknown predicate kind '{}'".format(predicate.kind))
+        try:
+            return compile_pattern(pattern, flags).search
+        except PatternError as error:
+            raise QuerySyntaxError("invalid regular expression '{}': {}".format(predicate.value, error))
+
+    def required_terms(self):
+        """a method to list the predicates every matching record must pass that a FieldTokenIndex can look up
+
+        Only word, prefix and phrase predicates with subfield codes, AND'ed at the top of the
+        tree, are listed. A FieldTokenIndex's candidates for each of them are a superset of the
+        records that pass it.
+
+        Returns:
+            list. (text, tag, subfield codes) tuples
+        """
+        nodes = self.tree.children if isinstance(self.tree, And) else (self.tree,)
+        output = []
+        for node in nodes:
+            if not isinstance(node, Predicate) or not node.codes or node.kind not in ("word", "prefix", "phrase"):
+                continue
+            if self.ignore_case and node.value.casefold() != node.value.lower():
+                continue
+            output.append((node.value, node.tag, list(node.codes)))
+        return output
+
+    def gather(self, record):
+        """a method to collect the values of the tags the query looks at in one pass over a record
+
+        Args:
+            record (dict|CompactRecord): a MARC record as returned by pymarc's Record.as_dict, or a CompactRecord
+
+        Returns:
+            dict. a mapping of tag to a list of (subfield code, value) tuples. Control fields have a code of ''
+        """
+        values = {}
+        tags = self.tags
+        if isinstance(record, CompactRecord):
+            for tag, code, value in record.values_for(tags):
+                values.setdefault(tag, []).append((code, value))
+            return values
+        for a_field in record.get("fields"):
+            for tag, field_data in a_field.items():
+                if tag not in tags:
+                    continue
+                found = values.setdefault(tag, [])
+                if isinstance(field_data, dict):
+                    for subfield in field_data.get("subfields"):
+                        found.extend(subfield.items())
+                else:
+                    found.append(('', field_data))
+        return values
+
+    def matches(self, record):
+        """a method to test a record against the query
+
+        Args:
+            record (dict|CompactRecord): a MARC record as returned by pymarc's Record.as_dict, or a CompactRecord
+
+        Returns:
+            bool. whether the record matches
+        """
+        return self._matcher(self.gather(record))
+
+    __call__ = matches
+
+def compile_query(query, ignore_case=False):
+    """a function to compile a query string or tree into a CompiledQuery
+
+    Args:
+        query (str|And|Or|Not|Predicate): a query string or a tree built from And, Or, Not and Predicate
+
+    KWArgs:
+        ignore_case (bool): whether to fold case before comparing values. Default is False.
+
+    Returns:
+        CompiledQuery
+
+    Raises:
+        QuerySyntaxError: if the query is not valid
+    """
+    tree = parse_query(query) if isinstance(query, str) else query
+    return CompiledQuery(tree, ignore_case=ignore_case)
@@ -0,0 +1,287 @@
+"""a compact in-memory representation of MARC records for searchable corpora
+"""
+
+from array import array
+
+from pymarc import Record
+from pymarc.exceptions import RecordLengthInvalid
+from pymarc.marc8 import marc8_to_unicode
+
+END_OF_RECORD = b'\x1d'
+SUBFIELD_INDICATOR = b'\x1f'
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+def read_raw_records(stream):
+    """a generator function to split a binary stream into records in transmission format
+
+    Each record is read by its leader's length, so only one record is held in memory at a time.
+
+    Args:
+        stream (File Object): an open binary stream positioned at the start of a record
+
+    Returns:
+        generator. an iterable containing the bytes of each record
+
+    Raises:
+        RecordLengthInvalid: if a chunk of the stream is not a MARC record
+    """
+    while True:
+        first5 = stream.read(5)
+        if not first5:
+            return
+        if len(first5) < 5 or not first5.isdigit() or int(first5) < 24:
+            raise RecordLengthInvalid()
+        chunk = first5 + stream.read(int(first5) - 5)
+        if len(chunk) < int(first5) or chunk[-1:] != END_OF_RECORD:
+            raise RecordLengthInvalid()
+        yield chunk
+
+def iter_raw_records(stream, buffer_size=DEFAULT_BUFFER_SIZE):
+    """a generator function to split a binary stream into records through a fixed-size buffer
+
+    The stream is read buffer_size bytes at a time, so memory use stays the same however big
+    the stream is. A chunk that is not a MARC record is skipped: reading picks up again after
+    the next end-of-record byte.
+
+    Args:
+        stream (File Object): an open binary stream positioned at the start of a record
+
+    KWArgs:
+        buffer_size (int): how many bytes to read from the stream at a time. Default is 1 MiB.
+
+    Returns:
+        generator. an iterable containing (byte offset, record bytes) tuples. The record bytes
+            are None for a chunk that was skipped
+    """
+    buffer = bytearray()
+    offset = 0
+    exhausted = False
+    while True:
+        while len(buffer) < 5 and not exhausted:
+            exhausted = _fill(stream, buffer, buffer_size)
+        if not buffer:
+            return
+        first5 = bytes(buffer[:5])
+        length = int(first5) if len(first5) == 5 and first5.isdigit() else 0
+        if length >= 24:
+            while len(buffer) < length and not exhausted:
+                exhausted = _fill(stream, buffer, buffer_size)
+            if len(buffer) >= length and buffer[length - 1] == END_OF_RECORD[0]:
+                yield (offset, bytes(buffer[:length]))
+                del buffer[:length]
+                offset += length
+                continue
+        skipped = 0
+        while True:
+            end = buffer.find(END_OF_RECORD)
+            if end != -1:
+                skipped += end + 1
+                del buffer[:end + 1]
+                break
+            skipped += len(buffer)
+            del buffer[:]
+            if exhausted:
+                break
+            exhausted = _fill(stream, buffer, buffer_size)
+        yield (offset, None)
+        offset += skipped
+
+def _fill(stream, buffer, buffer_size):
+    """a private function to read the next chunk of a stream onto the end of a buffer
+
+    Returns:
+        bool. True if the stream has nothing left to read
+    """
+    chunk = stream.read(buffer_size)
+    buffer += chunk
+    return not chunk
+
+class CompactRecord:
+    """a class to hold a MARC record as its raw bytes plus a flat array of subfield positions
+
+    Each subfield takes three unsigned integers in entries: the tag and subfield code packed
+    together, the byte offset of the value and its byte length. Values are only decoded when
+    they are asked for. Control fields are stored with a subfield code of 0.
+
+    Useage:
+        record = CompactRecord(raw_bytes)
+        for code, value in record.subfield_values('245'):
+            ...
+        record.as_record()
+        record.as_dict()
+    """
+    __slots__ = ('raw', 'entries')
+
+    def __init__(self, raw):
+        """initializes an instance of the class CompactRecord
+
+        Args:
+            raw (bytes): a single MARC record in transmission format
+
+        Raises:
+            ValueError: if the record's leader or directory can not be read
+        """
+        self.raw = bytes(raw)
+        self.entries = self._build_entries(self.raw)
+
+    @classmethod
+    def from_record(cls, record):
+        """a method to build a compact record from a pymarc Record
+
+        Args:
+            record (Record): a pymarc record
+
+        Returns:
+            CompactRecord
+        """
+        return cls(record.as_marc())
+
+    @staticmethod
+    def _build_entries(raw):
+        """a private method to find the position of every subfield in a record
+
+        Args:
+            raw (bytes): a single MARC record in transmission format
+
+        Returns:
+            array. three unsigned integers per subfield: packed tag and code, offset and length
+        """
+        entries = array('I')
+        base_address = int(raw[12:17])
+        if base_address < 24 or base_address > len(raw):
+            raise ValueError("invalid base address {}".format(base_address))
+        for entry in range(24, base_address - 1, 12):
+            tag = raw[entry:entry + 3]
+            field_length = int(raw[entry + 3:entry + 7])
+            field_start = base_address + int(raw[entry + 7:entry + 12])
+            field_end = field_start + field_length - 1
+            packed_tag = int.from_bytes(tag, 'big') << 8
+            if tag < b'010' and tag.isdigit():
+                entries.extend((packed_tag, field_start, field_end - field_start))
+                continue
+            position = raw.find(SUBFIELD_INDICATOR, field_start, field_end)
+            while position != -1 and position + 1 < field_end:
+                next_position = raw.find(SUBFIELD_INDICATOR, position + 1, field_end)
+                value_end = field_end if next_position == -1 else next_position
+                entries.extend((packed_tag | raw[position + 1], position + 2, max(value_end - position - 2, 0)))
+                position = next_position
+        return entries
+
+    def _decode(self, offset, length, control_field=False):
+        """a private method to decode a value the same way pymarc would
+
+        Args:
+            offset (int): the byte offset of the value
+            length (int): the byte length of the value
+
+        KWArgs:
+            control_field (bool): whether the value belongs to a control field
+
+        Returns:
+            str. the decoded value
+        """
+        data = self.raw[offset:offset + length]
+        if self.raw[9:10] == b'a':
+            return data.decode('utf-8')
+        if control_field:
+            return data.decode('iso8859-1')
+        return marc8_to_unicode(data)
+
+    def leader(self):
+        """a method to return the record's leader
+
+        Returns:
+            str. the 24 character leader
+        """
+        return self.raw[:24].decode('ascii')
+
+    def control_number(self):
+        """a method to return the value of the record's 001 field
+
+        Returns:
+            str. the control number, or None if the record has no 001 field
+        """
+        packed_tag = int.from_bytes(b'001', 'big') << 8
+        entries = self.entries
+        for n in range(0, len(entries), 3):
+            if entries[n] == packed_tag:
+                return self._decode(entries[n + 1], entries[n + 2], control_field=True)
+        return None
+
+    def subfield_values(self, tag):
+        """a generator function to return the subfields of every field with a particular tag
+
+        Args:
+            tag (str): a MARC field number as a string
+
+        Returns:
+            generator. an iterable containing (subfield code, value) tuples in record order
+        """
+        packed_tag = int.from_bytes(tag.encode('ascii'), 'big') << 8
+        entries = self.entries
+        for n in range(0, len(entries), 3):
+            key = entries[n]
+            if key & 0xffffff00 == packed_tag and key & 0xff:
+                yield (chr(key & 0xff), self._decode(entries[n + 1], entries[n + 2]))
+
+    def iter_subfields(self):
+        """a generator function to return every subfield value in the record
+
+        Returns:
+            generator. an iterable containing (tag, subfield code, value) tuples
+        """
+        entries = self.entries
+        for n in range(0, len(entries), 3):
+            key = entries[n]
+            if key & 0xff and entries[n + 2]:
+                tag = (key >> 8).to_bytes(3, 'big').decode('ascii')
+                yield (tag, chr(key & 0xff), self._decode(entries[n + 1], entries[n + 2]))
+
+    def values_for(self, tags):
+        """a generator function to return the control field and subfield values of a set of tags
+
+        Only the values of the wanted tags are decoded.
+
+        Args:
+            tags (set): MARC field numbers as strings
+
+        Returns:
+            generator. an iterable containing (tag, subfield code, value) tuples in record order.
+                Control fields have a subfield code of ''
+        """
+        packed_tags = {int.from_bytes(tag.encode('ascii'), 'big') << 8: tag for tag in tags}
+        entries = self.entries
+        for n in range(0, len(entries), 3):
+            key = entries[n]
+            tag = packed_tags.get(key & 0xffffff00)
+            if tag is None:
+                continue
+            code = key & 0xff
+            if code:
+                yield (tag, chr(code), self._decode(entries[n + 1], entries[n + 2]))
+            else:
+                yield (tag, '', self._decode(entries[n + 1], entries[n + 2], control_field=True))
+
+    def as_record(self):
+        """a method to decode the whole record
+
+        Returns:
+            pymarc.Record
+        """
+        return Record(data=self.raw)
+
+    def as_dict(self):
+        """a method to decode the whole record into a dictionary
+
+        Returns:
+            dict. the same dictionary pymarc's Record.as_dict returns
+        """
+        return self.as_record().as_dict()
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactRecord):
+            return NotImplemented
+        return self.raw == other.raw
+
+    def __hash__(self):
+        return hash(self.raw)
@@ -0,0 +1,532 @@
+"""the Solr backend, for searching a Solr index of MARC records for control numbers
+"""
+
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from pysolr import Solr, SolrError
+from requests.exceptions import ConnectionError, Timeout
+
+from .instrumentation import NULL_INSTRUMENTATION
+from .utils import create_http_session, create_ole_index_field, create_ole_query
+
+_SHARED_SESSION = None
+
+SEARCH_MANY_METHODS = ("or", "terms")
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+def _shared_session():
+    """a function to get the HTTP session that searchers share when they are not given one
+
+    Returns:
+        requests.Session
+    """
+    global _SHARED_SESSION
+    if _SHARED_SESSION is None:
+        _SHARED_SESSION = create_http_session()
+    return _SHARED_SESSION
+
+class SolrConnectionError(SolrError):
+    """raised when a Solr index can not be reached
+
+    It is a pysolr SolrError, so code that already catches SolrError keeps working.
+    """
+
+@contextmanager
+def _connection_errors(index_url):
+    """a function to turn pysolr's errors for a failed connection or a timeout into SolrConnectionError
+
+    Args:
+        index_url (str): the URL of the index, for the error message
+
+    Raises:
+        SolrConnectionError: if pysolr could not connect to the index or timed out
+    """
+    try:
+        yield
+    except SolrError as error:
+        if isinstance(error, SolrConnectionError) or not isinstance(error.__context__, (ConnectionError, Timeout)):
+            raise
+        raise SolrConnectionError("could not reach the Solr index at {}: {}".format(index_url, error.__context__)) \
+            from error
+
+class SolrIndexSearcher:
+    """a class to be used to search a Solr index for a query
+
+    Making a searcher does not touch the network. Every searcher that is not given a session
+    shares one pooled keep-alive session, so creating a searcher per request is cheap.
+
+    Useage:
+        session = create_http_session(pool_maxsize=20)
+        searcher = SolrIndexSearcher('http://your.domain/path/to/index', 'ole', session=session, timeout=10)
+        searcher.check_connection()
+    """
+    def __init__(self, index_url, index_type, unique_key="id", session=None, timeout=60, validate=False,
+                 cache=None, instrumentation=None):
+        """initializes an instance of the class SolrIndexSearcher 
+
+        Args:
+            index_url (str): the URL to the SOLR index that will be queried.
+            index_type (str): a flag indicating which type of index is being used. 
+                Needed for being able to generate the correct index field name
+
+        KWArgs:
+            unique_key (str): the unique key field of the index, which cursor paging sorts on. Default is id.
+            session (requests.Session): the HTTP session to send requests over. Default is a session shared by all searchers.
+            timeout (float): seconds to wait on each request to the index. Default is 60.
+            validate (bool): check that the index can be reached right away. Default is False.
+            cache (QueryCache): a cache to answer repeated searches from. Default is no caching.
+            instrumentation (Instrumentation): where to report request timings and cache hits. Default is none.
+
+        Raises:
+            SolrConnectionError: if validate is True and the index can not be reached
+        """
+        self.unique_key = unique_key
+        self.session = session if session is not None else _shared_session()
+        self.timeout = timeout
+        self.cache = cache
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self.solr_index = Solr(index_url, timeout=timeout, session=self.session)
+        self.index_url = self.solr_index.url
+        self.field_creator = self._build_field_definer(index_type)
+        self.query_creator = self._set_query_creator(index_type)
+        if validate:
+            self.check_connection()
+
+    def check_connection(self):
+        """a method to check that the index can be reached and answers searches
+
+        An empty search (rows=0) is sent to the index's select handler, which every Solr core
+        has, and it has to come back with a successful status.
+
+        Raises:
+            SolrConnectionError: if the request to the index fails to connect, times out or gets an HTTP error
+        """
+        try:
+            response = self.session.get(self.index_url.rstrip('/') + '/select', timeout=self.timeout,
+                                        params={"q": "*:*", "rows": 0, "wt": "json"})
+        except (ConnectionError, Timeout) as error:
+            raise SolrConnectionError("could not reach the Solr index at {}: {}".format(self.index_url, error))
+        if not response.ok:
+            raise SolrConnectionError("the Solr index at {} answered HTTP {}".format(self.index_url,
+                                                                                   response.status_code))
+
+    def _build_field_definer(self, flag):
+        """a private method to build the field definition
+
+         Args
+            flag (str): an indicate of what the field is in the index
+        """
+        if flag == 'ole':
+            return create_ole_index_field
+        else:
+            raise ValueError("invalid index_type {}".format(flag))
+
+    def _set_query_creator(self, flag):
+        """a private method to set the query_creator function of the instance
+
+        Args
+            flag (str): an indicato of what kind of query construction needs to be done
+        """
+        if flag == 'ole':
+            return create_ole_query
+        else:
+            raise ValueError("invalid index type '{}' for query creation".format(flag))
+
+    def search(self, query_term, field, subfields, rows=1000, phrase_search=False):
+        """a method to run a search on the index for a particular value in a particular field
+
+        Args:
+            query_term (str): the string to be searched. This string will be stemmed in Solr searches..
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            rows (int): the number of records that you want to retrieve from the Solr index. default is 1000.
+            phrase_search (bool): a flag indicating whether you want to perform a full phrase search. Default
+                                  is False which will perform a word search.
+
+        Returns:
+            list. An iterable containing dictionaries for each matching record in the Solr index 
+                for the query_term, query_field, and query_subfield.
+
+        Raises:
+            SolrConnectionError: if the index can not be reached
+        """
+        query = self._build_query(query_term, field, subfields, phrase_search)
+        if self.cache is not None:
+            key = self._cache_key(query, rows)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.instrumentation.count("solr.cache_hit")
+                return list(cached)
+            self.instrumentation.count("solr.cache_miss")
+        with self.instrumentation.stage("solr.request") as stage, _connection_errors(self.index_url):
+            result = self.solr_index.search(q=query, fl='controlfield_001', rows=rows)
+            stage.add("http_200")
+            stage.add("documents", len(result.docs))
+        output = list(self._control_numbers(result.docs))
+        if self.cache is not None:
+            self.cache.put(key, output)
+        return output
+
+    def _cache_key(self, query, rows):
+        """a private method to build the cache key for a search
+
+        Args:
+            query (str): the query string built by _build_query
+            rows (int): the number of records asked for
+
+        Returns:
+            str. the query with its whitespace normalized, the index URL and the rows
+        """
+        return "{} {} rows={}".format(self.index_url, ' '.join(query.split()), rows)
+
+    def iter_search(self, query_term, field, subfields, page_size=1000, phrase_search=False):
+        """a generator function to run a search on the index and stream back every matching record
+
+        The results are paged through with Solr's cursorMark, sorted on the unique key, so
+        result sets of any size come back with only one page in memory at a time.
+
+        Args:
+            query_term (str): the string to be searched. This string will be stemmed in Solr searches.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            page_size (int): the number of records to fetch with each request. Default is 1000.
+            phrase_search (bool): a flag indicating whether you want to perform a full phrase search. Default
+                                  is False which will perform a word search.
+
+        Returns:
+            generator. an iterable containing the controlfield_001 value of each matching record
+        """
+        for control_numbers, _ in self.iter_search_pages(query_term, field, subfields, page_size=page_size,
+                                                         phrase_search=phrase_search):
+            yield from control_numbers
+
+    def iter_search_pages(self, query_term, field, subfields, page_size=1000, phrase_search=False, cursor='*',
+                          filter_query=None):
+        """a generator function to page through a search with cursorMark and hand back each page with its cursor
+
+        This is iter_search for callers that keep their own place in the result set, like
+        DeltaHarvester: passing a page's cursor back in as cursor starts from the page after it.
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            page_size (int): the number of records to fetch with each request. Default is 1000.
+            phrase_search (bool): whether to search for the full phrase. Default is False.
+            cursor (str): the cursorMark to start from. Default is the start of the result set.
+            filter_query (str): a Solr filter query to narrow the search with, ex. a date range. Default is None.
+
+        Returns:
+            generator. an iterable containing a (list of controlfield_001 values, cursorMark after the page)
+                tuple per page
+
+        Raises:
+            SolrConnectionError: if the index can not be reached
+        """
+        query = self.query_string(query_term, field, subfields, phrase_search=phrase_search)
+        params = {"fq": filter_query} if filter_query else {}
+        for docs, next_cursor in self._iter_pages(query, page_size, cursor=cursor, **params):
+            yield (list(self._control_numbers(docs)), next_cursor)
+
+    def query_string(self, query_term, field, subfields, phrase_search=False):
+        """a method to show the Solr query string a search runs, ex. to tell two searches apart
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            phrase_search (bool): whether to search for the full phrase. Default is False.
+
+        Returns:
+            str. the query string. Ex. 'mdf_245a:banana mdf_245b:banana'
+        """
+        return self._build_query(query_term, field, subfields, phrase_search)
+
+    def search_many(self, terms, field, subfields, method="or", max_clauses=1024, max_query_length=8000,
+                    page_size=1000, workers=4):
+        """a generator function to look up many terms in one field with as few requests as possible
+
+        The terms are packed into batches, each searched with one query: either OR'ed phrase
+        clauses or Solr's terms query parser. A batch never has more than max_clauses clauses
+        (Solr's maxBooleanClauses) or a query longer than max_query_length characters. pysolr
+        sends long queries as form POSTs, so batches stay clear of URL length limits. Up to
+        workers batches are in flight at once over the searcher's session.
+
+        Every control number that comes back is matched to the input terms it was found by
+        comparing the searched fields of the record with the terms. A term matches a value
+        that is equal to it, ignoring case and extra whitespace, or one of the value's whole
+        words, so '9780306406157' matches '9780306406157 (pbk.)' and '123456' matches
+        '(OCoLC)123456', but '1234' does not match '(OCoLC)123456'. A record that matches none
+        of its batch's terms, ex. because the field is indexed but not stored, goes to the only
+        term of a batch of one. From a bigger batch it comes back under None instead.
+
+        Useage:
+            for isbn, bibnumbers in searcher.search_many(isbns, '020', ['a'], method='terms'):
+                ...
+
+        Args:
+            terms (iterable): the strings to look up. Ex. ISBNs or OCLC numbers
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            method (str): or for OR'ed phrase clauses, which go through the field's analysis, or terms for exact
+                matches on the indexed terms. Default is or.
+            max_clauses (int): the most clauses in one query. Default is 1024, Solr's default maxBooleanClauses.
+            max_query_length (int): the most characters in one query. Default is 8000.
+            page_size (int): the number of records to fetch with each request. Default is 1000.
+            workers (int): the most batches to search at the same time. Default is 4.
+
+        Returns:
+            generator. an iterable containing a (term, list of controlfield_001 values) tuple for each distinct
+                term, in the order the terms came in, and a (None, list of controlfield_001 values) tuple after
+                any batch with records that could not be matched to a term
+
+        Raises:
+            ValueError: if method is not or or terms
+        """
+        if method not in SEARCH_MANY_METHODS:
+            raise ValueError("invalid search_many method '{}'".format(method))
+        index_fields = [self.field_creator(field + subfield if subfield else field) for subfield in subfields or ['']]
+        batches = self._term_batches(terms, index_fields, method, max_clauses, max_query_length)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in batches:
+                pending.append((batch, executor.submit(self._search_batch, batch, index_fields, method, page_size)))
+                if len(pending) >= 2 * workers:
+                    batch, future = pending.popleft()
+                    yield from self._pair_batch(batch, future.result())
+            while pending:
+                batch, future = pending.popleft()
+                yield from self._pair_batch(batch, future.result())
+
+    def _term_batches(self, terms, index_fields, method, max_clauses, max_query_length):
+        """a private generator function to pack terms into batches that fit in one query
+
+        Blank terms are dropped and a term is only looked up once, however often it comes in.
+
+        Args:
+            terms (iterable): the strings to look up
+            index_fields (list): the index fields being searched
+            method (str): or or terms
+            max_clauses (int): the most clauses in one query
+            max_query_length (int): the most characters in one query
+
+        Returns:
+            generator. an iterable containing lists of terms
+        """
+        seen = set()
+        batch = []
+        length = 0
+        clauses_per_term = len(index_fields) if method == "or" else 1
+        for term in terms:
+            term = str(term).strip()
+            if not term or term in seen:
+                continue
+            seen.add(term)
+            if method == "or":
+                term_length = sum(len(self.query_creator(index_field, _escape_phrase(term), phrase_term=True)) + 4
+                                  for index_field in index_fields)
+            else:
+                term_length = len(term) + 1
+            if batch and ((len(batch) + 1) * clauses_per_term > max_clauses or length + term_length > max_query_length):
+                yield batch
+                batch = []
+                length = 0
+            batch.append(term)
+            length += term_length
+        if batch:
+            yield batch
+
+    def _build_many_query(self, batch, index_fields, method):
+        """a private method to build the query for a batch of terms
+
+        Args:
+            batch (list): the terms to look up
+            index_fields (list): the index fields being searched
+            method (str): or or terms
+
+        Returns:
+            tuple. the query string and any extra Solr parameters it refers to
+        """
+        if method == "terms":
+            query = " OR ".join('_query_:"{{!terms f={} separator=$separator v=$batch_terms}}"'.format(index_field)
+                                for index_field in index_fields)
+            return (query, {"batch_terms": "\n".join(batch), "separator": "\n"})
+        return (" OR ".join(self.query_creator(index_field, _escape_phrase(term), phrase_term=True)
+                            for term in batch for index_field in index_fields), {})
+
+    def _search_batch(self, batch, index_fields, method, page_size):
+        """a private method to run the query for one batch and collect every matching record
+
+        Args:
+            batch (list): the terms to look up
+            index_fields (list): the index fields being searched
+            method (str): or or terms
+            page_size (int): the number of records to fetch with each request
+
+        Returns:
+            list. the documents found, with their control number and the searched fields
+        """
+        query, params = self._build_many_query(batch, index_fields, method)
+        fields = ",".join(["controlfield_001"] + index_fields)
+        docs = []
+        for page, _ in self._iter_pages(query, page_size, fl=fields, **params):
+            docs += page
+            if len(page) < page_size:
+                break
+        return docs
+
+    def _pair_batch(self, batch, docs):
+        """a private generator function to match the documents found for a batch back to its terms
+
+        Args:
+            batch (list): the terms that were looked up
+            docs (list): the documents found for the batch
+
+        Returns:
+            generator. an iterable containing a (term, list of controlfield_001 values) tuple for each term in the batch,
+                then (None, list of controlfield_001 values) if any record matched none of them
+        """
+        normalized = {}
+        for term in batch:
+            normalized.setdefault(_normalize(term), []).append(term)
+        found = {term: [] for term in batch}
+        unmatched = []
+        for doc in docs:
+            control_numbers = list(self._control_numbers([doc]))
+            matched = set()
+            for key, values in doc.items():
+                if key == "controlfield_001":
+                    continue
+                for value in values if isinstance(values, list) else [values]:
+                    for candidate in _match_keys(str(value)):
+                        matched.update(normalized.get(candidate, ()))
+            if not matched:
+                self.instrumentation.count("solr.unmatched", len(control_numbers))
+                if len(batch) == 1:
+                    matched = set(batch)
+                else:
+                    unmatched += [number for number in control_numbers if number not in unmatched]
+            for term in matched:
+                found[term] += [number for number in control_numbers if number not in found[term]]
+        for term in batch:
+            yield (term, found[term])
+        if unmatched:
+            yield (None, unmatched)
+
+    def _build_query(self, query_term, field, subfields, phrase_search=False):
+        """a private method to build the Solr query string for a search
+
+        Args:
+            query_term (str): the string to be searched.
+            field (str): a MARC field number as a string.
+            subfields (list): a list of subfield codes related to the field that you want to search.
+
+        KWArgs:
+            phrase_search (bool): a flag indicating whether to build a phrase query
+
+        Returns:
+            str. the query string. Ex. 'mdf_245a:banana mdf_245b:banana'
+        """
+        query_chain = []
+        for subfield in subfields:
+            if subfield:
+                initial_string = field + subfield
+            else:
+                initial_string = field
+            index_field = self.field_creator(initial_string)
+            query_chain.append(self.query_creator(index_field, query_term, phrase_term=phrase_search))
+        if query_chain:
+            return ' '.join(query_chain)
+        return query_term
+
+    def _iter_pages(self, query, page_size, fl='controlfield_001', cursor='*', **params):
+        """a private generator function to page through a query with cursorMark
+
+        Args:
+            query (str): a Solr query string
+            page_size (int): the number of records to fetch with each request
+
+        KWArgs:
+            fl (str): the fields to return for each record
+            cursor (str): the cursorMark to start from. Default is the start of the result set.
+            params: any other Solr parameters, ex. fq
+
+        Returns:
+            generator. an iterable containing a (list of documents, next cursorMark) tuple per page
+        """
+        while True:
+            with self.instrumentation.stage("solr.request") as stage, _connection_errors(self.index_url):
+                result = self.solr_index.search(q=query, fl=fl, rows=page_size,
+                                                sort="{} asc".format(self.unique_key), cursorMark=cursor, **params)
+                stage.add("http_200")
+                stage.add("documents", len(result.docs))
+            next_cursor = result.nextCursorMark
+            yield (result.docs, next_cursor)
+            if not result.docs or not next_cursor or next_cursor == cursor:
+                return
+            cursor = next_cursor
+
+    def _control_numbers(self, docs):
+        """a private generator function to pull the controlfield_001 values out of Solr documents
+
+        Args:
+            docs (list): the documents of a Solr response
+
+        Returns:
+            generator. an iterable containing control numbers
+        """
+        for doc in docs:
+            values = doc.get("controlfield_001") or []
+            if isinstance(values, str):
+                values = [values]
+            yield from values
+
+def _escape_phrase(term):
+    """a function to escape a term so it can go between double quotes in a Solr query
+
+    Args:
+        term (str): the term
+
+    Returns:
+        str. the term with backslashes and double quotes escaped
+    """
+    return term.replace('\\', '\\\\').replace('"', '\\"')
+
+def _normalize(value):
+    """a function to fold the case and whitespace of a value before comparing it with a term
+
+    Args:
+        value (str): a term or a field value
+
+    Returns:
+        str. the value in lower case with runs of whitespace collapsed to one space
+    """
+    return ' '.join(value.split()).casefold()
+
+def _match_keys(value):
+    """a function to list the strings a field value can be matched to a term by
+
+    Args:
+        value (str): a field value
+
+    Returns:
+        set. the normalized value, its whitespace separated words and its runs of letters and digits.
+            Ex. {'(ocolc)123456 ocm', '(ocolc)123456', 'ocm', 'ocolc', '123456'}
+    """
+    value = _normalize(value)
+    words = value.split(' ')
+    return {value, *words, *(word for word in _NON_WORD.split(value) if word)}
@@ -1,6 +1,27 @@
 """utility functions for working with ole index data
 """
 
+def create_http_session(pool_connections=10, pool_maxsize=10, max_retries=0):
+    """a method to build a keep-alive HTTP session that several searchers can share
+
+    requests is only imported when the first session is made.
+
+    Args:
+        pool_connections (int): the number of hosts to keep connection pools for
+        pool_maxsize (int): the most connections to keep open to a single host
+        max_retries (int): how many times to retry a request that failed to connect
+
+    Returns:
+        requests.Session. Ex. SolrIndexSearcher(url, 'ole', session=create_http_session(pool_maxsize=20))
+    """
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 def create_ole_index_field(field_name):
     """a method to return the marc field name as entered in the OLE index
 
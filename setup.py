@@ -9,6 +9,12 @@ setup(
     description="An application to extract MARC records from the catalog",
     keywords="python3.6 iiif-presentation manifests marc",
     packages=['marcextraction'],
+    python_requires='>=3.6',
+    entry_points={
+        'console_scripts': [
+            'marc-export=marcextraction.cli:main',
+        ],
+    },
     classifiers=[
         "License :: OSI Approved :: GNU Library or Lesser " +
         "General Public License (LGPL)",
@@ -21,5 +27,8 @@ setup(
         'pymarc',
         'pysolr',
         'requests'
-    ]
+    ],
+    extras_require = {
+        'columnar': ['numpy'],
+    }
 )
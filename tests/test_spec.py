@@ -1,13 +1,40 @@
 
-from os import remove, rmdir, getlogin, listdir, environ
+import asyncio
+import bz2
+import gzip
+import lzma
+import pickle
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from os import remove, rmdir, getlogin, listdir, environ, mkdir
 from os.path import join
-from pymarc import Record, Field
+from pymarc import Record, Field, parse_xml_to_array, record_to_xml
+from pysolr import Results, SolrError
+from requests.exceptions import ConnectionError as RequestsConnectionError
 import unittest
+import zlib
+from unittest.mock import Mock, patch
 from six import BytesIO
 from tempfile import TemporaryFile, TemporaryDirectory
-from urllib.parse import urlparse
+from time import monotonic, sleep
+from urllib.parse import unquote, urlparse
+from urllib3.exceptions import ProtocolError
 
-from marcextraction.interfaces import SolrIndexSearcher, OnDiskSearcher, OLERecordFinder
+from benchmarks.corpus import write_corpus
+from benchmarks.imports import run_benchmarks as run_import_benchmarks
+from benchmarks.servers import SRUStandIn, SolrStandIn
+from marcextraction.asynchronous import AsyncOLERecordFinder
+from marcextraction import columnar
+from marcextraction.cli import main
+from marcextraction.cache import OLERecordCache, QueryCache, RecordCache
+from marcextraction.federated import BackendTimeout, FederatedSearcher
+from marcextraction.harvest import DeltaHarvester
+from marcextraction.instrumentation import MetricsAggregator
+from marcextraction.interfaces import SolrIndexSearcher, OnDiskSearcher, OLERecordFinder, OLEBatchRecordFinder, \
+    SolrConnectionError
+from marcextraction.offsets import ControlNumberIndex
+from marcextraction.pipeline import ExportPipeline
+from marcextraction.query import QuerySyntaxError
 from marcextraction.utils import create_ole_index_field, create_ole_query
 
 # in order to run tests need to run locally from a computer on the uchicago library subnet to test against library OLE indexes
@@ -124,3 +151,837 @@ class Tests(unittest.TestCase):
         finder = OLERecordFinder("4270571", url_object.netloc, url_object.scheme, url_object.path)
         check = finder.get_record()
         self.assertEqual(check[0], True)
+
+    def testStreamingSearchOnDiscRecords(self):
+        tempdir = TemporaryDirectory()
+
+        record1 = Record()
+        record1.add_field(Field(tag='245', indicators=['0', '1'],
+                                subfields=[
+                                'a', 'Test book :',
+                                'b', 'a simple test object /',
+                                'c', 'John Doe'])
+                          )
+
+        record2 = Record()
+        record2.add_field(Field(tag='245', indicators=['0', '1'],
+                                subfields=[
+                                'a', 'Another test book :',
+                                'b', 'a second test object /',
+                                'c', 'Jane Doe'])
+                          )
+        with open(join(tempdir.name, 'file1.mrc'), 'wb') as write_file:
+            write_file.write(record1.as_marc() + record2.as_marc())
+        with open(join(tempdir.name, 'notes.txt'), 'wb') as write_file:
+            write_file.write(b'not a marc record')
+
+        searcher = OnDiskSearcher(location=tempdir.name, streaming=True)
+        self.assertIsNone(searcher.records)
+        self.assertEqual(searcher.count(), 2)
+        result = searcher.search('test object', '245', ['b'])
+        self.assertFalse(isinstance(result, list))
+        self.assertEqual(len(list(result)), 2)
+
+        data = record1.as_marc() + record2.as_marc()
+        stream = BytesIO(b'header' + data)
+        stream.seek(6)
+        searcher = OnDiskSearcher(writeable_object=stream, streaming=True)
+        self.assertEqual(searcher.count(), 2)
+        self.assertEqual(len(list(searcher.search('test object', '245', ['b']))), 2)
+        pipe = BytesIO(data)
+        pipe.seekable = lambda: False
+        searcher = OnDiskSearcher(writeable_object=pipe, streaming=True)
+        self.assertEqual(searcher.count(), 2)
+        self.assertRaises(ValueError, lambda: list(searcher.search('test object', '245', ['b'])))
+
+        missing = OnDiskSearcher(location=join(tempdir.name, 'missing'), index=True)
+        self.assertEqual(missing.count(), 0)
+        self.assertEqual(missing.search('test', '245', ['a']), [])
+        self.assertEqual(missing.errors, ['no such location {}'.format(join(tempdir.name, 'missing'))])
+        tempdir.cleanup()
+
+    def testIndexedSearchMatchesFullScan(self):
+        records = []
+        for title in ['Test book :', 'Another test book :', 'Contest booklet', 'Unrelated']:
+            record = Record()
+            record.add_field(Field(tag='245', indicators=['0', '1'],
+                                   subfields=['a', title, 'c', 'John Doe']))
+            records.append(record.as_marc())
+        scanner = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)))
+        indexed = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)), index=True)
+        for query in ['Test book', 'test book', 'est book', 'book', 'John', 'zebra', ':']:
+            self.assertEqual(indexed.search(query, '245', ['a']),
+                             scanner.search(query, '245', ['a']))
+        self.assertEqual(len(indexed.search('est book', '245', ['a'])), 3)
+        self.assertEqual(indexed.index.candidates('Unrelated', '245', ['a']), [3])
+
+    def testRecordCacheOnlyReparsesChangedFiles(self):
+        tempdir = TemporaryDirectory()
+        for n, title in enumerate(['Test book :', 'Another test book :', 'Third book']):
+            record = Record()
+            record.add_field(Field(tag='245', indicators=['0', '1'], subfields=['a', title]))
+            with open(join(tempdir.name, 'file{}.mrc'.format(n)), 'wb') as write_file:
+                write_file.write(record.as_marc())
+        cache_home = TemporaryDirectory()
+        environment = patch.dict(environ, {'XDG_CACHE_HOME': cache_home.name})
+        environment.start()
+        self.addCleanup(environment.stop)
+        searcher = OnDiskSearcher(location=tempdir.name, cache=True)
+        self.assertEqual(searcher.count(), 3)
+        self.assertEqual(len(listdir(join(cache_home.name, 'marcextraction'))), 1)
+        self.assertEqual(sorted(listdir(tempdir.name)), ['file0.mrc', 'file1.mrc', 'file2.mrc'])
+
+        record = Record()
+        record.add_field(Field(tag='245', indicators=['0', '1'], subfields=['a', 'Changed book']))
+        with open(join(tempdir.name, 'file0.mrc'), 'wb') as write_file:
+            write_file.write(record.as_marc() + record.as_marc())
+        remove(join(tempdir.name, 'file2.mrc'))
+        with patch.object(OnDiskSearcher, '_check_if_real_marc_record',
+                          autospec=True, side_effect=OnDiskSearcher._check_if_real_marc_record) as parse:
+            searcher = OnDiskSearcher(location=tempdir.name, cache=True)
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(searcher.count(), 3)
+        self.assertEqual(len(searcher.search('Changed', '245', ['a'])), 2)
+
+        class Exploit:
+            def __reduce__(self):
+                return (mkdir, (join(tempdir.name, 'pwned'),))
+        for name in [OnDiskSearcher.cache_name, OnDiskSearcher.cache_name + '.tmp']:
+            with open(join(tempdir.name, name), 'wb') as write_file:
+                write_file.write(pickle.dumps({'version': 1, 'files': Exploit()}))
+        searcher = OnDiskSearcher(location=tempdir.name, cache=join(tempdir.name, OnDiskSearcher.cache_name))
+        self.assertNotIn('pwned', listdir(tempdir.name))
+        self.assertEqual(searcher.count(), 3)
+        for searcher in [OnDiskSearcher(location=tempdir.name), OnDiskSearcher(location=tempdir.name, streaming=True)]:
+            self.assertEqual(searcher.count(), 3)
+            self.assertEqual(searcher.errors, [])
+        compact = OnDiskSearcher(location=tempdir.name, cache=True, compact=True)
+        compact = OnDiskSearcher(location=tempdir.name, cache=True, compact=True)
+        self.assertEqual(len(compact.search('Changed', '245', ['a'])), 2)
+
+        cache_path = join(cache_home.name, 'racing.sqlite')
+        file_path = join(tempdir.name, 'file1.mrc')
+        cache = RecordCache(cache_path)
+        self.assertIsNone(cache.get(file_path))
+        parsed = [{'leader': 'before the change'}]
+        with open(file_path, 'ab') as write_file:
+            write_file.write(record.as_marc())
+        cache.put(file_path, parsed)
+        cache.save()
+        cache.close()
+        cache = RecordCache(cache_path)
+        self.assertIsNone(cache.get(file_path))
+        cache.put(file_path, parsed)
+        cache.save()
+        cache.close()
+        cache = RecordCache(cache_path)
+        self.assertEqual(cache.get(file_path), parsed)
+        cache.close()
+        cache_home.cleanup()
+        tempdir.cleanup()
+
+    def testParallelLoadMatchesSerialLoad(self):
+        tempdir = TemporaryDirectory()
+        for n in range(12):
+            record = Record()
+            record.add_field(Field(tag='245', indicators=['0', '1'],
+                                   subfields=['a', 'Test book number {}'.format(n)]))
+            with open(join(tempdir.name, 'file{:02}.mrc'.format(n)), 'wb') as write_file:
+                write_file.write(record.as_marc())
+        with open(join(tempdir.name, 'notes.txt'), 'wb') as write_file:
+            write_file.write(b'not a marc record')
+        serial = OnDiskSearcher(location=tempdir.name)
+        with patch.object(OnDiskSearcher, 'chunk_size', 1):
+            parallel = OnDiskSearcher(location=tempdir.name, workers=3)
+        self.assertEqual(parallel.records, serial.records)
+        self.assertEqual(parallel.count(), 12)
+        self.assertEqual(parallel.errors,
+                         ["not a valid MARC record at byte 0 of {}".format(join(tempdir.name, 'notes.txt'))])
+        tempdir.cleanup()
+
+    def testControlNumberIndexLookup(self):
+        tempdir = TemporaryDirectory()
+        marc_path = join(tempdir.name, 'dump.mrc')
+        with open(marc_path, 'wb') as write_file:
+            for n in range(5):
+                record = Record()
+                record.add_field(Field(tag='001', data='100{}'.format(n)))
+                record.add_field(Field(tag='245', indicators=['0', '1'],
+                                       subfields=['a', 'Test book number {}'.format(n)]))
+                write_file.write(record.as_marc())
+            write_file.write(b'garbage\x1d')
+        index = ControlNumberIndex.build(marc_path)
+        self.assertEqual(index.count(), 5)
+        self.assertEqual(len(index.errors), 1)
+        index.save(marc_path + '.idx')
+        with ControlNumberIndex.load(marc_path + '.idx', marc_path) as loaded:
+            is_it_there, data = loaded.get_record('1003')
+            self.assertEqual(is_it_there, True)
+            self.assertIsInstance(data[0], bytes)
+            self.assertEqual(parse_xml_to_array(BytesIO(data[0]))[0]['245']['a'], 'Test book number 3')
+            self.assertEqual(loaded.get_record('2000'), (False, None))
+
+        with open(marc_path, 'ab') as write_file:
+            write_file.write(record.as_marc())
+        self.assertRaises(ValueError, ControlNumberIndex.load, marc_path + '.idx', marc_path)
+        with ControlNumberIndex.load(marc_path + '.idx', marc_path, rebuild=True) as rebuilt:
+            self.assertEqual(rebuilt.count(), 6)
+        with ControlNumberIndex.load(marc_path + '.idx', marc_path) as reloaded:
+            with open(marc_path, 'ab') as write_file:
+                write_file.write(b'more')
+            self.assertRaises(ValueError, reloaded.get_record, '1003')
+        with ControlNumberIndex.load(marc_path + '.idx', marc_path, rebuild=True) as mapped:
+            self.assertEqual(mapped.get_record('1003')[0], True)
+            with open(marc_path, 'ab') as write_file:
+                write_file.write(b'more')
+            self.assertRaises(ValueError, mapped.get_record, '1003')
+        tempdir.cleanup()
+
+    def testCompactRecordsSearchLikeDictionaries(self):
+        records = []
+        for n, title in enumerate(['Test book :', 'Another test book :', 'Unrelated']):
+            record = Record()
+            record.add_field(Field(tag='001', data='100{}'.format(n)))
+            record.add_field(Field(tag='245', indicators=['0', '1'],
+                                   subfields=['a', title, 'c', 'John Doe']))
+            records.append(record.as_marc())
+        plain = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)))
+        compact = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)), compact=True, index=True)
+        self.assertEqual(compact.count(), 3)
+        result = compact.search('test book', '245', ['a'])
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].control_number(), '1001')
+        self.assertEqual([x.as_dict() for x in compact.search('book', '245', ['a', 'c'])],
+                         plain.search('book', '245', ['a', 'c']))
+
+    def _sru_response(self, url, **kwargs):
+        query = unquote(url.split('query=')[1].split('&')[0])
+        bibnumbers = [x.split('=')[1] for x in query.split(' OR ')]
+        records = ''.join(
+            '<srw:record><srw:recordData><record><controlfield tag="001">{}</controlfield>'
+            '</record></srw:recordData></srw:record>'.format(x) for x in bibnumbers if x != '3')
+        body = '<srw:searchRetrieveResponse xmlns:srw="http://www.loc.gov/zing/srw/">' \
+               '<srw:records>{}</srw:records></srw:searchRetrieveResponse>'.format(records)
+        return Mock(status_code=200, raw=BytesIO(body.encode('utf-8')))
+
+    def testBatchedOleRecordFinder(self):
+        session = Mock()
+        session.get.side_effect = self._sru_response
+        finder = OLEBatchRecordFinder('example.com', 'https', '/sru', batch_size=2, session=session)
+        found = list(finder.find(['1', '2', '3', '4', '5']))
+        self.assertEqual([x[0] for x in found], ['1', '2', '4', '5'])
+        self.assertEqual(found[0][1], b'<record><controlfield tag="001">1</controlfield></record>')
+        self.assertEqual(finder.not_found, ['3'])
+        self.assertEqual(session.get.call_count, 3)
+        self.assertRaises(ValueError, OLEBatchRecordFinder, 'example.com', 'https', '/sru', batch_size=50,
+                          maximum_records=10)
+        self.assertRaises(ValueError, AsyncOLERecordFinder, 'example.com', 'https', '/sru', batch_size=50,
+                          maximum_records=10)
+
+        def failing_response(url, **kwargs):
+            if 'id%3D1' in url:
+                raise RequestsConnectionError('connection refused')
+            if 'id%3D3' in url:
+                return Mock(status_code=503)
+            if 'id%3D5' in url:
+                return Mock(status_code=200, raw=BytesIO(b'<srw:searchRetrieveResponse><srw:records>'))
+            return self._sru_response(url, **kwargs)
+        session.get.reset_mock()
+        session.get.side_effect = failing_response
+        finder = OLEBatchRecordFinder('example.com', 'https', '/sru', batch_size=2, session=session)
+        found = list(finder.find(['1', '2', '3', '4', '5', '6', '7', '8']))
+        self.assertEqual([x[0] for x in found], ['7', '8'])
+        self.assertEqual(finder.not_found, [])
+        self.assertEqual(len(finder.errors), 3)
+        self.assertIn('connection refused for the batch starting with 1', finder.errors[0])
+        self.assertIn('HTTP 503 for the batch starting with 3', finder.errors[1])
+        self.assertIn('batch starting with 5', finder.errors[2])
+        self.assertEqual(session.get.call_count, 4)
+
+    def testAsyncOleRecordFinderRetries(self):
+        failures = []
+        def flaky_response(url, **kwargs):
+            if not failures:
+                failures.append(url)
+                return Mock(status_code=503)
+            return self._sru_response(url, **kwargs)
+        session = Mock()
+        session.get.side_effect = flaky_response
+        finder = AsyncOLERecordFinder('example.com', 'https', '/sru', batch_size=1, session=session,
+                                      concurrency=2, backoff=0)
+
+        async def collect():
+            return [pair async for pair in finder.find(['1', '2', '3', '4'])]
+        loop = asyncio.new_event_loop()
+        try:
+            found = loop.run_until_complete(collect())
+        finally:
+            loop.close()
+        self.assertEqual(sorted(x[0] for x in found), ['1', '2', '4'])
+        self.assertEqual(finder.not_found, ['3'])
+        self.assertEqual(session.get.call_count, 5)
+
+        class DroppedConnection(BytesIO):
+            def read(self, *args):
+                raise ProtocolError('Connection broken: IncompleteRead')
+        dropped = []
+        def broken_response(url, **kwargs):
+            if 'id%3D6' in url:
+                return Mock(status_code=200, raw=BytesIO(b'<srw:searchRetrieveResponse><srw:records>'))
+            if not dropped:
+                dropped.append(url)
+                return Mock(status_code=200, raw=DroppedConnection())
+            return self._sru_response(url, **kwargs)
+        session.get.reset_mock()
+        session.get.side_effect = broken_response
+        finder = AsyncOLERecordFinder('example.com', 'https', '/sru', batch_size=1, session=session,
+                                      concurrency=2, retries=1, backoff=0)
+
+        async def collect_broken():
+            return [pair async for pair in finder.find(['5', '6', '7'])]
+        loop = asyncio.new_event_loop()
+        try:
+            found = loop.run_until_complete(collect_broken())
+        finally:
+            loop.close()
+        self.assertEqual(sorted(x[0] for x in found), ['5', '7'])
+        self.assertEqual(len(finder.errors), 1)
+        self.assertIn('batch starting with 6', finder.errors[0])
+        self.assertEqual(finder.not_found, [])
+        self.assertEqual(session.get.call_count, 5)
+
+        def slow_response(url, **kwargs):
+            if 'id%3D8' not in url:
+                sleep(1)
+            return self._sru_response(url, **kwargs)
+        session.get.side_effect = slow_response
+        finder = AsyncOLERecordFinder('example.com', 'https', '/sru', batch_size=1, session=session,
+                                      concurrency=2, backoff=0)
+
+        async def take_first():
+            found = finder.find(['8', '9'])
+            first = await found.__anext__()
+            started = monotonic()
+            await found.aclose()
+            return first, monotonic() - started
+        loop = asyncio.new_event_loop()
+        try:
+            first, closing = loop.run_until_complete(take_first())
+        finally:
+            loop.close()
+        self.assertEqual(first[0], '8')
+        self.assertLess(closing, 0.5)
+
+    def testIterSearchPagesWithCursorMark(self):
+        pages = {'*': ['1', '2'], 'cursor-1': ['3', '4'], 'cursor-2': ['5'], 'cursor-3': []}
+        def solr_page(q, fl, rows, sort, cursorMark, **params):
+            next_cursor = 'cursor-{}'.format(int(cursorMark.split('-')[1]) + 1) if cursorMark != '*' else 'cursor-1'
+            return Results({'response': {'numFound': 5, 'docs': [{'controlfield_001': [x]} for x in pages[cursorMark]]},
+                            'nextCursorMark': next_cursor})
+        searcher = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole')
+        with patch.object(searcher.solr_index, 'search', side_effect=solr_page) as search:
+            self.assertEqual(list(searcher.iter_search('banana', '245', ['a', 'b'], page_size=2)),
+                             ['1', '2', '3', '4', '5'])
+        self.assertEqual(search.call_args[1]['q'], 'mdf_245a:banana mdf_245b:banana')
+        self.assertEqual(search.call_args[1]['sort'], 'id asc')
+
+    def testSolrIndexSearcherConnectsLazily(self):
+        first = SolrIndexSearcher('http://localhost:1/solr/ole', 'ole')
+        second = SolrIndexSearcher('http://localhost:1/solr/other', 'ole')
+        self.assertIs(first.session, second.session)
+        self.assertRaises(SolrConnectionError, first.check_connection)
+        self.assertRaises(SolrConnectionError, SolrIndexSearcher,
+                          'http://localhost:1/solr/ole', 'ole', validate=True, timeout=1)
+        self.assertRaises(SolrConnectionError, first.search, 'banana', '245', ['a'])
+        self.assertRaises(SolrError, list, first.iter_search('banana', '245', ['a']))
+        session = Mock()
+        session.get.return_value = Mock(ok=False, status_code=503)
+        unavailable = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole', session=session)
+        self.assertRaises(SolrConnectionError, unavailable.check_connection)
+        self.assertEqual(session.get.call_args[0][0], 'http://localhost:8983/solr/ole/select')
+        session.get.return_value = Mock(ok=True, status_code=200)
+        unavailable.check_connection()
+
+    def testQueryCacheAnswersRepeatedSearches(self):
+        tempdir = TemporaryDirectory()
+        cache_path = join(tempdir.name, 'queries.sqlite')
+        cache = QueryCache(max_entries=2, path=cache_path)
+        searcher = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole', cache=cache)
+        response = Results({'response': {'numFound': 1, 'docs': [{'controlfield_001': ['1']}]}})
+        with patch.object(searcher.solr_index, 'search', return_value=response) as search:
+            self.assertEqual(searcher.search('banana', '245', ['a']), ['1'])
+            self.assertEqual(searcher.search('banana', '245', ['a']), ['1'])
+            searcher.search('apple', '245', ['a'])
+            searcher.search('pear', '245', ['a'])
+        self.assertEqual(search.call_count, 3)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['entries'], 2)
+        cache.close()
+
+        reopened = QueryCache(max_entries=2, path=cache_path)
+        searcher = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole', cache=reopened)
+        with patch.object(searcher.solr_index, 'search', return_value=response) as search:
+            searcher.search('pear', '245', ['a'])
+        self.assertEqual(search.call_count, 0)
+        reopened.close()
+
+        expiring = QueryCache(ttl=-1)
+        expiring.put('key', ['1'])
+        self.assertIsNone(expiring.get('key'))
+        tempdir.cleanup()
+
+    def testExportPipelineStreamsRecordsToAFile(self):
+        searcher = Mock()
+        searcher.iter_search.return_value = iter(['1', '2', '3', '4', '5'])
+        session = Mock()
+        session.get.side_effect = self._sru_response
+        finder = OLEBatchRecordFinder('example.com', 'https', '/sru', batch_size=2, session=session)
+        reports = []
+        pipeline = ExportPipeline(searcher, finder, output_format='marc', queue_size=2,
+                                  progress=reports.append, progress_every=2)
+        output = BytesIO()
+        stats = pipeline.run('banana', '245', ['a'], output)
+        self.assertEqual(stats['written'], 4)
+        self.assertEqual(stats['not_found'], 1)
+        self.assertEqual(len(reports), 3)
+        output.seek(0)
+        exported = OnDiskSearcher(writeable_object=output)
+        self.assertEqual(exported.count(), 4)
+
+        def failing_response(url, **kwargs):
+            if 'id%3D3' in url:
+                return Mock(status_code=503)
+            return self._sru_response(url, **kwargs)
+        tempdir = TemporaryDirectory()
+        output_path = join(tempdir.name, 'export.mrc')
+        arguments = ['banana', '245', 'a', '--solr', 'http://example.com/solr', '--ole', 'https://example.com/sru',
+                     '--batch-size', '2', '--output', output_path, '--quiet']
+        with patch('marcextraction.cli.SolrIndexSearcher') as searcher_class, patch('marcextraction.cli.stderr'):
+            searcher_class.return_value.iter_search.side_effect = lambda *args, **kwargs: iter(['1', '2', '4'])
+            searcher_class.return_value.session.get.side_effect = self._sru_response
+            self.assertEqual(main(arguments), 0)
+            searcher_class.return_value.iter_search.side_effect = lambda *args, **kwargs: iter(['1', '3', '4'])
+            searcher_class.return_value.session.get.side_effect = failing_response
+            self.assertEqual(main(arguments), 1)
+        tempdir.cleanup()
+
+    def testBenchmarkCorpusAndStandIns(self):
+        tempdir = TemporaryDirectory()
+        control_numbers = write_corpus(tempdir.name, 25, records_per_file=10, seed=3)
+        self.assertEqual(len(listdir(tempdir.name)), 3)
+        searcher = OnDiskSearcher(location=tempdir.name)
+        self.assertEqual(searcher.count(), 25)
+        with SolrStandIn(control_numbers) as server:
+            found = list(SolrIndexSearcher(server.url, 'ole').iter_search('banana', '245', ['a'], page_size=10))
+        self.assertEqual(found, control_numbers)
+        with SRUStandIn.from_corpus(25, seed=3) as server:
+            url = urlparse(server.url)
+            finder = OLEBatchRecordFinder(url.netloc, url.scheme, url.path, batch_size=10)
+            fetched = dict(finder.find(control_numbers + ['999']))
+        self.assertEqual(sorted(fetched), sorted(control_numbers))
+        self.assertEqual(finder.not_found, ['999'])
+        tempdir.cleanup()
+
+    def testMetricsAggregatorProfilesEachStage(self):
+        tempdir = TemporaryDirectory()
+        write_corpus(tempdir.name, 30, records_per_file=10, seed=1)
+        metrics = MetricsAggregator()
+        searcher = OnDiskSearcher(location=tempdir.name, instrumentation=metrics)
+        found = searcher.search('banana', '245', ['a'])
+        session = Mock()
+        session.get.side_effect = self._sru_response
+        finder = OLEBatchRecordFinder('example.com', 'https', '/sru', batch_size=2, session=session,
+                                      instrumentation=metrics)
+        list(finder.find(['1', '2', '3']))
+        stages = metrics.summary()['stages']
+        self.assertEqual(stages['ondisk.read']['calls'], 3)
+        self.assertEqual(stages['ondisk.read']['bytes'], sum(
+            len(open(join(tempdir.name, name), 'rb').read()) for name in listdir(tempdir.name)))
+        self.assertEqual(stages['ondisk.decode']['records'], 30)
+        self.assertEqual(stages['ondisk.as_dict']['records'], 30)
+        self.assertEqual(stages['ondisk.search']['scanned'], 30)
+        self.assertEqual(stages['ondisk.search']['matches'], len(found))
+        self.assertEqual(stages['ole.request']['http_200'], 2)
+        self.assertEqual(stages['ole.parse']['records'], 2)
+        self.assertIn('ondisk.decode', metrics.report())
+        tempdir.cleanup()
+
+    def testBooleanQueryReturnsEachRecordOnce(self):
+        records = []
+        for n, (title, subject, note) in enumerate([('Test book : test book', 'Bananas', None),
+                                                    ('Test book', 'Apples', None),
+                                                    ('Another test', 'Bananas', 'Local note'),
+                                                    ('Testing', 'Banana trees', None)]):
+            record = Record()
+            record.add_field(Field(tag='001', data='100{}'.format(n)))
+            record.add_field(Field(tag='245', indicators=['0', '1'], subfields=['a', title, 'b', title]))
+            record.add_field(Field(tag='650', indicators=[' ', '0'], subfields=['a', subject]))
+            if note:
+                record.add_field(Field(tag='590', indicators=[' ', ' '], subfields=['a', note]))
+            records.append(record.as_marc())
+        searcher = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)), index=True)
+        def control_numbers(found):
+            return [x['fields'][0]['001'] for x in found]
+        self.assertEqual(len(searcher.search('book', '245', ['a', 'b'])), 4)
+        self.assertEqual(control_numbers(searcher.query('245ab:book')), ['1000', '1001'])
+        self.assertEqual(control_numbers(searcher.query('245a:test AND 650a:Banan* AND NOT 590')), ['1000'])
+        self.assertEqual(control_numbers(searcher.query('245a:"Test book :" OR 650a:/trees$/')), ['1000', '1003'])
+        self.assertEqual(control_numbers(searcher.query('245a:TEST 590', ignore_case=True)), ['1002'])
+        self.assertEqual(control_numbers(searcher.query('001:1001')), ['1001'])
+        with self.assertRaises(QuerySyntaxError):
+            searcher.query('245a:test AND (650a:bananas')
+
+    @unittest.skipIf(find_spec('numpy') is None, "NumPy is not installed")
+    def testColumnarStoreFiltersAndCounts(self):
+        records = []
+        for n, (place, year, subjects) in enumerate([('Chicago', 'c1901.', ['Maps', 'Lakes']),
+                                                     ('Chicago', '1925', ['Maps', 'Maps']),
+                                                     ('Boston', '1890.', ['Rivers']),
+                                                     ('Chicago Heights', '[1950?]', ['Lakes'])]):
+            record = Record()
+            record.add_field(Field(tag='001', data='100{}'.format(n)))
+            record.add_field(Field(tag='260', indicators=[' ', ' '], subfields=['a', place, 'c', year]))
+            for subject in subjects:
+                record.add_field(Field(tag='650', indicators=[' ', '0'], subfields=['a', subject]))
+            records.append(record.as_marc())
+        searcher = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)))
+        tempdir = TemporaryDirectory()
+        searcher.project(['001', '260a', '260c', '650a']).save(tempdir.name)
+        store = columnar.ColumnarStore.load(tempdir.name)
+        self.assertEqual(list(store.equals('260a', 'Chicago')), [0, 1])
+        self.assertEqual(list(store.prefix('260a', 'Chicago')), [0, 1, 3])
+        self.assertEqual(list(store.contains('650a', 'ake')), [0, 3])
+        self.assertEqual(list(store.between('260c', 1900, 1950)), [0, 1, 3])
+        self.assertEqual(store.group_count('650a'), [('Lakes', 2), ('Maps', 2), ('Rivers', 1)])
+        self.assertEqual(store.group_count('650a', record_ids=store.between('260c', high=1910)),
+                         [('Lakes', 1), ('Maps', 1), ('Rivers', 1)])
+        self.assertEqual(store.values('001', 3), ['1003'])
+        del store
+        tempdir.cleanup()
+
+    def testImportsOnlyPullInTheBackendThatIsUsed(self):
+        report = run_import_benchmarks(repeat=1)
+        self.assertEqual(report['regressions'], [])
+        loaded = {x['statement']: x['loaded'] for x in report['results']}
+        self.assertEqual(loaded['import marcextraction.utils'], [])
+        self.assertEqual(loaded['from marcextraction import OnDiskSearcher'], ['pymarc'])
+
+    def testDeltaHarvestResumesFromItsCheckpoint(self):
+        tempdir = TemporaryDirectory()
+        state_path = join(tempdir.name, 'banana.state.json')
+        pages = {'*': ['1', '2'], 'cursor-1': ['3', '4'], 'cursor-2': ['5'], 'cursor-3': []}
+        requests = []
+        failures = [SolrConnectionError('connection reset')]
+        def solr_page(q, fl, rows, sort, cursorMark, fq):
+            requests.append((cursorMark, fq))
+            if cursorMark == 'cursor-2' and failures:
+                raise failures.pop()
+            next_cursor = 'cursor-{}'.format(int(cursorMark.split('-')[1]) + 1) if cursorMark != '*' else 'cursor-1'
+            return Results({'response': {'numFound': 5, 'docs': [{'controlfield_001': [x]} for x in pages[cursorMark]]},
+                            'nextCursorMark': next_cursor})
+        times = iter([datetime(2020, 1, 1, tzinfo=timezone.utc), datetime(2020, 1, 2, tzinfo=timezone.utc)])
+        searcher = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole')
+        with patch.object(searcher.solr_index, 'search', side_effect=solr_page):
+            harvested = []
+            harvester = DeltaHarvester(searcher, state_path, clock=lambda: next(times))
+            with self.assertRaises(SolrConnectionError):
+                for control_number in harvester.harvest('banana', '245', ['a'], page_size=2):
+                    harvested.append(control_number)
+            self.assertEqual(harvested, ['1', '2', '3', '4'])
+            self.assertEqual(DeltaHarvester(searcher, state_path).state['run']['cursor'], '*')
+            harvester.commit()
+            harvester = DeltaHarvester(searcher, state_path, clock=lambda: next(times))
+            self.assertEqual(harvester.state['run']['cursor'], 'cursor-2')
+            self.assertEqual(list(harvester.harvest('banana', '245', ['a'], page_size=2)), ['5'])
+            self.assertIsNone(DeltaHarvester(searcher, state_path).state['high_water_mark'])
+            harvester.commit()
+            self.assertEqual(requests[0][1], 'last_indexed:[* TO 2020-01-01T00:00:00Z]')
+            self.assertEqual(requests[-1][1], 'last_indexed:[* TO 2020-01-01T00:00:00Z]')
+            self.assertEqual(harvester.state['high_water_mark'], '2020-01-01T00:00:00Z')
+            self.assertIsNone(harvester.state['run'])
+            del requests[:]
+            list(DeltaHarvester(searcher, state_path, clock=lambda: next(times)).harvest('banana', '245', ['a']))
+            self.assertEqual(requests[0], ('*', 'last_indexed:{2020-01-01T00:00:00Z TO 2020-01-02T00:00:00Z]'))
+            self.assertRaises(ValueError, DeltaHarvester(searcher, state_path).harvest('apple', '245', ['a']).__next__)
+        tempdir.cleanup()
+
+    def testExportOnlyCheckpointsAHarvestOnceItIsWritten(self):
+        tempdir = TemporaryDirectory()
+        state_path = join(tempdir.name, 'banana.state.json')
+        arguments = ['banana', '245', 'a', '--solr', 'http://example.com/solr', '--ole', 'https://example.com/sru',
+                     '--batch-size', '2', '--output', join(tempdir.name, 'export.mrc'), '--quiet', '--state', state_path]
+        pages = [(['1', '2'], 'cursor-1'), (['4', '5'], 'cursor-2'), (['6'], 'cursor-3')]
+        def failing_response(url, **kwargs):
+            if 'id%3D4' in url:
+                raise RequestsConnectionError('connection reset')
+            return self._sru_response(url, **kwargs)
+        def broken_response(url, **kwargs):
+            raise RuntimeError('fetch stage died')
+        with patch('marcextraction.cli.SolrIndexSearcher') as searcher_class, patch('marcextraction.cli.stderr'):
+            searcher = searcher_class.return_value
+            searcher.query_string.return_value = 'mdf_245a:banana'
+            searcher.iter_search_pages.side_effect = lambda *args, **kwargs: iter(pages)
+            searcher.session.get.side_effect = failing_response
+            self.assertEqual(main(arguments), 1)
+            state = DeltaHarvester(searcher, state_path).state
+            self.assertIsNone(state['high_water_mark'])
+            self.assertEqual(state['run']['cursor'], '*')
+            searcher.session.get.side_effect = broken_response
+            self.assertRaises(RuntimeError, main, arguments)
+            state = DeltaHarvester(searcher, state_path).state
+            self.assertIsNone(state['high_water_mark'])
+            self.assertEqual(state['run']['cursor'], '*')
+            searcher.session.get.side_effect = self._sru_response
+            self.assertEqual(main(arguments), 0)
+            self.assertEqual(searcher.iter_search_pages.call_args[1]['cursor'], '*')
+            state = DeltaHarvester(searcher, state_path).state
+            self.assertIsNotNone(state['high_water_mark'])
+            self.assertIsNone(state['run'])
+            self.assertEqual(state['last_harvested'], 5)
+        tempdir.cleanup()
+
+    def testFederatedSearchMergesBackendsConcurrently(self):
+        records = []
+        for number in ['2', '6']:
+            record = Record()
+            record.add_field(Field(tag='001', data=number))
+            record.add_field(Field(tag='245', indicators=['0', '1'], subfields=['a', 'banana']))
+            records.append(record.as_marc())
+        archive = OnDiskSearcher(writeable_object=BytesIO(b''.join(records)))
+        solr = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole')
+        response = Results({'response': {'numFound': 3, 'docs': [{'controlfield_001': [x]} for x in ['1', '2', '3']]},
+                            'nextCursorMark': '*'})
+        broken = Mock(spec=['search'])
+        broken.search.side_effect = SolrConnectionError('connection refused')
+        slow = Mock(spec=['search'])
+        slow.search.side_effect = lambda *args: sleep(2) or ['7']
+        searcher = FederatedSearcher({'solr': solr, 'archive': archive, 'broken': broken, 'slow': slow}, timeout=0.5)
+        started = monotonic()
+        with patch.object(solr.solr_index, 'search', return_value=response):
+            found = list(searcher.search('banana', '245', ['a']))
+        self.assertLess(monotonic() - started, 1.5)
+        self.assertEqual(sorted(found), ['1', '2', '3', '6'])
+        self.assertEqual(searcher.counts['archive'], 2)
+        self.assertEqual(sorted(searcher.failures), ['broken', 'slow'])
+        self.assertIsInstance(searcher.failures['slow'], BackendTimeout)
+
+        queued = [Mock(spec=['search']) for _ in range(3)]
+        for number, backend in enumerate(queued):
+            backend.search.side_effect = lambda *args, number=number: sleep(0.3) or [str(number)]
+        searcher = FederatedSearcher(queued, timeout=0.5, max_workers=1)
+        self.assertEqual(sorted(searcher.search('banana', '245', ['a'])), ['0', '1', '2'])
+        self.assertEqual(searcher.failures, {})
+
+    def testSingleFileIsReadInChunksAndSkipsBadRecords(self):
+        tempdir = TemporaryDirectory()
+        marc_path = join(tempdir.name, 'delivery.mrc')
+        with open(marc_path, 'wb') as write_file:
+            for n in range(6):
+                record = Record()
+                record.add_field(Field(tag='001', data='100{}'.format(n)))
+                record.add_field(Field(tag='245', indicators=['0', '1'],
+                                       subfields=['a', 'Test book number {}'.format(n)]))
+                data = record.as_marc()
+                if n == 2:
+                    bad_offset = write_file.tell()
+                    data = b'99999' + data[5:]
+                write_file.write(data)
+            write_file.write(b'trailing garbage')
+        with patch.object(OnDiskSearcher, 'buffer_size', 7), patch.object(OnDiskSearcher, 'batch_size', 2):
+            searcher = OnDiskSearcher(location=marc_path)
+            compact = OnDiskSearcher(location=marc_path, compact=True)
+            with open(marc_path, 'rb') as stream:
+                flo = OnDiskSearcher(writeable_object=stream)
+            streaming = OnDiskSearcher(location=marc_path, streaming=True)
+            self.assertEqual(streaming.count(), 5)
+            self.assertEqual(len(list(streaming.search('Test book', '245', ['a']))), 5)
+        self.assertEqual(searcher.count(), 5)
+        self.assertEqual([x.control_number() for x in compact.records], ['1000', '1001', '1003', '1004', '1005'])
+        self.assertEqual(flo.records, searcher.records)
+        self.assertEqual(searcher.errors[0], 'not a valid MARC record at byte {} of {}'.format(bad_offset, marc_path))
+        self.assertEqual(len(searcher.errors), 2)
+        self.assertEqual(len(searcher.search('Test book number 3', '245', ['a'])), 1)
+        tempdir.cleanup()
+
+    def testCompressedFilesAreDecompressedOnTheFly(self):
+        tempdir = TemporaryDirectory()
+        write_corpus(join(tempdir.name, 'plain'), 40, records_per_file=10, seed=2)
+        plain = OnDiskSearcher(location=join(tempdir.name, 'plain'))
+        packed = join(tempdir.name, 'packed')
+        mkdir(packed)
+        names = sorted(listdir(join(tempdir.name, 'plain')))
+        for name, module in zip(names, [gzip, bz2, lzma, None]):
+            with open(join(tempdir.name, 'plain', name), 'rb') as read_file:
+                data = read_file.read()
+            with open(join(packed, name), 'wb') as write_file:
+                write_file.write(module.compress(data) if module else data)
+        serial = OnDiskSearcher(location=packed)
+        parallel = OnDiskSearcher(location=packed, workers=2)
+        streaming = OnDiskSearcher(location=packed, streaming=True)
+        by_number = lambda records: sorted(records, key=lambda record: record['fields'][0]['001'])
+        self.assertEqual(by_number(serial.records), by_number(plain.records))
+        self.assertEqual(parallel.records, serial.records)
+        self.assertEqual(streaming.count(), 40)
+        self.assertEqual(len(list(streaming.search('banana', '245', ['a']))),
+                         len(plain.search('banana', '245', ['a'])))
+        with open(join(packed, names[0]), 'rb') as read_file:
+            compressed = read_file.read()
+        first = OnDiskSearcher(location=join(tempdir.name, 'plain', names[0])).records
+        self.assertEqual(OnDiskSearcher(location=join(packed, names[0])).records, first)
+        self.assertEqual(OnDiskSearcher(writeable_object=BytesIO(compressed), compact=True).count(), 10)
+        truncated = OnDiskSearcher(writeable_object=BytesIO(compressed[:len(compressed) // 2]))
+        self.assertEqual(len(truncated.errors), 1)
+        self.assertIn('could not decompress', truncated.errors[0])
+        intact = zlib.decompressobj(31).decompress(compressed[:len(compressed) // 2]).count(b'\x1d')
+        self.assertGreater(intact, 0)
+        self.assertEqual(truncated.records, first[:intact])
+        streamed = OnDiskSearcher(writeable_object=BytesIO(compressed[:len(compressed) // 2]), streaming=True)
+        self.assertEqual(streamed.count(), intact)
+        self.assertEqual(len(streamed.errors), 1)
+        tempdir.cleanup()
+
+    def testMarcXmlAndJsonAreReadRecordByRecord(self):
+        tempdir = TemporaryDirectory()
+        records = []
+        for n, title in enumerate(['Test book :', 'Another test book :', 'Unrelated']):
+            record = Record()
+            record.add_field(Field(tag='001', data='100{}'.format(n)))
+            record.add_field(Field(tag='245', indicators=['0', '1'], subfields=['a', title, 'c', 'John Doe']))
+            records.append(record)
+        binary = OnDiskSearcher(writeable_object=BytesIO(b''.join(x.as_marc() for x in records)))
+        xml_path = join(tempdir.name, 'records.xml')
+        with open(xml_path, 'wb') as write_file:
+            write_file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                             b'<collection xmlns="http://www.loc.gov/MARC21/slim">\n')
+            for record in records:
+                write_file.write(record_to_xml(record, namespace=False) + b'\n')
+            write_file.write(b'</collection>\n')
+        json_path = join(tempdir.name, 'records.json.gz')
+        with gzip.open(json_path, 'wb') as write_file:
+            for record in records:
+                write_file.write(record.as_json().encode('utf-8') + b'\n')
+            write_file.write(b'{"leader": "broken"\n')
+        fields = lambda searcher: [x['fields'] for x in searcher.records]
+        for path in [xml_path, json_path]:
+            searcher = OnDiskSearcher(location=path, index=True)
+            self.assertEqual(fields(searcher), fields(binary))
+            self.assertEqual(len(searcher.search('test book', '245', ['a'])), 1)
+            streaming = OnDiskSearcher(location=path, streaming=True)
+            self.assertEqual(streaming.count(), 3)
+            self.assertEqual(len(list(streaming.search('test book', '245', ['a']))), 1)
+            compact = OnDiskSearcher(location=path, compact=True)
+            self.assertEqual([x.control_number() for x in compact.records], ['1000', '1001', '1002'])
+        self.assertEqual(searcher.errors, ['not a valid MARC record at line 4 of {}'.format(json_path)])
+        with open(xml_path, 'rb') as read_file:
+            truncated = OnDiskSearcher(writeable_object=BytesIO(read_file.read()[:-40]))
+        self.assertEqual(fields(truncated), fields(binary)[:2])
+        self.assertEqual(len(truncated.errors), 1)
+        tempdir.cleanup()
+
+    def testOleRecordCacheSkipsRecordsItAlreadyHas(self):
+        tempdir = TemporaryDirectory()
+        cache_path = join(tempdir.name, 'ole.sqlite')
+        session = Mock()
+        session.get.side_effect = self._sru_response
+        cache = OLERecordCache(cache_path, max_entries=3)
+        finder = OLEBatchRecordFinder('example.com', 'https', '/sru', batch_size=2, session=session, cache=cache)
+        first = list(finder.find(['1', '2', '3', '4']))
+        self.assertEqual(session.get.call_count, 2)
+        cache.close()
+
+        session.get.reset_mock()
+        cache = OLERecordCache(cache_path, max_entries=3)
+        finder = OLEBatchRecordFinder('example.com', 'https', '/sru', batch_size=2, session=session, cache=cache)
+        self.assertEqual(list(finder.find(['1', '2', '4', '5'])), first + [('5', first[0][1].replace(b'>1<', b'>5<'))])
+        self.assertEqual(session.get.call_count, 1)
+        self.assertEqual(unquote(session.get.call_args[0][0].split('query=')[1].split('&')[0]), 'id=5')
+        self.assertEqual(cache.stats()['entries'], 3)
+        self.assertEqual(len(cache.get_many(['1', '2', '4', '5'])), 3)
+        self.assertIsNotNone(cache.get('5'))
+        self.assertEqual(finder.not_found, [])
+        cache.close()
+
+        dump_path = join(tempdir.name, 'dump.mrc')
+        with open(dump_path, 'wb') as write_file:
+            for n in range(5):
+                record = Record()
+                record.add_field(Field(tag='001', data='900{}'.format(n)))
+                record.add_field(Field(tag='245', indicators=['0', '1'], subfields=['a', 'Warm book {}'.format(n)]))
+                write_file.write(record.as_marc())
+        cache = OLERecordCache(':memory:')
+        self.assertEqual(cache.warm(dump_path, batch_size=2), 5)
+        session.get.reset_mock()
+        is_it_there, data = OLERecordFinder('9003', 'example.com', 'https', '/sru', session=session,
+                                            cache=cache).get_record()
+        self.assertEqual(is_it_there, True)
+        self.assertIn(b'Warm book 3', data[0])
+        self.assertEqual(session.get.call_count, 0)
+        self.assertEqual(cache.stats()['hits'], 1)
+        expiring = OLERecordCache(':memory:', ttl=-1)
+        expiring.put('1', b'<record/>')
+        self.assertIsNone(expiring.get('1'))
+        rejecting = OLERecordCache(':memory:', validate=lambda bibnumber, record, stored: bibnumber != '2')
+        rejecting.put_many([('1', b'<record/>'), ('2', b'<record/>')])
+        self.assertEqual(sorted(rejecting.get_many(['1', '2'])), ['1'])
+        clock = iter(range(100))
+        with patch('marcextraction.cache.time', side_effect=lambda: next(clock)):
+            bounded = OLERecordCache(':memory:', max_bytes=40)
+            for bibnumber in ['1', '2', '3']:
+                bounded.put(bibnumber, b'<record>' + bibnumber.encode('utf-8') + b'</record>')
+            self.assertEqual(sorted(bounded.get_many(['1', '2', '3'])), ['2', '3'])
+            self.assertIsNotNone(bounded.get('2'))
+            bounded.put('4', b'<record>4</record>')
+            self.assertEqual(sorted(bounded.get_many(['1', '2', '3', '4'])), ['2', '4'])
+            self.assertEqual(bounded.stats()['bytes'], 36)
+            bounded.put('5', b'<record>555</record>')
+            self.assertEqual(bounded.stats()['bytes'], 38)
+            self.assertEqual(sorted(bounded.get_many(['1', '2', '3', '4', '5'])), ['2', '5'])
+        tempdir.cleanup()
+
+    def testSearchManyBatchesTermsAndMapsResultsBack(self):
+        index = {'1': ['9780306406157 (pbk.)'], '2': ['0306406152'], '3': ['9780306406157', '0306406152'], '4': ['123']}
+        queries = []
+        def solr_page(q, fl, rows, sort, cursorMark, **params):
+            queries.append((q, params))
+            if 'batch_terms' in params:
+                wanted = params['batch_terms'].split(params['separator'])
+                matches = lambda value: value in wanted
+            else:
+                wanted = [term.split(':"')[1].rstrip('"') for term in q.split(' OR ')]
+                matches = lambda value: any(term in value for term in wanted)
+            docs = [{'controlfield_001': [number], 'mdf_020a': values} for number, values in sorted(index.items())
+                    if any(matches(value) for value in values)]
+            return Results({'response': {'numFound': len(docs), 'docs': docs}, 'nextCursorMark': cursorMark + '+'})
+        searcher = SolrIndexSearcher('http://localhost:8983/solr/ole', 'ole')
+        metrics = MetricsAggregator()
+        searcher.instrumentation = metrics
+        terms = ['9780306406157', '0306406152', ' ', '9780306406157', 'missing']
+        with patch.object(searcher.solr_index, 'search', side_effect=solr_page):
+            found = list(searcher.search_many(terms, '020', ['a'], max_clauses=2, workers=2))
+        self.assertEqual(found, [('9780306406157', ['1', '3']), ('0306406152', ['2', '3']), ('missing', [])])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[0][0], 'mdf_020a:"9780306406157" OR mdf_020a:"0306406152"')
+        self.assertEqual(metrics.counters, {})
+
+        queries.clear()
+        with patch.object(searcher.solr_index, 'search', side_effect=solr_page):
+            found = list(searcher.search_many(terms, '020', ['a'], method='terms'))
+        self.assertEqual(found, [('9780306406157', ['3']), ('0306406152', ['2', '3']), ('missing', [])])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0][0], '_query_:"{!terms f=mdf_020a separator=$separator v=$batch_terms}"')
+        self.assertRaises(ValueError, lambda: list(searcher.search_many(terms, '020', ['a'], method='fuzzy')))
+
+        index = {'111': ['(OCoLC)123456'], '222': ['(OCoLC)1234']}
+        queries.clear()
+        with patch.object(searcher.solr_index, 'search', side_effect=solr_page):
+            found = list(searcher.search_many(['123456', '1234', '12', '1234'], '020', ['a']))
+        self.assertEqual(found, [('123456', ['111']), ('1234', ['222']), ('12', [])])
+        self.assertEqual(len(queries), 1)
+
+        def unstored_page(q, fl, rows, sort, cursorMark, **params):
+            return Results({'response': {'numFound': 1, 'docs': [{'controlfield_001': ['333']}]},
+                            'nextCursorMark': cursorMark + '+'})
+        with patch.object(searcher.solr_index, 'search', side_effect=unstored_page):
+            self.assertEqual(list(searcher.search_many(['123456'], '020', ['a'])), [('123456', ['333'])])
+            self.assertEqual(list(searcher.search_many(['123456', '1234'], '020', ['a'])),
+                             [('123456', []), ('1234', []), (None, ['333'])])